@@ -0,0 +1,156 @@
+"""
+Read-only JSON list APIs with keyset pagination.
+
+Every resource is ordered newest first by (created_at, id) and paged with an
+opaque cursor holding the last row's (created_at, id). The next page is a
+range scan on the (created_at, id) index starting from that key, so page
+1000 costs the same as page one, unlike OFFSET.
+
+?fields=a,b,c selects columns (only those are fetched from the database),
+?limit=N sets the page size and ?cursor= comes from the previous page's
+"next". Responses carry an ETag and answer If-None-Match with 304.
+"""
+import base64
+import datetime as dt
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+
+from .models import Artist, Gig, Group, Setlist, Song, User, Venue
+
+DEFAULT_LIMIT = 25
+MAX_LIMIT = 100
+
+
+class Resource:
+    """
+    A list endpoint over a model. fields maps public names to columns;
+    default_fields is what is returned without ?fields=.
+    """
+
+    def __init__(self, model, fields, default_fields=None):
+        self.model = model
+        self.fields = fields
+        self.default_fields = default_fields or list(fields)
+
+    def queryset(self):
+        return self.model.objects.all()
+
+
+RESOURCES = {
+    'songs': Resource(Song, {
+        'id': 'id', 'title': 'title', 'artist': 'artist_id', 'release_date': 'release_date',
+        'musical_key': 'musical_key', 'time_signature': 'time_signature', 'bpm': 'bpm',
+        'duration': 'duration_seconds', 'created_at': 'created_at', 'updated_at': 'updated_at',
+    }),
+    'artists': Resource(Artist, {
+        'id': 'id', 'name': 'name', 'song_count': 'song_count', 'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }),
+    'groups': Resource(Group, {
+        'id': 'id', 'name': 'name', 'description': 'description', 'bio': 'bio', 'started_date': 'started_date',
+        'location': 'location_id', 'created_by': 'created_by_id', 'owned_by': 'owned_by_id',
+        'member_count': 'member_count', 'created_at': 'created_at', 'updated_at': 'updated_at',
+    }, default_fields=['id', 'name', 'description', 'started_date', 'location', 'member_count', 'created_at']),
+    'setlists': Resource(Setlist, {
+        'id': 'id', 'title': 'title', 'description': 'description', 'owner_group': 'owner_group_id',
+        'song_count': 'song_count', 'total_duration': 'total_duration', 'bpm_curve': 'bpm_curve',
+        'key_changes': 'key_changes', 'time_signature_counts': 'time_signature_counts',
+        'created_at': 'created_at', 'updated_at': 'updated_at',
+    }, default_fields=['id', 'title', 'owner_group', 'song_count', 'total_duration', 'created_at']),
+    'venues': Resource(Venue, {
+        'id': 'id', 'name': 'name', 'description': 'description', 'location': 'location_id', 'capacity': 'capacity',
+        'stage_width': 'stage_width', 'stage_depth': 'stage_depth', 'stage_notes': 'stage_notes',
+        'created_at': 'created_at', 'updated_at': 'updated_at',
+    }, default_fields=['id', 'name', 'location', 'capacity', 'created_at']),
+    'gigs': Resource(Gig, {
+        'id': 'id', 'venue': 'venue_id', 'date': 'date', 'start_time': 'start_time', 'end_time': 'end_time',
+        'group': 'group_id', 'setlist': 'setlist_id', 'created_at': 'created_at', 'updated_at': 'updated_at',
+    }, default_fields=['id', 'venue', 'date', 'start_time', 'group', 'setlist', 'created_at']),
+    'users': Resource(User, {
+        'id': 'id', 'display_name': 'display_name', 'first_name': 'first_name', 'last_name': 'last_name',
+        'description': 'description', 'bio': 'bio', 'location': 'location_id',
+        'created_at': 'created_at', 'updated_at': 'updated_at',
+    }, default_fields=['id', 'display_name', 'description', 'location', 'created_at']),
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    raw = json.dumps([created_at.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, pk = json.loads(raw)
+        return dt.datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError):
+        raise BadRequest("Invalid cursor.")
+
+
+def _json_value(value):
+    if isinstance(value, dt.timedelta):
+        return value.total_seconds()
+    return value
+
+
+def page(resource, fields=None, limit=DEFAULT_LIMIT, cursor=None):
+    """
+    Returns {'results': [...], 'next': cursor or None} for one page.
+
+    One query, whatever the page number.
+    """
+    fields = fields or resource.default_fields
+    unknown = [f for f in fields if f not in resource.fields]
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}.")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise BadRequest(f"limit must be between 1 and {MAX_LIMIT}.")
+
+    columns = {resource.fields[f] for f in fields} | {'created_at', 'id'}
+    qs = resource.queryset().order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    rows = list(qs.values(*columns)[:limit + 1])
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'results': [{f: _json_value(row[resource.fields[f]]) for f in fields} for row in rows],
+        'next': encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if more else None,
+    }
+
+
+def etag_response(request, data):
+    "Returns data as JSON with a strong ETag, or 304 if the client already has it."
+    content = json.dumps(data, cls=DjangoJSONEncoder).encode()
+    etag = '"%s"' % hashlib.md5(content).hexdigest()
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+def list_view(request, resource_name):
+    resource = RESOURCES[resource_name]
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return JsonResponse({'error': "limit must be an integer."}, status=400)
+    fields = [f for f in request.GET.get('fields', '').split(',') if f]
+    try:
+        data = page(resource, fields=fields, limit=limit, cursor=request.GET.get('cursor'))
+    except BadRequest as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return etag_response(request, data)
@@ -0,0 +1,73 @@
+"""
+ASGI-native versions of the busiest read endpoints.
+
+Database access goes through Django's async ORM API (aget, async
+iteration). Other blocking work (serializing large responses, sync-only
+helpers) runs on a bounded thread pool through run_blocking() so it never
+stalls the event loop and can't grow threads without limit. The pool size
+is BANDSHARE_BLOCKING_WORKERS.
+
+Under WSGI these views still work (Django runs them in an event loop per
+request), but they only pay off when served by config.asgi.
+"""
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse, JsonResponse
+
+from .models import Group, Setlist
+from .views import SONG_FIELDS, group_data, setlist_data, song_row, song_search_queryset
+
+DEFAULT_BLOCKING_WORKERS = 8
+
+_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'BANDSHARE_BLOCKING_WORKERS', DEFAULT_BLOCKING_WORKERS),
+                               thread_name_prefix='bandshare-blocking')
+
+
+def _call(fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        # Pool threads live outside the request cycle, so clean up their connections here.
+        close_old_connections()
+
+
+async def run_blocking(fn, *args, **kwargs):
+    "Runs fn on the bounded blocking pool and returns its result."
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(_call, fn, args, kwargs))
+
+
+async def json_response(data):
+    content = await run_blocking(json.dumps, data, cls=DjangoJSONEncoder)
+    return HttpResponse(content, content_type='application/json')
+
+
+async def song_search(request):
+    try:
+        qs = song_search_queryset(request.GET)
+    except ValueError:
+        return JsonResponse({'error': "bpm_min, bpm_max and limit must be integers"}, status=400)
+    return await json_response({'results': [song_row(row) async for row in qs]})
+
+
+async def group_detail(request, group_id):
+    try:
+        group = await Group.objects.with_details().aget(pk=group_id)
+    except Group.DoesNotExist:
+        raise Http404
+    return await json_response(group_data(group))
+
+
+async def setlist_detail(request, setlist_id):
+    try:
+        setlist = await Setlist.objects.aget(pk=setlist_id)
+    except Setlist.DoesNotExist:
+        raise Http404
+    songs = [song_row(row) async for row in setlist.ordered_songs().values(*SONG_FIELDS)]
+    return await json_response(setlist_data(setlist, songs))
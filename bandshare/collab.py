@@ -0,0 +1,163 @@
+"""
+Collaborative setlist editing.
+
+Band members edit a Setlist together over a WebSocket (bandshare.realtime),
+one song at a time:
+
+    {"op": "add", "song": 12, "position": 3}      position defaults to the end
+    {"op": "remove", "song": 12}
+    {"op": "move", "song": 12, "position": 0}
+
+apply() makes the change and numbers it: Setlist.revision goes up by one and
+the op is kept as a SetlistOp with that seq and the positions it actually
+took effect at. Every client sends the seq its copy was at (`base`) with an
+op; if others' ops were applied since, its position is shifted over them
+(an insert or removal before it moves it along), so concurrent edits land
+where their authors meant and every client converges on the server's order
+by applying the ops in seq order. Ops with nothing left to do (adding a song
+that's already there, removing or moving one that's gone) are dropped.
+
+A client that reconnects with the seq it last saw is sent only the ops
+since, as long as they are kept. compact() drops ops more than KEEP_OPS
+behind, every COMPACT_EVERY ops, and a client further behind than that gets
+a snapshot instead: the setlist row is always the snapshot at its revision.
+
+Only edits made through apply() are numbered and broadcast.
+"""
+from django.db import transaction
+
+from . import jobs
+from .models import Setlist, SetlistOp, Song
+from .views import SONG_FIELDS, song_row
+
+KEEP_OPS = 500
+COMPACT_EVERY = 100
+
+KINDS = ('add', 'remove', 'move')
+
+
+class Rejected(Exception):
+    """
+    An op that can't be applied. code is 'invalid' for a malformed op, or
+    'stale' if its base is older than the ops kept (the client needs a snapshot).
+    """
+    def __init__(self, message, code='invalid'):
+        super().__init__(message)
+        self.code = code
+
+
+def _validate(op):
+    if not isinstance(op, dict) or op.get('op') not in KINDS:
+        raise Rejected(f"op must be one of {', '.join(KINDS)}")
+    position = op.get('position')
+    if not isinstance(op.get('song'), int) or (position is not None and not isinstance(position, int)):
+        raise Rejected("song and position must be integers")
+    if op['op'] == 'move' and position is None:
+        raise Rejected("move needs a position")
+    if position is not None and position < 0:
+        raise Rejected("position must not be negative")
+    return op['op'], op['song'], position
+
+
+def transform(position, applied):
+    "Shifts a position in the setlist as it was over the ops applied to it since, in seq order."
+    for op in applied:
+        if op['op'] in ('remove', 'move') and op['from'] < position:
+            position -= 1
+        if op['op'] in ('add', 'move') and op['position'] <= position:
+            position += 1
+    return position
+
+
+def _ops_since(setlist, base):
+    "The ops applied after base, in order. Raises Rejected if some were compacted."
+    if base is None or base == setlist.revision:
+        return []
+    if base > setlist.revision:
+        raise Rejected(f"base {base} is ahead of the setlist ({setlist.revision})")
+    ops = list(SetlistOp.objects.filter(setlist=setlist, seq__gt=base).order_by('seq').values_list('op', flat=True))
+    if len(ops) != setlist.revision - base:
+        raise Rejected(f"ops since {base} are no longer kept", code='stale')
+    return ops
+
+
+def apply(setlist_id, op, base=None):
+    """
+    Applies a client's op, made to the setlist as of revision base (default:
+    the current one). Returns (seq, op as applied), or (revision, None) if it
+    had nothing to do. Raises Setlist.DoesNotExist and Rejected.
+    """
+    kind, song_id, position = _validate(op)
+    with transaction.atomic():
+        setlist = Setlist.objects.select_for_update().get(pk=setlist_id)
+        applied = _ops_since(setlist, base)
+        song_ids = setlist.song_ids
+        length = len(song_ids)
+        if position is not None and applied:
+            position = transform(position, applied)
+
+        if kind == 'add':
+            if song_id in song_ids:
+                return setlist.revision, None
+            song = Song.objects.filter(pk=song_id).first()
+            if song is None:
+                raise Rejected(f"no song {song_id}")
+            position = length if position is None else min(position, length)
+            setlist.add_song(song, position)
+            done = {'op': 'add', 'song': song_id, 'position': position}
+        elif song_id not in song_ids:
+            return setlist.revision, None
+        elif kind == 'remove':
+            setlist.remove_song(song_id)
+            done = {'op': 'remove', 'song': song_id, 'from': song_ids.index(song_id)}
+        else:
+            start, position = song_ids.index(song_id), min(position, length - 1)
+            if start == position:
+                return setlist.revision, None
+            setlist.move_song(song_id, position)
+            done = {'op': 'move', 'song': song_id, 'from': start, 'position': position}
+
+        seq = setlist.revision + 1
+        Setlist.objects.filter(pk=setlist_id).update(revision=seq)
+        SetlistOp.objects.create(setlist_id=setlist_id, seq=seq, op=done)
+    if seq % COMPACT_EVERY == 0:
+        jobs.enqueue('setlists.compact', {'setlist': setlist_id}, dedupe_key=f'setlists.compact:{setlist_id}')
+    return seq, done
+
+
+def compact(setlist_id):
+    "Drops the setlist's ops more than KEEP_OPS behind its revision. Returns how many."
+    revision = Setlist.objects.filter(pk=setlist_id).values_list('revision', flat=True).first()
+    if revision is None:
+        return 0
+    return SetlistOp.objects.filter(setlist_id=setlist_id, seq__lte=revision - KEEP_OPS).delete()[0]
+
+
+def messages(setlist_id, ops):
+    "Wire messages for [(seq, op)]; an add carries the song's row so clients needn't fetch it."
+    added = [op['song'] for _, op in ops if op['op'] == 'add']
+    rows = {row['id']: song_row(row) for row in Song.objects.filter(pk__in=added).values(*SONG_FIELDS)} \
+        if added else {}
+    return [{'type': 'op', 'setlist': setlist_id, 'seq': seq, **op,
+             **({'row': rows.get(op['song'])} if op['op'] == 'add' else {})}
+            for seq, op in ops]
+
+
+def snapshot(setlist):
+    "The whole setlist as a message, for a client starting from nothing."
+    songs = [song_row(row) for row in setlist.ordered_songs().values(*SONG_FIELDS)]
+    return {'type': 'snapshot', 'setlist': setlist.pk, 'seq': setlist.revision, 'songs': songs}
+
+
+def catch_up(setlist_id, since=None):
+    """
+    The messages a client that has seen up to seq `since` needs to be
+    current: the ops since, or a snapshot if it has none or they were
+    compacted. Raises Setlist.DoesNotExist.
+    """
+    setlist = Setlist.objects.get(pk=setlist_id)
+    if since is not None and since <= setlist.revision:
+        ops = list(SetlistOp.objects.filter(setlist=setlist, seq__gt=since).order_by('seq').values_list('seq', 'op'))
+        if len(ops) == setlist.revision - since:
+            return messages(setlist_id, ops)
+    return [snapshot(setlist)]
@@ -0,0 +1,85 @@
+"""
+Denormalized counts: Group.member_count, Artist.song_count and
+Genre.group_count / song_count, so pages and lists show them without a
+COUNT(*).
+
+The signal handlers in bandshare.signals change them with F() increments,
+which the database applies atomically however many requests do it at once.
+Code that writes rows with bulk_create() or raw SQL, which send no signals,
+calls increment() itself or leaves it to recount(), which repairs any drift
+in one UPDATE per counter (`manage.py recount`).
+"""
+from collections import Counter as Tally, defaultdict, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Artist, Genre, Group, GroupMembership, Song
+
+Counter = namedtuple('Counter', 'model field rows key')
+
+COUNTERS = [
+    Counter(Group, 'member_count', GroupMembership, 'group_id'),
+    Counter(Artist, 'song_count', Song, 'artist_id'),
+    Counter(Genre, 'group_count', Group.genres.through, 'genre_id'),
+    Counter(Genre, 'song_count', Song.genres.through, 'genre_id'),
+]
+
+
+_deferred = ContextVar('deferred_counts', default=None)
+
+
+@contextmanager
+def deferred():
+    """
+    Holds back the increments made inside the block and applies their sums
+    when it ends, e.g. one UPDATE for a member count that bulk relation
+    changes would otherwise update once per removed row.
+    """
+    if _deferred.get() is not None:
+        yield
+        return
+    pending = defaultdict(Tally)
+    token = _deferred.set(pending)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+    for (model, field), deltas in pending.items():
+        increment(model, field, deltas)
+
+
+def increment(model, field, deltas):
+    """
+    Adds deltas {pk: n} to model.field, with one UPDATE per distinct n. A
+    counter that had drifted low stops at 0 rather than failing the write.
+    """
+    pending = _deferred.get()
+    if pending is not None:
+        pending[model, field].update(deltas)
+        return
+    by_delta = defaultdict(list)
+    for pk, n in deltas.items():
+        if n:
+            by_delta[n].append(pk)
+    for n, pks in by_delta.items():
+        value = F(field) + n if n > 0 else Greatest(F(field) + n, Value(0))
+        model.objects.filter(pk__in=pks).update(**{field: value})
+
+
+def _actual(counter):
+    counted = counter.rows.objects.filter(**{counter.key: OuterRef('pk')}).order_by() \
+        .values(counter.key).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(counted), Value(0))
+
+
+def recount(counters=COUNTERS):
+    "Sets the counters to the real counts. Returns {'model.field': rows that were wrong}."
+    fixed = {}
+    for counter in counters:
+        actual = _actual(counter)
+        drifted = counter.model.objects.annotate(actual=actual).exclude(**{counter.field: F('actual')})
+        fixed[f'{counter.model._meta.model_name}.{counter.field}'] = drifted.update(**{counter.field: actual})
+    return fixed
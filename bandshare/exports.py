@@ -0,0 +1,243 @@
+"""
+Setlist exports: CSV, JSON, ChordPro and PDF.
+
+export() renders one or more setlists (a whole tour, say) in chunks while it
+reads their songs, one setlist at a time, so nothing holds the whole file in
+memory; the views send the chunks with a StreamingHttpResponse. As they are
+sent they are also written to a file under BANDSHARE_EXPORT_CACHE_DIR named
+after the setlists' versions: their updated_at and that of their group and
+their songs' artists. Later downloads of an unchanged export stream that
+file instead of rendering it again, and editing a setlist leaves the old
+file unused until the next export of it replaces it.
+"""
+import csv
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter, namedtuple
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Setlist, SetlistEntry
+from .models.song import format_length
+
+CHUNK_SIZE = 64 * 1024
+ROWS_PER_QUERY = 500
+
+Format = namedtuple('Format', 'content_type extension render')
+Export = namedtuple('Export', 'chunks etag filename content_type')
+Row = namedtuple('Row', 'position title artist key bpm time_signature length')
+
+stats = Counter()
+
+
+def _setlists(setlist_ids):
+    "The setlists in the order given. Raises Setlist.DoesNotExist if any is missing."
+    found = Setlist.objects.filter(pk__in=setlist_ids).select_related('owner_group') \
+        .annotate(artists_updated_at=Max('songs__artist__updated_at')) \
+        .only('id', 'title', 'updated_at', 'song_count', 'total_duration', 'owner_group__name',
+              'owner_group__updated_at').in_bulk()
+    missing = [pk for pk in setlist_ids if pk not in found]
+    if missing:
+        raise Setlist.DoesNotExist(f"No setlists {missing}.")
+    return [found[pk] for pk in setlist_ids]
+
+
+def rows(setlist):
+    "Yields the setlist's songs as Rows, reading them ROWS_PER_QUERY at a time."
+    entries = SetlistEntry.objects.filter(setlist=setlist).order_by('position', 'id').values_list(
+        'song__title', 'song__artist__name', 'song__musical_key', 'song__bpm', 'song__time_signature',
+        'song__duration_seconds')
+    for position, (title, artist, key, bpm, time_signature, duration) in enumerate(
+            entries.iterator(chunk_size=ROWS_PER_QUERY), 1):
+        yield Row(position, title, artist, key, bpm, time_signature, format_length(duration))
+
+
+def _header(setlist):
+    return {'id': setlist.pk, 'title': setlist.title, 'group': setlist.owner_group.name,
+            'song_count': setlist.song_count, 'length': format_length(setlist.total_duration)}
+
+
+def render_csv(setlists):
+    class Line:
+        def write(self, value):
+            return value
+
+    writer = csv.writer(Line())
+    yield writer.writerow(['setlist', *Row._fields]).encode()
+    for setlist in setlists:
+        for row in rows(setlist):
+            yield writer.writerow([setlist.title, *row]).encode()
+
+
+def render_json(setlists):
+    yield b'{"setlists": ['
+    for i, setlist in enumerate(setlists):
+        header = json.dumps(_header(setlist), ensure_ascii=False)
+        yield f'{"," if i else ""}{header[:-1]}, "songs": ['.encode()
+        for j, row in enumerate(rows(setlist)):
+            yield f'{"," if j else ""}{json.dumps(row._asdict(), ensure_ascii=False)}'.encode()
+        yield b']}'
+    yield b']}\n'
+
+
+def render_chordpro(setlists):
+    "One ChordPro song per setlist entry, with the metadata directives filled in."
+    first = True
+    for setlist in setlists:
+        header = _header(setlist)
+        for row in rows(setlist):
+            lines = [] if first else ['', '{new_song}']
+            first = False
+            lines += [f"{{title: {row.title}}}", f"{{artist: {row.artist}}}"]
+            lines += [f"{{{name}: {value}}}" for name, value in
+                      (('key', row.key), ('tempo', row.bpm), ('time', row.time_signature)) if value]
+            lines += [f"{{duration: {row.length}}}",
+                      f"{{comment: {header['title']} ({header['group']}), "
+                      f"song {row.position} of {header['song_count']}}}"]
+            yield ('\n'.join(lines) + '\n').encode()
+
+
+class PdfWriter:
+    """
+    Writes a minimal PDF (Helvetica text only) a page at a time. Objects 1-4
+    are the catalog, the page tree and the two fonts; the page tree is
+    written last, once all its pages are known.
+    """
+    PAGE_WIDTH, PAGE_HEIGHT, MARGIN = 612, 792, 54  # US Letter, in points.
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.pages = []
+
+    def _object(self, number, body):
+        self.offsets[number] = self.offset
+        data = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        self.offset += len(data)
+        return data
+
+    def start(self):
+        data = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self.offset = len(data)
+        return data + b''.join([
+            self._object(1, b'<< /Type /Catalog /Pages 2 0 R >>'),
+            self._object(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>'),
+            self._object(4, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold '
+                            b'/Encoding /WinAnsiEncoding >>'),
+        ])
+
+    @staticmethod
+    def text(x, y, value, size=11, bold=False):
+        "A content stream operation drawing value with its baseline starting at x, y."
+        value = value.replace('♭', 'b').replace('♯', '#').encode('cp1252', 'replace')
+        value = value.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+        return b'BT /F%d %d Tf %d %d Td (%s) Tj ET\n' % (4 if bold else 3, size, x, y, value)
+
+    def page(self, content):
+        number = max(self.offsets) + 1
+        self.pages.append(number + 1)
+        return self._object(number, b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content)) + \
+            self._object(number + 1, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+                                     b'/Resources << /Font << /F3 3 0 R /F4 4 0 R >> >> >>'
+                         % (self.PAGE_WIDTH, self.PAGE_HEIGHT, number))
+
+    def finish(self):
+        kids = b' '.join(b'%d 0 R' % number for number in self.pages)
+        data = self._object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.pages)))
+        xref = [b'xref\n0 %d\n0000000000 65535 f \n' % (len(self.offsets) + 1)]
+        xref += [b'%010d 00000 n \n' % self.offsets[number] for number in sorted(self.offsets)]
+        trailer = b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            len(self.offsets) + 1, self.offset)
+        return data + b''.join(xref) + trailer
+
+
+def render_pdf(setlists):
+    "A page (or more) per setlist, in large type for the stage."
+    pdf = PdfWriter()
+    yield pdf.start()
+    columns = [(54, 'position', '#'), (84, 'title', 'Song'), (360, 'key', 'Key'), (410, 'bpm', 'BPM'),
+               (460, 'time_signature', 'Time'), (510, 'length', 'Length')]
+    line_height, bottom = 22, pdf.MARGIN
+    for setlist in setlists:
+        header = _header(setlist)
+        content, y = [], None
+        for row in rows(setlist):
+            if y is None or y < bottom:
+                if content:
+                    yield pdf.page(b''.join(content))
+                y = pdf.PAGE_HEIGHT - pdf.MARGIN - 24
+                content = [pdf.text(pdf.MARGIN, y, header['title'], size=24, bold=True),
+                           pdf.text(pdf.MARGIN, y - 20, f"{header['group']} - {header['song_count']} songs, "
+                                                        f"{header['length']}", size=12)]
+                y -= 52
+                content += [pdf.text(x, y, label, size=10, bold=True) for x, field, label in columns]
+                y -= line_height
+            content += [pdf.text(x, y, str(getattr(row, field) or '')[:40], size=14) for x, field, label in columns]
+            y -= line_height
+        if y is None:
+            content = [pdf.text(pdf.MARGIN, pdf.PAGE_HEIGHT - pdf.MARGIN - 24, header['title'], size=24, bold=True)]
+        yield pdf.page(b''.join(content))
+    yield pdf.finish()
+
+
+FORMATS = {
+    'csv': Format('text/csv; charset=utf-8', 'csv', render_csv),
+    'json': Format('application/json', 'json', render_json),
+    'chordpro': Format('text/plain; charset=utf-8', 'cho', render_chordpro),
+    'pdf': Format('application/pdf', 'pdf', render_pdf),
+}
+
+
+def cache_dir():
+    return Path(getattr(settings, 'BANDSHARE_EXPORT_CACHE_DIR', None)
+                or Path(tempfile.gettempdir()) / 'bandshare-exports')
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+def _write_through(chunks, path):
+    "Yields chunks while writing them to path, which only appears once they are all written."
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        os.replace(tmp, path)
+        # Earlier versions of the same export.
+        for stale in path.parent.glob(f"{path.name.split('-')[0]}-*"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def export(format, setlist_ids):
+    """
+    Returns an Export of the setlists (ids, in order) in format, one of
+    FORMATS. Raises Setlist.DoesNotExist.
+    """
+    setlists = _setlists(list(setlist_ids))
+    fmt = FORMATS[format]
+    ids = hashlib.sha1(f'{format}:{[s.pk for s in setlists]}'.encode()).hexdigest()[:16]
+    version = hashlib.sha1(repr([(s.pk, s.updated_at, s.owner_group.updated_at, s.artists_updated_at)
+                                 for s in setlists]).encode()).hexdigest()[:16]
+    path = cache_dir() / f'{ids}-{version}.{fmt.extension}'
+    if path.exists():
+        stats['hits'] += 1
+        chunks = _read(path)
+    else:
+        stats['misses'] += 1
+        chunks = _write_through(fmt.render(setlists), path)
+    name = setlists[0].title if len(setlists) == 1 else f'{len(setlists)} setlists'
+    return Export(chunks, f'"{ids}-{version}"', f'{name}.{fmt.extension}', fmt.content_type)
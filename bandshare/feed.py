@@ -0,0 +1,108 @@
+"""
+Activity feeds: what a user's groups and the musicians they follow did.
+
+record() stores an Activity and fans it out on write, bulk inserting a
+TimelineEntry for each member of its group and each follower of its user.
+A group or musician whose audience is bigger than the fan-out limit
+(settings.BANDSHARE_FEED_FANOUT_LIMIT) becomes a PullSource instead: its
+activities are written once and merged into feeds as they are read.
+
+Reading a page is two queries however many pull sources the reader belongs
+to or follows: one index range scan of their timeline and one for the pull
+sources' activities, each limited to the page size and merged by id.
+"""
+import heapq
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from . import jobs
+from .models import Activity, Follow, GroupMembership, PullSource, TimelineEntry
+
+DEFAULT_FANOUT_LIMIT = 1000
+BATCH_SIZE = 2000
+
+
+def fanout_limit():
+    return getattr(settings, 'BANDSHARE_FEED_FANOUT_LIMIT', DEFAULT_FANOUT_LIMIT)
+
+
+def _pk(obj):
+    return getattr(obj, 'pk', obj)
+
+
+def _audience(field, source_id, user_ids):
+    "Returns the user ids to push a source's activity to, or () if it is pulled instead."
+    if PullSource.objects.filter(**{field: source_id}).exists():
+        return ()
+    limit = fanout_limit()
+    user_ids = list(user_ids[:limit + 1])
+    if len(user_ids) > limit:
+        PullSource.objects.get_or_create(**{field: source_id})
+        return ()
+    return user_ids
+
+
+def fan_out(activity):
+    "Pushes activity to the timelines of its audience. Returns how many entries were written."
+    audience = set()
+    if activity.group_id:
+        audience.update(_audience('group_id', activity.group_id, GroupMembership.objects.filter(
+            group_id=activity.group_id).values_list('member_id', flat=True)))
+    if activity.user_id:
+        audience.update(_audience('user_id', activity.user_id, Follow.objects.filter(
+            user_id=activity.user_id).values_list('follower_id', flat=True)))
+    TimelineEntry.objects.bulk_create([TimelineEntry(user_id=user_id, activity=activity) for user_id in audience],
+                                      batch_size=BATCH_SIZE)
+    return len(audience)
+
+
+def record(verb, group=None, user=None, setlist=None, song=None, **data):
+    "Creates an Activity and fans it out. Returns the Activity."
+    with transaction.atomic():
+        activity = Activity.objects.create(verb=verb, group_id=_pk(group), user_id=_pk(user),
+                                           setlist_id=_pk(setlist), song_id=_pk(song), data=data)
+        fan_out(activity)
+    return activity
+
+
+def record_on_commit(verb, **kwargs):
+    """
+    Records an activity in the background once the current transaction
+    commits, so rolled back changes never show up. kwargs are primary keys.
+    """
+    transaction.on_commit(lambda: jobs.enqueue('feed.record', {'verb': verb, **kwargs}))
+
+
+def feed_ids(user, limit=20, before=None):
+    "Returns the ids of the newest `limit` activities in user's feed, older than activity id `before`."
+    user_id = _pk(user)
+    timeline = TimelineEntry.objects.filter(user_id=user_id)
+    if before:
+        timeline = timeline.filter(activity_id__lt=before)
+    pushed = timeline.order_by('-activity_id').values_list('activity_id', flat=True)[:limit]
+
+    groups = GroupMembership.objects.filter(member_id=user_id).values('group_id')
+    followed = Follow.objects.filter(follower_id=user_id).values('user_id')
+    pulled = Activity.objects.filter(
+        Q(group__in=PullSource.objects.filter(group__in=groups).values('group_id')) |
+        Q(user__in=PullSource.objects.filter(user__in=followed).values('user_id')))
+    if before:
+        pulled = pulled.filter(id__lt=before)
+    pulled = pulled.order_by('-id').values_list('id', flat=True)[:limit]
+
+    ids = []
+    for activity_id in heapq.merge(list(pushed), list(pulled), reverse=True):
+        if not ids or ids[-1] != activity_id:
+            ids.append(activity_id)
+            if len(ids) == limit:
+                break
+    return ids
+
+
+def feed(user, limit=20, before=None):
+    "Returns the newest `limit` Activities in user's feed, older than activity id `before`."
+    ids = feed_ids(user, limit, before)
+    return list(Activity.objects.filter(id__in=ids).select_related('group', 'user', 'setlist', 'song')
+                .order_by('-id'))
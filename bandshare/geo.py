@@ -0,0 +1,127 @@
+"""
+Geohash and distance helpers.
+
+Locations store a geohash so that every point in a cell shares the cell's
+prefix. A radius query becomes a handful of prefix range scans over an
+indexed column (see covering_cells) followed by an exact haversine check on
+the few rows that come back.
+
+This module has no Django dependencies.
+"""
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+MAX_PRECISION = 12
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    "Great-circle distance in kilometres."
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def encode(lat, lon, precision=MAX_PRECISION):
+    "Returns the geohash of a point."
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = ch = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        ch <<= 1
+        if value >= mid:
+            ch |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits = ch = 0
+    return ''.join(chars)
+
+
+def decode(geohash):
+    "Returns (lat, lon, lat_error, lon_error) for the centre of a geohash cell."
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for c in geohash:
+        value = _DECODE[c]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return ((lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2,
+            (lat_range[1] - lat_range[0]) / 2, (lon_range[1] - lon_range[0]) / 2)
+
+
+def cell_size_degrees(precision):
+    "Returns (lat_degrees, lon_degrees) of a cell at the given precision."
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def neighbors(geohash):
+    "Returns the (up to) eight cells surrounding a geohash cell."
+    lat, lon, lat_err, lon_err = decode(geohash)
+    cells = set()
+    for dlat in (-1, 0, 1):
+        for dlon in (-1, 0, 1):
+            if dlat == dlon == 0:
+                continue
+            nlat = lat + dlat * 2 * lat_err
+            if not -90 < nlat < 90:
+                continue
+            nlon = (lon + dlon * 2 * lon_err + 180) % 360 - 180
+            cells.add(encode(nlat, nlon, len(geohash)))
+    return cells
+
+
+def precision_for_radius(lat, radius_km):
+    "Returns the longest precision whose cells are at least radius_km across."
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    for precision in range(MAX_PRECISION, 0, -1):
+        lat_deg, lon_deg = cell_size_degrees(precision)
+        if min(lat_deg * KM_PER_DEGREE, lon_deg * KM_PER_DEGREE * cos_lat) >= radius_km:
+            return precision
+    return 0
+
+
+def covering_cells(lat, lon, radius_km):
+    """
+    Returns geohash prefixes whose cells together cover the circle.
+
+    The centre cell is at least radius_km across, so the circle can only spill
+    into its immediate neighbours. An empty prefix means "everything".
+    """
+    precision = precision_for_radius(lat, radius_km)
+    if precision == 0:
+        return {''}
+    center = encode(lat, lon, precision)
+    return {center} | neighbors(center)
+
+
+def prefix_range(prefix):
+    "Returns (low, high) so that low <= geohash < high matches the prefix."
+    return prefix, prefix + '~'
+
+
+def bounding_box(lat, lon, radius_km):
+    "Returns (min_lat, max_lat, min_lon, max_lon) around a circle."
+    dlat = radius_km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(lat))
+    dlon = 180.0 if cos_lat < 1e-6 else min(180.0, dlat / cos_lat)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
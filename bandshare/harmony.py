@@ -0,0 +1,76 @@
+"""
+Key and tempo compatibility between Songs.
+
+Keys are placed on the circle of fifths, with each minor key sharing the
+position of its relative major. KEY_DISTANCE is precomputed for every pair
+of MusicalKey values:
+
+    0 - same key
+    1 - relative major/minor, or a neighbour on the circle in the same mode
+    2+ - further apart (circle steps, plus 1 for a change of mode)
+
+Keys within distance 1 of each other are considered to flow well.
+"""
+from .models import Song, MusicalKey
+
+_PITCH_CLASSES = {'C': 0, 'C♯': 1, 'D♭': 1, 'D': 2, 'D♯': 3, 'E♭': 3, 'E': 4, 'F': 5, 'F♯': 6,
+                  'G': 7, 'G♯': 8, 'A♭': 8, 'A': 9, 'B♭': 10, 'B': 11}
+
+COMPATIBLE_DISTANCE = 1
+
+
+def _circle_position(key):
+    "Returns (position on the circle of fifths, is_minor) for a MusicalKey value."
+    minor = key.endswith('m')
+    pitch = _PITCH_CLASSES[key[:-1] if minor else key]
+    relative_major = (pitch + 3) % 12 if minor else pitch
+    return relative_major * 7 % 12, minor
+
+
+def _distance(a, b):
+    (pos_a, minor_a), (pos_b, minor_b) = _circle_position(a), _circle_position(b)
+    steps = abs(pos_a - pos_b)
+    return min(steps, 12 - steps) + (minor_a != minor_b)
+
+
+_KEYS = [k for k in MusicalKey.values if k]
+
+KEY_DISTANCE = {a: {b: _distance(a, b) for b in _KEYS} for a in _KEYS}
+
+COMPATIBLE_KEYS = {
+    a: sorted((b for b in _KEYS if KEY_DISTANCE[a][b] <= COMPATIBLE_DISTANCE), key=lambda b: KEY_DISTANCE[a][b])
+    for a in _KEYS
+}
+
+
+def key_distance(a, b):
+    "Returns the distance between two keys, or None if either is not specified."
+    if not a or not b:
+        return None
+    return KEY_DISTANCE[a][b]
+
+
+def compatible_songs(song, bpm_window=8, limit=20, exclude=()):
+    """
+    Returns up to limit (Song, key_distance, bpm_difference) tuples that flow
+    well after song: a compatible key, the same time signature and a BPM
+    within bpm_window, ranked by key distance and then BPM difference.
+
+    Each compatible key is two bounded range scans on the
+    (musical_key, time_signature, bpm) index, walking outwards from the
+    song's BPM, so the cost does not grow with the catalog. Songs without a
+    key only match other songs without a key.
+    """
+    keys = COMPATIBLE_KEYS.get(song.musical_key, [''])
+    base = Song.objects.filter(time_signature=song.time_signature).exclude(pk__in={song.pk, *exclude})
+
+    candidates = []
+    for key in keys:
+        rows = base.filter(musical_key=key)
+        up = rows.filter(bpm__gte=song.bpm, bpm__lte=song.bpm + bpm_window).order_by('bpm', 'id')[:limit]
+        down = rows.filter(bpm__lt=song.bpm, bpm__gte=song.bpm - bpm_window).order_by('-bpm', 'id')[:limit]
+        distance = key_distance(song.musical_key, key) or 0
+        candidates.extend((distance, abs(s.bpm - song.bpm), s.pk, s) for s in [*up, *down])
+
+    candidates.sort(key=lambda c: c[:3])
+    return [(s, distance, bpm_difference) for distance, bpm_difference, _, s in candidates[:limit]]
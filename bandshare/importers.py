@@ -0,0 +1,245 @@
+"""
+Streaming Song catalog import.
+
+Rows flow through a chain of generators (read -> parse/validate -> batch) so
+only one batch is held in memory at a time. Artists and Genres are resolved
+through a bounded name -> id cache that is filled a batch at a time, and Songs and
+their genre links are written with one bulk_create each per batch.
+"""
+import csv
+import datetime as dt
+import json
+import time
+from collections import Counter, OrderedDict, namedtuple
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import counters
+from .models import Artist, Genre, Song, MusicalKey, TimeSignature
+from .search import fulltext
+
+GENRE_SEPARATOR = ';'
+
+
+# Yielded by read_rows() for a line that isn't JSON, so parse_row() skips it like any invalid row.
+InvalidRow = namedtuple('InvalidRow', 'error')
+
+
+def read_rows(f, format):
+    """
+    Yields (row number, dict) per CSV row or JSON line from an open text file.
+
+    Rows are numbered as they appear in the file, blank lines included: the
+    line number for JSONL and the row after the header for CSV.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num - 1, row
+    elif format == 'jsonl':
+        for number, line in enumerate(f, start=1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    yield number, InvalidRow(f"Invalid JSON: {e}")
+    else:
+        raise ValueError(f"Unknown format {format!r}; expected 'csv' or 'jsonl'.")
+
+
+def parse_duration(value):
+    "Accepts seconds or 'm:ss' and returns a timedelta."
+    if isinstance(value, (int, float)):
+        return dt.timedelta(seconds=value)
+    if not isinstance(value, str):
+        raise TypeError(f"duration must be seconds or 'm:ss', not {value!r}")
+    if ':' in value:
+        minutes, seconds = value.split(':')
+        return dt.timedelta(minutes=int(minutes), seconds=float(seconds))
+    return dt.timedelta(seconds=float(value))
+
+
+def parse_genres(value):
+    if isinstance(value, list):
+        names = value
+    elif value is None or isinstance(value, str):
+        names = (value or '').split(GENRE_SEPARATOR)
+    else:
+        names = [value]
+    if not all(isinstance(n, str) for n in names):
+        raise ValidationError({'genres': "Genre names must be strings."})
+    names = list(dict.fromkeys(n.strip() for n in names if n.strip()))
+    if any(len(n) > _GENRE_NAME_LENGTH for n in names):
+        raise ValidationError({'genres': f"Genre names must be at most {_GENRE_NAME_LENGTH} characters."})
+    return names
+
+
+def _text(row, name):
+    value = row.get(name)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise ValidationError({name: "Must be a string."})
+    return value.strip()
+
+
+_FIELDS = {f: Song._meta.get_field(f) for f in ('title', 'bpm', 'duration_seconds')}
+_ARTIST_NAME_LENGTH = Artist._meta.get_field('name').max_length
+_GENRE_NAME_LENGTH = Genre._meta.get_field('name').max_length
+_KEYS = set(MusicalKey.values)
+_TIME_SIGNATURES = set(TimeSignature.values)
+
+
+def parse_row(row):
+    """
+    Turns an input row into (song_fields, artist_name, genre_names).
+
+    Raises ValidationError using the Song field validators; no queries are made.
+    """
+    if isinstance(row, InvalidRow):
+        raise ValidationError(row.error)
+    if not isinstance(row, dict):
+        raise ValidationError("Each row must be a JSON object.")
+    title = _text(row, 'title')
+    artist = _text(row, 'artist')
+    if not title:
+        raise ValidationError({'title': "This field cannot be blank."})
+    if not artist:
+        raise ValidationError({'artist': "This field cannot be blank."})
+    if len(artist) > _ARTIST_NAME_LENGTH:
+        raise ValidationError({'artist': f"Must be at most {_ARTIST_NAME_LENGTH} characters."})
+
+    fields = {'title': title}
+    try:
+        if row.get('bpm') not in (None, ''):
+            fields['bpm'] = int(row['bpm'])
+        if row.get('duration') not in (None, ''):
+            fields['duration_seconds'] = parse_duration(row['duration'])
+        if row.get('release_date'):
+            fields['release_date'] = dt.date.fromisoformat(row['release_date'])
+    except (TypeError, ValueError) as e:
+        raise ValidationError(str(e))
+
+    key = row.get('musical_key') or ''
+    if not isinstance(key, str) or key not in _KEYS:
+        raise ValidationError({'musical_key': f"{key!r} is not a valid key."})
+    fields['musical_key'] = key
+    time_signature = row.get('time_signature') or ''
+    if not isinstance(time_signature, str) or time_signature not in _TIME_SIGNATURES:
+        raise ValidationError({'time_signature': f"{time_signature!r} is not a valid time signature."})
+    fields['time_signature'] = time_signature
+
+    for name, field in _FIELDS.items():
+        if name in fields:
+            try:
+                field.run_validators(fields[name])
+            except ValidationError as e:
+                raise ValidationError({name: e.messages})
+
+    return fields, artist, parse_genres(row.get('genres'))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class NameCache:
+    """
+    name -> id lookups for a model with a unique name, creating missing rows in bulk.
+
+    Holds the max_size most recently used names, but never fewer than the last
+    resolve() asked for, so a batch's names are always in ids.
+    """
+
+    def __init__(self, model, max_size=10_000):
+        self.model = model
+        self.max_size = max_size
+        self.ids = OrderedDict()
+
+    def resolve(self, names):
+        "Looks up names, creating the missing ones. Returns the ids of the rows it created."
+        names = set(names)
+        for name in names & self.ids.keys():
+            self.ids.move_to_end(name)
+        missing = names - self.ids.keys()
+        created = {}
+        if missing:
+            self.ids.update(self.model.objects.filter(name__in=missing).values_list('name', 'id'))
+            missing -= self.ids.keys()
+        if missing:
+            self.model.objects.bulk_create([self.model(name=n) for n in missing], ignore_conflicts=True)
+            created = dict(self.model.objects.filter(name__in=missing).values_list('name', 'id'))
+            self.ids.update(created)
+        while len(self.ids) > max(self.max_size, len(names)):
+            self.ids.popitem(last=False)
+        return list(created.values())
+
+
+class ImportStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.read = 0
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        return self.read / elapsed if elapsed else 0.0
+
+
+class SongImporter:
+    "Imports the (row number, row) pairs from read_rows() in batches of batch_size."
+
+    def __init__(self, batch_size=1000, max_errors=100):
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.artists = NameCache(Artist)
+        self.genres = NameCache(Genre)
+        self.stats = ImportStats()
+
+    def _valid(self, rows):
+        for line, row in rows:
+            self.stats.read += 1
+            try:
+                yield parse_row(row)
+            except ValidationError as e:
+                self.stats.skipped += 1
+                if len(self.stats.errors) < self.max_errors:
+                    messages = ([f"{field}: {m}" for field, ms in e.message_dict.items() for m in ms]
+                                if hasattr(e, 'error_dict') else e.messages)
+                    self.stats.errors.append((line, messages))
+
+    def _write(self, batch):
+        # bulk_create() sends no signals, so new rows are indexed and counted here.
+        new_artists = self.artists.resolve({artist for _, artist, _ in batch})
+        if new_artists:
+            fulltext.add('artist', pk__in=new_artists)
+        self.genres.resolve({genre for _, _, genres in batch for genre in genres})
+        with transaction.atomic():
+            songs = Song.objects.bulk_create([
+                Song(artist_id=self.artists.ids[artist], **fields) for fields, artist, _ in batch
+            ])
+            SongGenre = Song.genres.through
+            SongGenre.objects.bulk_create([
+                SongGenre(song_id=song.pk, genre_id=self.genres.ids[genre])
+                for song, (_, _, genres) in zip(songs, batch) for genre in genres
+            ])
+            fulltext.add('song', pk__in=[song.pk for song in songs])
+            counters.increment(Artist, 'song_count', Counter(song.artist_id for song in songs))
+            counters.increment(Genre, 'song_count', Counter(self.genres.ids[genre] for _, _, genres in batch
+                                                            for genre in genres))
+        self.stats.imported += len(songs)
+
+    def run(self, rows, progress=None):
+        "Imports every row; progress(stats) is called after each batch. Returns ImportStats."
+        for batch in batched(self._valid(rows), self.batch_size):
+            self._write(batch)
+            if progress:
+                progress(self.stats)
+        return self.stats
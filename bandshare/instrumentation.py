@@ -0,0 +1,208 @@
+"""
+Per-view SQL query and latency statistics.
+
+QueryStatsMiddleware samples requests (BANDSHARE_QUERY_STATS_SAMPLE_RATE,
+0.0 to 1.0, default 0) and records, per view:
+
+    queries    - number of SQL statements
+    db_ms      - time spent in the database
+    total_ms   - total request latency
+    duplicates - statements that ran more than once with only their
+                 parameters differing (the signature of an N+1 loop)
+
+Each process keeps a rolling window of samples per view and periodically
+publishes it to the default cache, where view_stats() merges the windows of
+every process into percentiles. This feeds the query_stats command and the
+stats/queries/ endpoint; use a shared cache backend to see numbers from
+server processes in the command. When sampling is off the middleware costs
+one random() call per request. The middleware is async-capable, so async
+views under ASGI aren't forced through a sync thread.
+"""
+import os
+import random
+import re
+import socket
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+DEFAULT_WINDOW = 1000
+DEFAULT_FLUSH_SECONDS = 10
+CACHE_PREFIX = 'bandshare:query_stats'
+CACHE_TIMEOUT = 60 * 60
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))+\s*\)")
+
+
+def normalize_sql(sql):
+    "Replaces literals and IN lists so that statements differing only in parameters compare equal."
+    return _IN_LISTS.sub('(...)', _LITERALS.sub('?', sql))
+
+
+def percentile(values, pct):
+    "Nearest-rank percentile of a sorted list."
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, round(pct / 100 * len(values) + 0.5) - 1))
+    return values[rank]
+
+
+def summarize(samples_by_view):
+    "Turns {view: [(queries, db_ms, total_ms, duplicates), ...]} into percentiles per view."
+    result = {}
+    for view, samples in samples_by_view.items():
+        if not samples:
+            continue
+        duplicates = Counter()
+        for *_, dupes in samples:
+            for sql, n in dupes.items():
+                duplicates[sql] = max(duplicates[sql], n)
+        stats = {'requests': len(samples)}
+        for i, name in enumerate(('queries', 'db_ms', 'total_ms')):
+            values = sorted(sample[i] for sample in samples)
+            stats[name] = {'p50': percentile(values, 50), 'p95': percentile(values, 95),
+                           'p99': percentile(values, 99), 'max': values[-1]}
+        stats['duplicate_queries'] = [{'sql': sql, 'max_per_request': n} for sql, n in duplicates.most_common(5)]
+        result[view] = stats
+    return result
+
+
+class QueryRecorder:
+    "A database execute wrapper that counts and times statements."
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.signatures[normalize_sql(sql)] += 1
+
+    @property
+    def duplicates(self):
+        "Returns {normalized_sql: times} for statements that ran more than once."
+        return {sql: n for sql, n in self.signatures.items() if n > 1}
+
+
+class StatsStore:
+    "Thread-safe rolling windows of samples for this process, keyed by view name."
+
+    def __init__(self, window=DEFAULT_WINDOW, flush_seconds=DEFAULT_FLUSH_SECONDS):
+        self.window = window
+        self.flush_seconds = flush_seconds
+        self.key = f'{CACHE_PREFIX}:{socket.gethostname()}:{os.getpid()}'
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def record(self, view, queries, db_ms, total_ms, duplicates):
+        with self._lock:
+            samples = self._samples.get(view)
+            if samples is None:
+                samples = self._samples[view] = deque(maxlen=self.window)
+            samples.append((queries, db_ms, total_ms, duplicates))
+        if time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {view: list(samples) for view, samples in self._samples.items()}
+
+    def flush(self):
+        "Publishes this process's samples to the cache."
+        self._last_flush = time.monotonic()
+        cache.set(self.key, self.snapshot(), CACHE_TIMEOUT)
+        keys = cache.get(CACHE_PREFIX, set())
+        if self.key not in keys:
+            cache.set(CACHE_PREFIX, keys | {self.key}, CACHE_TIMEOUT)
+
+    def clear(self):
+        "Drops the samples of this process and every published process."
+        with self._lock:
+            self._samples.clear()
+        cache.delete_many([*cache.get(CACHE_PREFIX, set()), CACHE_PREFIX])
+
+
+stats = StatsStore(getattr(settings, 'BANDSHARE_QUERY_STATS_WINDOW', DEFAULT_WINDOW),
+                   getattr(settings, 'BANDSHARE_QUERY_STATS_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS))
+
+
+def view_stats():
+    "Returns percentiles per view across every process that has published samples."
+    stats.flush()
+    merged = {}
+    for snapshot in cache.get_many(cache.get(CACHE_PREFIX, set())).values():
+        for view, samples in snapshot.items():
+            merged.setdefault(view, []).extend(samples)
+    return summarize(merged)
+
+
+class QueryStatsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'BANDSHARE_QUERY_STATS_SAMPLE_RATE', 0.0)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        return self.sample_rate and random.random() < self.sample_rate
+
+    @staticmethod
+    def _install(stack, recorder):
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+
+    @staticmethod
+    def _record(request, recorder, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else request.path
+        stats.record(view, recorder.count, recorder.seconds * 1000, total_ms, recorder.duplicates)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            self._install(stack, recorder)
+            response = self.get_response(request)
+        self._record(request, recorder, start)
+        return response
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        # Connections are per thread; the async ORM runs queries on the
+        # request's thread-sensitive executor, so hook the wrapper in there.
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(self._install)(stack, recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        await sync_to_async(self._record)(request, recorder, start)
+        return response
@@ -0,0 +1,272 @@
+"""
+A database-backed background job queue.
+
+Work is registered by name with @task (see bandshare.tasks) and queued with
+enqueue(). Jobs are rows in the Job table, so they commit or roll back with
+the transaction that queued them and need nothing but the database; SQLite
+is enough to run everything locally. `manage.py run_workers` runs them in a
+pool of worker processes.
+
+    priorities    jobs with a higher priority are claimed first
+    retries       a failing job is retried up to max_attempts times, waiting
+                  BACKOFF_SECONDS * 2 ** (attempt - 1), with jitter, between tries
+    dedupe keys   enqueue() returns the already queued job with the same key
+                  instead of adding another, e.g. one reindex per object
+    timeouts      a job running longer than its task's timeout is stopped
+                  (SIGALRM, where available) and counts as a failed attempt
+    leases        a claimed job is leased to its worker for the timeout plus
+                  LEASE_GRACE_SECONDS; jobs of workers that died are queued again
+    metrics       each job records how long it waited and ran; metrics()
+                  summarizes them per task
+
+With settings.BANDSHARE_JOBS_EAGER, enqueue() runs the task right away
+instead, as the development and test settings do.
+"""
+import os
+import random
+import signal
+import socket
+import statistics
+import threading
+import time
+import traceback
+from collections import namedtuple
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from .models import Job
+
+HIGH, NORMAL, LOW = 10, 0, -10
+BACKOFF_SECONDS = 5
+MAX_BACKOFF_SECONDS = 60 * 60
+LEASE_GRACE_SECONDS = 60
+
+Task = namedtuple('Task', 'name fn priority max_attempts timeout atomic')
+TASKS = {}
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def task(name, priority=NORMAL, max_attempts=3, timeout=300, atomic=True):
+    """
+    Registers fn as the task `name`. Its keyword arguments must be JSON
+    serializable. Each attempt runs in a transaction unless atomic is False,
+    for long tasks that commit in batches themselves.
+    """
+    def decorator(fn):
+        TASKS[name] = Task(name, fn, priority, max_attempts, timeout, atomic)
+        return fn
+    return decorator
+
+
+def eager():
+    return getattr(settings, 'BANDSHARE_JOBS_EAGER', False)
+
+
+def enqueue(name, kwargs=None, priority=None, dedupe_key=None, delay=0):
+    """
+    Queues the task `name` with kwargs, to run no sooner than delay seconds from
+    now. Returns the Job, or the queued Job that already has dedupe_key. Runs
+    the task immediately and returns None when jobs are eager.
+    """
+    task = TASKS[name]
+    kwargs = kwargs or {}
+    if eager():
+        task.fn(**kwargs)
+        return None
+
+    job = Job(name=name, kwargs=kwargs, priority=task.priority if priority is None else priority,
+              dedupe_key=dedupe_key, max_attempts=task.max_attempts,
+              run_after=now() + timedelta(seconds=delay))
+    if dedupe_key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+        return job
+    except IntegrityError:
+        queued = Job.objects.filter(dedupe_key=dedupe_key, status=Job.Status.QUEUED).first()
+        if queued is None:
+            # It was claimed in the meantime; this one is for changes made since.
+            return enqueue(name, kwargs, priority, dedupe_key, delay)
+        if job.priority > queued.priority:
+            Job.objects.filter(pk=queued.pk).update(priority=job.priority)
+        return queued
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(worker, batch=10):
+    """
+    Claims the next due job for worker, or returns None. Each candidate is
+    taken with a conditional UPDATE, so workers never share a job and no
+    row locks are needed.
+    """
+    while True:
+        started = now()
+        candidates = list(Job.objects.filter(status=Job.Status.QUEUED, run_after__lte=started)
+                          .order_by('-priority', 'run_after', 'id').values_list('id', 'name')[:batch])
+        if not candidates:
+            return None
+        for pk, name in candidates:
+            timeout = TASKS[name].timeout if name in TASKS else 0
+            if Job.objects.filter(pk=pk, status=Job.Status.QUEUED).update(
+                    status=Job.Status.RUNNING, locked_by=worker, started_at=started,
+                    locked_until=started + timedelta(seconds=timeout + LEASE_GRACE_SECONDS)):
+                return Job.objects.get(pk=pk)
+
+
+def backoff(attempts):
+    "Seconds to wait before the next try after `attempts` failed ones."
+    return min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** (attempts - 1)) * random.uniform(0.75, 1.25)
+
+
+def _alarm(signum, frame):
+    raise JobTimeout()
+
+
+def _call_with_timeout(fn, kwargs, timeout):
+    if not timeout or not hasattr(signal, 'SIGALRM') or threading.current_thread() is not threading.main_thread():
+        return fn(**kwargs)
+    previous = signal.signal(signal.SIGALRM, _alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(**kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _finish(job, error=None):
+    finished = now()
+    job.attempts += 1
+    job.finished_at = finished
+    job.duration_ms = (finished - job.started_at).total_seconds() * 1000
+    job.wait_ms = max(0.0, (job.started_at - max(job.created_at, job.run_after)).total_seconds() * 1000)
+    job.locked_until = None
+    job.last_error = error or ''
+    if error is None:
+        job.status = Job.Status.DONE
+    elif job.attempts < job.max_attempts:
+        job.status = Job.Status.QUEUED
+        job.run_after = finished + timedelta(seconds=backoff(job.attempts))
+    else:
+        job.status = Job.Status.FAILED
+    fields = ['status', 'attempts', 'finished_at', 'duration_ms', 'wait_ms', 'locked_until', 'last_error',
+              'run_after']
+    try:
+        with transaction.atomic():
+            job.save(update_fields=fields)
+    except IntegrityError:
+        # A job with the same dedupe key was queued while this one ran; it will do the work.
+        job.status = Job.Status.FAILED
+        job.last_error += "\nNot retried: a newer job with the same dedupe key is queued."
+        job.save(update_fields=fields)
+
+
+def run(job):
+    "Runs a claimed job and records the outcome. Returns True if it succeeded."
+    task = TASKS.get(job.name)
+    if task is None:
+        job.max_attempts = job.attempts + 1
+        _finish(job, f"Unknown task {job.name!r}.")
+        return False
+    try:
+        with transaction.atomic() if task.atomic else nullcontext():
+            _call_with_timeout(task.fn, job.kwargs, task.timeout)
+    except JobTimeout:
+        _finish(job, f"Timed out after {task.timeout}s.")
+        return False
+    except Exception:
+        _finish(job, traceback.format_exc())
+        return False
+    _finish(job)
+    return True
+
+
+def requeue_expired():
+    "Queues again (as a failed attempt) the running jobs whose worker lease ran out. Returns how many."
+    count = 0
+    for job in Job.objects.filter(status=Job.Status.RUNNING, locked_until__lt=now()):
+        if job.started_at is None:
+            job.started_at = now()
+        _finish(job, f"Worker {job.locked_by} stopped before finishing the job.")
+        count += 1
+    return count
+
+
+def work(worker=None, burst=False, poll_interval=1.0, stop=None, max_jobs=None):
+    """
+    Runs jobs until stop (a threading or multiprocessing Event) is set, or
+    in burst mode until none are due. Returns the number of jobs run.
+    """
+    worker = worker or worker_name()
+    stop = stop or threading.Event()
+    count = 0
+    last_requeue = 0
+    while not stop.is_set() and (max_jobs is None or count < max_jobs):
+        close_old_connections()
+        if time.monotonic() - last_requeue > LEASE_GRACE_SECONDS:
+            requeue_expired()
+            last_requeue = time.monotonic()
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            stop.wait(poll_interval)
+            continue
+        run(job)
+        count += 1
+    return count
+
+
+def metrics(since=None):
+    """
+    Returns {task name: {done, failed, queued, running, retried,
+    wait_ms: {p50, p95}, duration_ms: {p50, p95, max}}} for the jobs
+    finished since `since` and those queued or running now.
+    """
+    jobs = Job.objects.all()
+    if since:
+        jobs = jobs.filter(Q(finished_at__gte=since) | Q(status__in=[Job.Status.QUEUED, Job.Status.RUNNING]))
+    result = {}
+    for name, status, attempts, wait_ms, duration_ms in jobs.values_list(
+            'name', 'status', 'attempts', 'wait_ms', 'duration_ms').order_by('id'):
+        stats = result.setdefault(name, {'done': 0, 'failed': 0, 'queued': 0, 'running': 0, 'retried': 0,
+                                         'wait': [], 'duration': []})
+        stats[status] += 1
+        stats['retried'] += attempts > 1
+        if status in (Job.Status.DONE, Job.Status.FAILED) and duration_ms is not None:
+            stats['wait'].append(wait_ms)
+            stats['duration'].append(duration_ms)
+    for stats in result.values():
+        wait, duration = stats.pop('wait'), stats.pop('duration')
+        stats['wait_ms'] = _percentiles(wait)
+        stats['duration_ms'] = {**_percentiles(duration), 'max': max(duration, default=None)}
+    return result
+
+
+def _percentiles(values):
+    if not values:
+        return {'p50': None, 'p95': None}
+    if len(values) == 1:
+        return {'p50': values[0], 'p95': values[0]}
+    cuts = statistics.quantiles(values, n=20, method='inclusive')
+    return {'p50': statistics.median(values), 'p95': cuts[18]}
+
+
+def purge(older_than_days):
+    "Deletes jobs that finished more than older_than_days ago. Returns how many."
+    cutoff = now() - timedelta(days=older_than_days)
+    return Job.objects.filter(status__in=[Job.Status.DONE, Job.Status.FAILED], finished_at__lt=cutoff) \
+        .delete()[0]
@@ -0,0 +1,45 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bandshare import jobs
+from bandshare.importers import SongImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = ("Imports Songs from a CSV or JSON Lines file with columns title, artist, genres (';' separated), "
+            "release_date, musical_key, time_signature, bpm and duration (seconds or m:ss).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--enqueue', action='store_true',
+                            help="Queue the import for `run_workers`, which must be able to read the file.")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        format = options['format'] or path.suffix.lstrip('.').lower()
+        if format not in ('csv', 'jsonl'):
+            raise CommandError(f"Can't tell the format of {path}; pass --format.")
+        if options['enqueue']:
+            job = jobs.enqueue('songs.import', {'path': str(path.resolve()), 'format': format,
+                                                'batch_size': options['batch_size']})
+            self.stdout.write(self.style.SUCCESS(f"Queued {job}." if job else f"Imported {path}."))
+            return
+
+        def progress(stats):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{stats.imported} imported, {stats.skipped} skipped "
+                                  f"({stats.rows_per_second:,.0f} rows/sec)")
+
+        importer = SongImporter(batch_size=options['batch_size'])
+        with open(path, newline='', encoding='utf-8') as f:
+            stats = importer.run(read_rows(f, format), progress=progress)
+
+        for line, messages in stats.errors:
+            self.stderr.write(f"Row {line}: {'; '.join(messages)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats.imported} songs, skipped {stats.skipped} "
+            f"({stats.rows_per_second:,.0f} rows/sec)."))
@@ -0,0 +1,48 @@
+import csv
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from bandshare.models import Location, PostalCode
+from bandshare import geo
+
+BUNDLED_FILE = Path(__file__).resolve().parents[2] / 'data' / 'postal_codes.csv'
+
+
+class Command(BaseCommand):
+    help = ("Loads postal code coordinates from a CSV (country,postal_code,latitude,longitude) "
+            "and geocodes Locations that have no coordinates yet.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=BUNDLED_FILE)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        loaded = 0
+        batch = []
+        with open(options['path'], newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                batch.append(PostalCode(country=row['country'], postal_code=row['postal_code'],
+                                        latitude=float(row['latitude']), longitude=float(row['longitude'])))
+                if len(batch) >= batch_size:
+                    loaded += self._save(batch)
+                    batch = []
+        loaded += self._save(batch)
+
+        coordinates = {(c, p): (lat, lon) for c, p, lat, lon in
+                       PostalCode.objects.values_list('country', 'postal_code', 'latitude', 'longitude')}
+        located = []
+        for location in Location.objects.filter(latitude__isnull=True).only('country', 'postal_code'):
+            if (location.country, location.postal_code) in coordinates:
+                location.latitude, location.longitude = coordinates[(location.country, location.postal_code)]
+                location.geohash = geo.encode(location.latitude, location.longitude)
+                located.append(location)
+        Location.objects.bulk_update(located, ['latitude', 'longitude', 'geohash'], batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(f"Loaded {loaded} postal codes, geocoded {len(located)} locations."))
+
+    def _save(self, batch):
+        PostalCode.objects.bulk_create(batch, update_conflicts=True, unique_fields=['country', 'postal_code'],
+                                       update_fields=['latitude', 'longitude'])
+        return len(batch)
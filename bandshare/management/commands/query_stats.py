@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from bandshare.instrumentation import stats, view_stats
+
+
+class Command(BaseCommand):
+    help = ("Shows per-view SQL query counts, DB time and latency percentiles recorded by "
+            "QueryStatsMiddleware (set BANDSHARE_QUERY_STATS_SAMPLE_RATE to enable).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help="Print the raw summary as JSON.")
+        parser.add_argument('--clear', action='store_true', help="Discard all recorded samples.")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            stats.clear()
+            self.stdout.write("Cleared query stats.")
+            return
+
+        summary = view_stats()
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        if not summary:
+            self.stdout.write("No samples recorded.")
+            return
+
+        self.stdout.write(f"{'view':<40} {'reqs':>6} {'queries p50/p99':>16} {'db ms p50/p99':>16} "
+                          f"{'total ms p50/p99':>18}")
+        for view, s in sorted(summary.items(), key=lambda item: -item[1]['total_ms']['p99']):
+            self.stdout.write(
+                f"{view:<40} {s['requests']:>6} "
+                f"{s['queries']['p50']:>7}/{s['queries']['p99']:<8} "
+                f"{s['db_ms']['p50']:>7.1f}/{s['db_ms']['p99']:<8.1f} "
+                f"{s['total_ms']['p50']:>8.1f}/{s['total_ms']['p99']:<9.1f}")
+            for dupe in s['duplicate_queries']:
+                self.stdout.write(self.style.WARNING(f"    {dupe['max_per_request']}x {dupe['sql'][:100]}"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from bandshare.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the musician search index from User genres, instruments and location."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} users."))
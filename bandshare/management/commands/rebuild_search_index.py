@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from bandshare import jobs
+from bandshare.search import fulltext
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index for songs, artists, groups and users."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', action='append', choices=fulltext.KINDS, dest='kinds',
+                            help="Only rebuild this kind; may be given more than once.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--enqueue', action='store_true', help="Queue the rebuild for `run_workers`.")
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            kinds = sorted(options['kinds'] or fulltext.KINDS)
+            job = jobs.enqueue('search.rebuild', {'kinds': kinds, 'batch_size': options['batch_size']},
+                               dedupe_key=f"search.rebuild:{','.join(kinds)}")
+            self.stdout.write(self.style.SUCCESS(f"Queued {job}." if job else "Rebuilt the search index."))
+            return
+
+        def progress(kind, count):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{kind}: {count}")
+
+        counts = fulltext.rebuild(options['kinds'] or fulltext.KINDS, options['batch_size'], progress)
+        for kind, count in counts.items():
+            self.stdout.write(self.style.SUCCESS(f"Indexed {count} {kind} documents."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bandshare import counters
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the denormalized member, song and group counts (bandshare.counters) and fixes "
+            "any that drifted, e.g. after raw SQL or bulk writes.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixed = counters.recount()
+        for name, count in fixed.items():
+            style = self.style.WARNING if count else self.style.SUCCESS
+            self.stdout.write(style(f"{name}: fixed {count} rows."))
@@ -0,0 +1,121 @@
+import json
+import multiprocessing
+import os
+import signal
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils.timezone import now
+
+
+def _worker(stop, burst, poll_interval, max_jobs):
+    # Imported here: a spawned (not forked) process has to set Django up first.
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    from bandshare import jobs
+
+    # Ctrl-C reaches the whole process group; let the parent decide when to stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        jobs.work(burst=burst, poll_interval=poll_interval, stop=stop, max_jobs=max_jobs)
+    finally:
+        connections.close_all()
+
+
+def _format_ms(value):
+    return '-' if value is None else f'{value:.0f}'
+
+
+class Command(BaseCommand):
+    help = ("Runs queued background jobs (bandshare.jobs) in a pool of worker processes until stopped "
+            "with Ctrl-C or SIGTERM, which let running jobs finish.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes; 0 runs jobs in this process. Defaults to the CPU count.")
+        parser.add_argument('--burst', action='store_true', help="Exit once no jobs are due.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds an idle worker waits before looking for jobs again.")
+        parser.add_argument('--max-jobs', type=int,
+                            help="Replace a worker process after it has run this many jobs.")
+        parser.add_argument('--stats', action='store_true',
+                            help="Print per-task counts and timings for the last --hours and exit.")
+        parser.add_argument('--hours', type=float, default=24)
+        parser.add_argument('--json', action='store_true', help="With --stats, print them as JSON.")
+        parser.add_argument('--purge-days', type=int,
+                            help="Delete jobs that finished more than this many days ago and exit.")
+
+    def handle(self, *args, **options):
+        from bandshare import jobs  # Not at module level; see _worker().
+
+        if options['stats']:
+            return self.print_stats(jobs.metrics(since=now() - timedelta(hours=options['hours'])), options['json'])
+        if options['purge_days'] is not None:
+            count = jobs.purge(options['purge_days'])
+            self.stdout.write(self.style.SUCCESS(f"Deleted {count} finished jobs."))
+            return
+
+        if options['workers'] <= 0:
+            count = jobs.work(burst=options['burst'], poll_interval=options['poll_interval'],
+                              max_jobs=options['max_jobs'])
+            self.stdout.write(self.style.SUCCESS(f"Ran {count} jobs."))
+            return
+        self.run_pool(options)
+
+    def run_pool(self, options):
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+        stop = context.Event()
+        previous = {signum: signal.signal(signum, lambda signum, frame: stop.set())
+                    for signum in (signal.SIGINT, signal.SIGTERM)}
+        worker_args = (stop, options['burst'], options['poll_interval'], options['max_jobs'])
+
+        def start():
+            process = context.Process(target=_worker, args=worker_args, daemon=False)
+            process.start()
+            return process
+
+        # Children must open their own database connections.
+        connections.close_all()
+        processes = [start() for _ in range(options['workers'])]
+        self.stdout.write(f"Started {len(processes)} workers ({context.get_start_method()}).")
+        try:
+            while processes and not stop.is_set():
+                stop.wait(1)
+                for i, process in enumerate(processes):
+                    if process.is_alive():
+                        continue
+                    if options['burst'] and process.exitcode == 0:
+                        processes[i] = None
+                    elif not stop.is_set():
+                        if process.exitcode != 0:
+                            self.stderr.write(f"Worker {process.pid} exited with {process.exitcode}; restarting.")
+                        processes[i] = start()
+                processes = [process for process in processes if process is not None]
+        finally:
+            stop.set()
+            for process in processes:
+                process.join()
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS("Workers stopped."))
+
+    def print_stats(self, summary, as_json):
+        if as_json:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        if not summary:
+            self.stdout.write("No jobs.")
+            return
+        self.stdout.write(f"{'task':<28} {'done':>6} {'failed':>6} {'queued':>6} {'running':>7} {'retried':>7} "
+                          f"{'wait ms p50/p95':>16} {'run ms p50/p95/max':>20}")
+        for name, s in sorted(summary.items()):
+            wait, duration = s['wait_ms'], s['duration_ms']
+            self.stdout.write(
+                f"{name:<28} {s['done']:>6} {s['failed']:>6} {s['queued']:>6} {s['running']:>7} {s['retried']:>7} "
+                f"{_format_ms(wait['p50']):>7}/{_format_ms(wait['p95']):<8} "
+                f"{_format_ms(duration['p50']):>6}/{_format_ms(duration['p95'])}/{_format_ms(duration['max']):<6}")
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bandshare import jobs
+from bandshare.recommendations import score_all
+
+
+class Command(BaseCommand):
+    help = "Scores every Group against every User and rebuilds the recommendations table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--per-group', type=int, default=50)
+        parser.add_argument('--per-user', type=int, default=20)
+        parser.add_argument('--chunk-size', type=int, default=64,
+                            help="Groups scored per NumPy batch; bounds memory to chunk-size x users.")
+        parser.add_argument('--enqueue', action='store_true', help="Queue the scoring for `run_workers`.")
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            job = jobs.enqueue('recommendations.score_all', {
+                'per_group': options['per_group'], 'per_user': options['per_user'],
+                'chunk_size': options['chunk_size']}, dedupe_key='recommendations.score_all')
+            self.stdout.write(self.style.SUCCESS(f"Queued {job}." if job else "Scored recommendations."))
+            return
+
+        start = time.perf_counter()
+        count = score_all(per_group=options['per_group'], per_user=options['per_user'],
+                          chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} recommendations in {elapsed:.2f}s."))
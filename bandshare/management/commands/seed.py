@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bandshare.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = ("Fills the database with synthetic users, groups, songs, setlists and locations. "
+            "Counts not given are derived from --users.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        for name in ('locations', 'groups', 'artists', 'songs', 'setlists'):
+            parser.add_argument(f'--{name}', type=int)
+        parser.add_argument('--seed', type=int, default=1, help="Random seed, for repeatable datasets.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--skip-indexes', action='store_true',
+                            help="Don't rebuild the musician and full-text search indexes afterwards.")
+
+    def handle(self, *args, **options):
+        seeder = Seeder(options['users'], locations=options['locations'], groups=options['groups'],
+                        artists=options['artists'], songs=options['songs'], setlists=options['setlists'],
+                        seed=options['seed'], batch_size=options['batch_size'])
+
+        def progress(step, seconds):
+            self.stdout.write(f"{step}: {seconds:.1f}s")
+
+        start = time.perf_counter()
+        rows = seeder.run(build_indexes=not options['skip_indexes'], progress=progress)
+        elapsed = time.perf_counter() - start
+        for table, count in rows.items():
+            self.stdout.write(f"  {table}: {count}")
+        total = sum(rows.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Inserted {total} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)."))
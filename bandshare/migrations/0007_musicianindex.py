@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-18 15:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bandshare', '0006_rename_time_seconds_song_duration_seconds_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MusicianIndex',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='bandshare.user')),
+                ('genre_bits', models.BinaryField(default=b'')),
+                ('instrument_bits', models.BinaryField(default=b'')),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bandshare.location')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 15:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bandshare', '0007_musicianindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('score', models.FloatField()),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bandshare.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bandshare.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['group', '-score'], name='recommendation_group_score'), models.Index(fields=['user', '-score'], name='recommendation_user_score')],
+                'constraints': [models.UniqueConstraint(fields=('group', 'user'), name='unique_recommendation')],
+            },
+        ),
+    ]
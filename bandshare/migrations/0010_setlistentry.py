@@ -0,0 +1,92 @@
+from collections import Counter
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_setlist_songs(apps, schema_editor):
+    "Moves rows from the old auto-created M2M table into SetlistEntry and fills in the summaries."
+    Setlist = apps.get_model('bandshare', 'Setlist')
+    SetlistEntry = apps.get_model('bandshare', 'SetlistEntry')
+    OldSetlistSongs = Setlist.songs.through
+
+    for setlist in Setlist.objects.all():
+        rows = OldSetlistSongs.objects.filter(setlist=setlist).select_related('song').order_by('id')
+        songs = [row.song for row in rows]
+        SetlistEntry.objects.bulk_create([
+            SetlistEntry(setlist=setlist, song=song, position=i) for i, song in enumerate(songs)
+        ])
+        tracks = [[s.pk, s.duration_seconds.total_seconds(), s.bpm, s.musical_key, s.time_signature] for s in songs]
+        keys = [t[3] for t in tracks]
+        setlist.tracks = tracks
+        setlist.song_count = len(tracks)
+        setlist.total_duration = timedelta(seconds=sum(t[1] for t in tracks))
+        setlist.bpm_curve = [t[2] for t in tracks]
+        setlist.key_changes = sum(1 for a, b in zip(keys, keys[1:]) if a and b and a != b)
+        setlist.time_signature_counts = dict(Counter(t[4] for t in tracks if t[4]))
+        setlist.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bandshare', '0009_location_coordinates_postalcode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SetlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('setlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bandshare.setlist')),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bandshare.song')),
+            ],
+            options={
+                'ordering': ['position'],
+                'indexes': [models.Index(fields=['setlist', 'position'], name='setlist_entry_position')],
+                'constraints': [models.UniqueConstraint(fields=('setlist', 'song'), name='unique_setlist_song')],
+            },
+        ),
+        migrations.AddField(
+            model_name='setlist',
+            name='bpm_curve',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='setlist',
+            name='key_changes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='setlist',
+            name='song_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='setlist',
+            name='time_signature_counts',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='setlist',
+            name='total_duration',
+            field=models.DurationField(default=timedelta(0), editable=False),
+        ),
+        migrations.AddField(
+            model_name='setlist',
+            name='tracks',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(copy_setlist_songs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='setlist',
+            name='songs',
+        ),
+        migrations.AddField(
+            model_name='setlist',
+            name='songs',
+            field=models.ManyToManyField(blank=True, through='bandshare.SetlistEntry', to='bandshare.song'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bandshare', '0010_setlistentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['musical_key', 'time_signature', 'bpm'], name='song_key_meter_bpm'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bandshare', '0011_song_key_meter_bpm_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='artist',
+            index=models.Index(fields=['created_at', 'id'], name='artist_created'),
+        ),
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['created_at', 'id'], name='group_created'),
+        ),
+        migrations.AddIndex(
+            model_name='setlist',
+            index=models.Index(fields=['created_at', 'id'], name='setlist_created'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['created_at', 'id'], name='song_created'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['created_at', 'id'], name='user_created'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE bandshare_search USING fts5("
+    "title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "CREATE VIRTUAL TABLE bandshare_search_vocab USING fts5vocab(bandshare_search, 'row')",
+]
+SQLITE_DROP = [
+    "DROP TABLE IF EXISTS bandshare_search_vocab",
+    "DROP TABLE IF EXISTS bandshare_search",
+]
+
+POSTGRES_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE TABLE bandshare_search ("
+    "id bigint PRIMARY KEY, title text NOT NULL, body text NOT NULL, "
+    "document tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')) STORED)",
+    "CREATE INDEX bandshare_search_document ON bandshare_search USING gin (document)",
+    "CREATE INDEX bandshare_search_title_trgm ON bandshare_search USING gin (title gin_trgm_ops)",
+]
+POSTGRES_DROP = ["DROP TABLE IF EXISTS bandshare_search"]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, ()):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+    """
+    Creates the full-text search index table (see bandshare.search.fulltext).
+    It isn't a model, so the SQL depends on the database. Fill it with
+    manage.py rebuild_search_index.
+    """
+
+    dependencies = [
+        ('bandshare', '0012_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE}),
+            _run({'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+ROLE_MAX_LENGTH = 128
+
+
+def merge_duplicate_memberships(apps, schema_editor):
+    """
+    Keeps the oldest membership of each (group, member) pair and folds the
+    roles of the others into it ("Guitar, Vocals") before they are deleted.
+    """
+    GroupMembership = apps.get_model('bandshare', 'GroupMembership')
+    duplicates = (GroupMembership.objects.values('group_id', 'member_id')
+                  .annotate(n=models.Count('id')).filter(n__gt=1))
+    for pair in duplicates.iterator():
+        memberships = list(GroupMembership.objects.filter(group_id=pair['group_id'], member_id=pair['member_id'])
+                           .order_by('id'))
+        keep = memberships[0]
+        roles = list(dict.fromkeys(m.role for m in memberships if m.role))
+        keep.role = ', '.join(roles)[:ROLE_MAX_LENGTH]
+        keep.save(update_fields=['role'])
+        GroupMembership.objects.filter(id__in=[m.id for m in memberships[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bandshare', '0013_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_memberships, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='groupmembership',
+            constraint=models.UniqueConstraint(fields=('group', 'member'), name='groupmembership_unique_member'),
+        ),
+        migrations.AddIndex(
+            model_name='setlist',
+            index=models.Index(fields=['owner_group', 'created_at'], name='setlist_group_created'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['title'], name='song_title'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['bpm'], name='song_bpm'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['release_date'], name='song_release_date'),
+        ),
+        # The composite index and constraint above lead with these columns, so
+        # their single-column foreign key indexes are redundant.
+        migrations.AlterField(
+            model_name='groupmembership',
+            name='group',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='bandshare.group'),
+        ),
+        migrations.AlterField(
+            model_name='setlist',
+            name='owner_group',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='bandshare.group'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bandshare', '0016_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Availability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekly', models.BinaryField(max_length=84)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='bandshare.user')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('kind', models.CharField(choices=[('rehearsal', 'Rehearsal'), ('gig', 'Gig')], default='rehearsal', max_length=16)),
+                ('title', models.CharField(blank=True, max_length=256)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('recurrence', models.CharField(blank=True, help_text='RRULE, e.g. FREQ=WEEKLY;BYDAY=TU', max_length=256)),
+                ('repeat_until', models.DateTimeField(blank=True, help_text='No occurrences start after this.', null=True)),
+                ('group', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='bandshare.group')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['group', 'start'], name='event_group_start')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TimeOff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('note', models.CharField(blank=True, max_length=256)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='time_off', to='bandshare.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'end'], name='timeoff_user_end')],
+            },
+        ),
+    ]
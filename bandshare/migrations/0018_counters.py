@@ -0,0 +1,53 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:45
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_existing_rows(apps, schema_editor):
+    "Fills in the new counters, one UPDATE each (see bandshare.counters.recount)."
+    Group = apps.get_model('bandshare', 'Group')
+    Artist = apps.get_model('bandshare', 'Artist')
+    Genre = apps.get_model('bandshare', 'Genre')
+    Song = apps.get_model('bandshare', 'Song')
+    counters = [
+        (Group, 'member_count', apps.get_model('bandshare', 'GroupMembership'), 'group_id'),
+        (Artist, 'song_count', Song, 'artist_id'),
+        (Genre, 'group_count', Group.genres.through, 'genre_id'),
+        (Genre, 'song_count', Song.genres.through, 'genre_id'),
+    ]
+    for model, field, rows, key in counters:
+        counted = rows.objects.filter(**{key: models.OuterRef('pk')}).order_by().values(key) \
+            .annotate(n=models.Count('*')).values('n')
+        model.objects.update(**{field: Coalesce(models.Subquery(counted), models.Value(0))})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bandshare', '0017_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artist',
+            name='song_count',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='genre',
+            name='group_count',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='genre',
+            name='song_count',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='member_count',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bandshare', '0018_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Venue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=256)),
+                ('description', models.CharField(blank=True, max_length=512)),
+                ('capacity', models.PositiveIntegerField()),
+                ('stage_width', models.DecimalField(blank=True, decimal_places=1, help_text='Metres.', max_digits=4, null=True)),
+                ('stage_depth', models.DecimalField(blank=True, decimal_places=1, help_text='Metres.', max_digits=4, null=True)),
+                ('stage_notes', models.CharField(blank=True, help_text='PA, backline, load-in, etc.', max_length=1024)),
+                ('genre_bits', models.BinaryField(default=b'')),
+                ('genres', models.ManyToManyField(blank=True, related_name='venues', to='bandshare.genre')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='venues', to='bandshare.location')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Gig',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('start_time', models.TimeField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, null=True)),
+                ('group', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='gigs', to='bandshare.group')),
+                ('setlist', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='gigs', to='bandshare.setlist')),
+                ('venue', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='gigs', to='bandshare.venue')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='venue',
+            index=models.Index(fields=['created_at', 'id'], name='venue_created'),
+        ),
+        migrations.AddIndex(
+            model_name='gig',
+            index=models.Index(fields=['created_at', 'id'], name='gig_created'),
+        ),
+        migrations.AddIndex(
+            model_name='gig',
+            index=models.Index(fields=['venue', 'date'], name='gig_venue_date'),
+        ),
+        migrations.AddIndex(
+            model_name='gig',
+            index=models.Index(fields=['group', 'date'], name='gig_group_date'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-18 17:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bandshare', '0019_venues_and_gigs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='setlist',
+            name='revision',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='SetlistOp',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('seq', models.PositiveIntegerField()),
+                ('op', models.JSONField()),
+                ('setlist', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ops', to='bandshare.setlist')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('setlist', 'seq'), name='unique_setlist_op')],
+            },
+        ),
+    ]
@@ -1,8 +1,14 @@
 from .user import User
 from .group import Group, GroupMembership
 from .genre import Genre
-from .location import Location
+from .location import Location, PostalCode
 from .instrument import Instrument
 from .artist import Artist
 from .song import Song, TimeSignature, MusicalKey
-from .setlist import Setlist
+from .setlist import Setlist, SetlistEntry, SetlistOp
+from .musician_index import MusicianIndex
+from .recommendation import Recommendation
+from .activity import Activity, Follow, PullSource, TimelineEntry
+from .job import Job
+from .schedule import Availability, Event, TimeOff
+from .venue import Venue, Gig
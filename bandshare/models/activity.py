@@ -0,0 +1,77 @@
+from django.db import models
+
+
+class Activity(models.Model):
+    """
+    Something that happened in a Group or to a musician, shown in activity
+    feeds. Written by bandshare.feed.record().
+    """
+    class Verb(models.TextChoices):
+        SETLIST_CREATED = 'setlist_created'
+        SONGS_ADDED = 'songs_added'
+        MEMBER_JOINED = 'member_joined'
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    verb = models.CharField(max_length=32, choices=Verb.choices)
+
+    group = models.ForeignKey('Group', on_delete=models.CASCADE, blank=True, null=True, db_index=False)
+    user = models.ForeignKey('User', on_delete=models.CASCADE, blank=True, null=True, db_index=False)
+    setlist = models.ForeignKey('Setlist', on_delete=models.CASCADE, blank=True, null=True)
+    song = models.ForeignKey('Song', on_delete=models.CASCADE, blank=True, null=True)
+    data = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'activities'
+        indexes = [
+            # Recent activity of a group or a musician, for fan-out on read.
+            models.Index(fields=['group', '-id'], name='activity_group_recent'),
+            models.Index(fields=['user', '-id'], name='activity_user_recent'),
+        ]
+
+    def __str__(self):
+        return f"{self.verb} ({self.group_id or self.user_id})"
+
+
+class TimelineEntry(models.Model):
+    "An Activity pushed to a User's feed."
+    # Indexed by the (user, activity) unique constraint, which also serves feed pages.
+    user = models.ForeignKey('User', on_delete=models.CASCADE, db_index=False)
+    activity = models.ForeignKey('Activity', on_delete=models.CASCADE)
+
+    class Meta:
+        verbose_name_plural = 'timeline entries'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'activity'], name='timeline_unique_entry'),
+        ]
+
+    def __str__(self):
+        return f"{self.activity_id} for {self.user_id}"
+
+
+class Follow(models.Model):
+    "A User following a musician's activity."
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Indexed by the (follower, user) unique constraint.
+    follower = models.ForeignKey('User', related_name='following', on_delete=models.CASCADE, db_index=False)
+    user = models.ForeignKey('User', related_name='followers', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['follower', 'user'], name='unique_follow'),
+        ]
+
+    def __str__(self):
+        return f"{self.follower_id} follows {self.user_id}"
+
+
+class PullSource(models.Model):
+    """
+    A Group or musician with too big an audience to fan activity out to,
+    whose activities are instead merged into feeds when they are read.
+    """
+    created_at = models.DateTimeField(auto_now_add=True)
+    group = models.OneToOneField('Group', on_delete=models.CASCADE, blank=True, null=True)
+    user = models.OneToOneField('User', on_delete=models.CASCADE, blank=True, null=True)
+
+    def __str__(self):
+        return f"group {self.group_id}" if self.group_id else f"user {self.user_id}"
@@ -6,5 +6,13 @@ class Artist(models.Model):
 
     name = models.CharField(unique=True, max_length=256)
 
+    # Kept up to date by bandshare.counters.
+    song_count = models.PositiveIntegerField(default=0, db_default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='artist_created'),
+        ]
+
     def __str__(self):
         return self.name
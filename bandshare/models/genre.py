@@ -3,5 +3,9 @@ from django.db import models
 class Genre(models.Model):
     name = models.CharField(max_length=128, unique=True)
 
+    # Kept up to date by bandshare.counters.
+    group_count = models.PositiveIntegerField(default=0, db_default=0, editable=False)
+    song_count = models.PositiveIntegerField(default=0, db_default=0, editable=False)
+
     def __str__(self):
         return self.name
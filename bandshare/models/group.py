@@ -1,6 +1,21 @@
 from django.db import models
+from django.db.models import Prefetch
 from django.utils.timezone import now
 
+
+class GroupQuerySet(models.QuerySet):
+    def with_details(self):
+        """
+        Loads members (with their roles), genres, location and owners in three
+        queries however many groups are fetched: one for the groups and their
+        FKs, one for memberships joined to users and one for genres.
+        """
+        return self.select_related('location', 'created_by', 'owned_by').prefetch_related(
+            Prefetch('groupmembership_set', queryset=GroupMembership.objects.select_related('member').order_by('id')),
+            'genres',
+        )
+
+
 class Group(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -16,16 +31,40 @@ class Group(models.Model):
     genres = models.ManyToManyField('Genre')
     location = models.ForeignKey('Location', on_delete=models.SET_NULL, blank=True, null=True)
 
+    # Kept up to date by bandshare.counters.
+    member_count = models.PositiveIntegerField(default=0, db_default=0, editable=False)
+
+    objects = GroupQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='group_created'),
+        ]
+
     @property
     def member_roles(self):
-        """Returns a list of each User and their roles."""
-        return [{'user': gm.member, 'role': gm.role} for gm in self.groupmembership_set.all()]
+        """
+        Returns a list of each User and their roles.
+
+        Uses memberships prefetched by Group.objects.with_details(), otherwise
+        costs one query.
+        """
+        memberships = self.groupmembership_set.all()
+        if 'groupmembership_set' not in getattr(self, '_prefetched_objects_cache', {}):
+            memberships = memberships.select_related('member')
+        return [{'user': gm.member, 'role': gm.role} for gm in memberships]
 
     def clean(self):
         if self.created_by_id and not self.owned_by_id:
             self.owned_by_id = self.created_by_id
 
 class GroupMembership(models.Model):
-    group = models.ForeignKey('Group', on_delete=models.CASCADE)
+    # Indexed by the (group, member) unique constraint.
+    group = models.ForeignKey('Group', on_delete=models.CASCADE, db_index=False)
     member = models.ForeignKey('User', on_delete=models.CASCADE)
     role = models.CharField(max_length=128)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'member'], name='groupmembership_unique_member'),
+        ]
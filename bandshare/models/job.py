@@ -0,0 +1,49 @@
+from django.db import models
+from django.db.models import Q
+from django.utils.timezone import now
+
+
+class Job(models.Model):
+    """
+    A unit of background work, run by `manage.py run_workers`. See
+    bandshare.jobs.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'queued'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    name = models.CharField(max_length=128)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(default=0, help_text="Higher runs first.")
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.QUEUED)
+    dedupe_key = models.CharField(max_length=255, blank=True, null=True,
+                                  help_text="At most one queued job has a given key.")
+
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=now)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    wait_ms = models.FloatField(blank=True, null=True, help_text="Time queued before the last attempt started.")
+    duration_ms = models.FloatField(blank=True, null=True, help_text="Time the last attempt took.")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dedupe_key'], condition=Q(status='queued'),
+                                    name='job_unique_queued_key'),
+        ]
+        indexes = [
+            # The next jobs to claim.
+            models.Index(fields=['status', '-priority', 'run_after'], name='job_queue'),
+            models.Index(fields=['name', 'finished_at'], name='job_name_finished'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -1,4 +1,62 @@
 from django.db import models
+from django.db.models import Q
+
+from .. import geo
+
+
+class LocationQuerySet(models.QuerySet):
+    def in_cells(self, lat, lon, radius_km):
+        """
+        Narrows to rows in the geohash cells (and bounding box) around a circle:
+        everything within() finds and a few more, without computing distances.
+        """
+        cells = Q()
+        for prefix in geo.covering_cells(lat, lon, radius_km):
+            low, high = geo.prefix_range(prefix)
+            cells |= Q(geohash__gte=low, geohash__lt=high)
+        min_lat, max_lat, min_lon, max_lon = geo.bounding_box(lat, lon, radius_km)
+        qs = self.filter(cells, latitude__range=(min_lat, max_lat))
+        if -180 <= min_lon and max_lon <= 180:
+            qs = qs.filter(longitude__range=(min_lon, max_lon))
+        return qs
+
+    def within(self, lat, lon, radius_km):
+        "Returns a list of (Location, distance_km) within the radius, nearest first."
+        found = []
+        for location in self.in_cells(lat, lon, radius_km):
+            distance = geo.haversine_km(lat, lon, location.latitude, location.longitude)
+            if distance <= radius_km:
+                found.append((location, distance))
+        found.sort(key=lambda pair: pair[1])
+        return found
+
+    def nearest(self, lat, lon, k=10, max_radius_km=500):
+        "Returns up to k (Location, distance_km) pairs, nearest first."
+        radius = 5.0
+        while True:
+            found = self.within(lat, lon, radius)
+            if len(found) >= k or radius >= max_radius_km:
+                return found[:k]
+            radius = min(radius * 4, max_radius_km)
+
+
+class PostalCode(models.Model):
+    """
+    Offline geocoding table. Load it with `manage.py load_postal_codes`.
+    """
+    country = models.CharField(max_length=64)
+    postal_code = models.CharField(max_length=10)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    def __str__(self):
+        return f"{self.postal_code} ({self.country})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['country', 'postal_code'], name='unique_postal_code')
+        ]
+
 
 class Location(models.Model):
     name = models.CharField(max_length=256, default="")
@@ -8,11 +66,36 @@ class Location(models.Model):
     postal_code = models.CharField(null=True, max_length=10)
     country = models.CharField(max_length=64, default='United States of America')
 
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=geo.MAX_PRECISION, blank=True, default='', db_index=True, editable=False)
+
+    objects = LocationQuerySet.as_manager()
+
     def __str__(self):
         return self.postal_code
 
+    @property
+    def has_coordinates(self):
+        return self.latitude is not None and self.longitude is not None
+
+    def geocode(self):
+        "Fills in coordinates from the PostalCode table if they are missing."
+        if self.has_coordinates or not self.postal_code:
+            return
+        coordinates = PostalCode.objects.filter(country=self.country, postal_code=self.postal_code) \
+            .values_list('latitude', 'longitude').first()
+        if coordinates:
+            self.latitude, self.longitude = coordinates
+
+    def save(self, *args, **kwargs):
+        self.geocode()
+        self.geohash = geo.encode(self.latitude, self.longitude) if self.has_coordinates else ''
+        if 'update_fields' in kwargs and kwargs['update_fields'] is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'latitude', 'longitude', 'geohash'}
+        super().save(*args, **kwargs)
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['address', 'city', 'state', 'postal_code', 'country'], name='unique_location')
         ]
-
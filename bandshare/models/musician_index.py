@@ -0,0 +1,18 @@
+from django.db import models
+
+
+class MusicianIndex(models.Model):
+    """
+    Denormalized search row for a User.
+
+    Genre and instrument memberships are packed into bitsets (bit N set means
+    the id N is present) so a search only has to scan the rows for one
+    location instead of joining through both M2M tables.
+    """
+    user = models.OneToOneField('User', primary_key=True, on_delete=models.CASCADE, related_name='search_index')
+    location = models.ForeignKey('Location', on_delete=models.SET_NULL, blank=True, null=True, db_index=True)
+    genre_bits = models.BinaryField(default=b'')
+    instrument_bits = models.BinaryField(default=b'')
+
+    def __str__(self):
+        return f"MusicianIndex({self.user_id})"
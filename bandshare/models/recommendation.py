@@ -0,0 +1,25 @@
+from django.db import models
+
+
+class Recommendation(models.Model):
+    """
+    A precomputed User-for-Group match, written in bulk by
+    bandshare.recommendations.score_all().
+    """
+    computed_at = models.DateTimeField(auto_now=True)
+
+    group = models.ForeignKey('Group', on_delete=models.CASCADE)
+    user = models.ForeignKey('User', on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'user'], name='unique_recommendation')
+        ]
+        indexes = [
+            models.Index(fields=['group', '-score'], name='recommendation_group_score'),
+            models.Index(fields=['user', '-score'], name='recommendation_user_score'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} for {self.group_id} ({self.score:.3f})"
@@ -0,0 +1,96 @@
+from dateutil.rrule import rrulestr
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import Q
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+
+
+class Availability(models.Model):
+    """
+    When a User is usually free, as a bitmap of the week: one bit per
+    SLOT_MINUTES, starting Monday 00:00 in the site's time zone. See
+    bandshare.scheduling.weekly_slots().
+    """
+    user = models.OneToOneField('User', on_delete=models.CASCADE, related_name='availability')
+    weekly = models.BinaryField(max_length=SLOTS_PER_WEEK // 8)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def clean(self):
+        if len(self.weekly) != SLOTS_PER_WEEK // 8:
+            raise ValidationError({'weekly': f"Must be {SLOTS_PER_WEEK // 8} bytes."})
+
+
+class TimeOff(models.Model):
+    "A one-off stretch when a User isn't available, whatever their weekly availability says."
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='time_off', db_index=False)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    note = models.CharField(max_length=256, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'end'], name='timeoff_user_end'),
+        ]
+
+
+class EventQuerySet(models.QuerySet):
+    def overlapping(self, start, end):
+        "Events with an occurrence that may overlap start-end."
+        repeats = ~Q(recurrence='') & (Q(repeat_until__isnull=True) | Q(repeat_until__gte=start))
+        return self.filter(Q(start__lt=end) & (Q(end__gt=start) | repeats))
+
+
+class Event(models.Model):
+    """
+    A rehearsal or gig of a Group. Members are busy during every occurrence.
+
+    A repeating event stores its first occurrence and an RFC 5545 RRULE,
+    e.g. "FREQ=WEEKLY;BYDAY=TU" or "FREQ=WEEKLY;INTERVAL=2;COUNT=6";
+    occurrences are only worked out for the dates asked for.
+    """
+    class Kind(models.TextChoices):
+        REHEARSAL = 'rehearsal'
+        GIG = 'gig'
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    group = models.ForeignKey('Group', on_delete=models.CASCADE, related_name='events', db_index=False)
+    kind = models.CharField(max_length=16, choices=Kind.choices, default=Kind.REHEARSAL)
+    title = models.CharField(max_length=256, blank=True)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    recurrence = models.CharField(max_length=256, blank=True, help_text="RRULE, e.g. FREQ=WEEKLY;BYDAY=TU")
+    repeat_until = models.DateTimeField(blank=True, null=True, help_text="No occurrences start after this.")
+
+    objects = EventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'start'], name='event_group_start'),
+        ]
+
+    def __str__(self):
+        return self.title or f"{self.get_kind_display()} {self.start:%Y-%m-%d %H:%M}"
+
+    def clean(self):
+        if self.end <= self.start:
+            raise ValidationError({'end': "Must be after the start."})
+        if self.recurrence:
+            try:
+                rrulestr(self.recurrence, dtstart=self.start)
+            except (ValueError, TypeError) as e:
+                raise ValidationError({'recurrence': str(e)})
+
+    def occurrences(self, start, end):
+        "Yields (start, end) of each occurrence overlapping start-end, in order."
+        duration = self.end - self.start
+        if not self.recurrence:
+            if self.start < end and self.end > start:
+                yield self.start, self.end
+            return
+        for occurrence in rrulestr(self.recurrence, dtstart=self.start).xafter(start - duration):
+            if occurrence >= end or (self.repeat_until and occurrence > self.repeat_until):
+                return
+            yield occurrence, occurrence + duration
@@ -1,14 +1,234 @@
-from django.db import models
+from collections import Counter
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.dispatch import Signal
 from django.utils.timezone import now
 
+# Sent by Setlist.add_songs(), which writes entries with bulk_create, with the songs added.
+songs_added = Signal()
+
+
+def song_track(song):
+    "Returns the per-position summary data kept for a song: [id, seconds, bpm, key, time signature]."
+    return [song.pk, song.duration_seconds.total_seconds(), song.bpm, song.musical_key, song.time_signature]
+
+
 class Setlist(models.Model):
+    """
+    An ordered list of Songs owned by a Group.
+
+    The summary columns (song_count, total_duration, bpm_curve, key_changes,
+    time_signature_counts) are maintained on every add/remove/reorder from the
+    `tracks` column, which holds song_track() for each position. Reading a
+    summary is therefore a single row read and never touches Song. Each edit
+    locks the row and starts from its current `tracks`.
+    """
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     title = models.CharField(max_length=128)
     description = models.CharField(max_length=512, default='', blank=True)
-    songs = models.ManyToManyField('Song', blank=True)
-    owner_group = models.ForeignKey('Group', on_delete=models.CASCADE)
+    songs = models.ManyToManyField('Song', blank=True, through='SetlistEntry')
+    # Indexed by setlist_group_created, which also serves plain owner_group lookups.
+    owner_group = models.ForeignKey('Group', on_delete=models.CASCADE, db_index=False)
+
+    tracks = models.JSONField(default=list, blank=True, editable=False)
+    song_count = models.PositiveIntegerField(default=0, editable=False)
+    total_duration = models.DurationField(default=timedelta(0), editable=False)
+    bpm_curve = models.JSONField(default=list, blank=True, editable=False)
+    key_changes = models.PositiveIntegerField(default=0, editable=False)
+    time_signature_counts = models.JSONField(default=dict, blank=True, editable=False)
+    # Seq of the last op applied by bandshare.collab.
+    revision = models.PositiveIntegerField(default=0, db_default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='setlist_created'),
+            # A group's setlists, newest first.
+            models.Index(fields=['owner_group', 'created_at'], name='setlist_group_created'),
+        ]
+
+    SUMMARY_FIELDS = ['tracks', 'song_count', 'total_duration', 'bpm_curve', 'key_changes',
+                      'time_signature_counts', 'updated_at']
 
     def __str__(self):
         return self.title
+
+    @property
+    def summary(self):
+        "Returns the setlist's runtime and tempo analytics."
+        return {
+            'song_count': self.song_count,
+            'total_duration': self.total_duration,
+            'bpm_curve': self.bpm_curve,
+            'key_changes': self.key_changes,
+            'time_signature_counts': self.time_signature_counts,
+        }
+
+    @property
+    def song_ids(self):
+        "Returns the song ids in setlist order, from the summary data."
+        return [track[0] for track in self.tracks]
+
+    def ordered_songs(self):
+        "Returns a QuerySet of the songs in setlist order."
+        return self.songs.order_by('setlistentry__position', 'setlistentry__id')
+
+    def _set_tracks(self, tracks):
+        self.tracks = tracks
+        self.song_count = len(tracks)
+        self.total_duration = timedelta(seconds=sum(t[1] for t in tracks))
+        self.bpm_curve = [t[2] for t in tracks]
+        keys = [t[3] for t in tracks]
+        self.key_changes = sum(1 for a, b in zip(keys, keys[1:]) if a and b and a != b)
+        self.time_signature_counts = dict(Counter(t[4] for t in tracks if t[4]))
+
+    def _save_summary(self):
+        self._set_tracks(self.tracks)
+        self.save(update_fields=self.SUMMARY_FIELDS)
+
+    def _write_positions(self, song_ids):
+        "Sets every entry's position with one UPDATE ... CASE statement."
+        if song_ids:
+            SetlistEntry.objects.filter(setlist=self).update(position=Case(
+                *[When(song_id=song_id, then=Value(i)) for i, song_id in enumerate(song_ids)],
+                output_field=models.PositiveIntegerField(),
+            ))
+
+    def _lock(self):
+        """
+        Locks the row until the transaction ends and reloads `tracks` from it, so
+        concurrent edits through other instances apply one after the other.
+        """
+        self.tracks = Setlist.objects.select_for_update().values_list('tracks', flat=True).get(pk=self.pk)
+
+    def add_song(self, song, position=None):
+        "Inserts a song at position (default: the end)."
+        self.add_songs([song], position)
+
+    def add_songs(self, songs, position=None):
+        "Inserts songs, in order, at position (default: the end). Songs already in the setlist are skipped."
+        if position is not None and position < 0:
+            raise ValueError(f"Position must be 0 or more, not {position}.")
+        with transaction.atomic():
+            self._lock()
+            present = set(self.song_ids)
+            songs = [s for s in dict.fromkeys(songs) if s.pk not in present]
+            if not songs:
+                return
+            if position is None or position >= len(self.tracks):
+                position = len(self.tracks)
+            if position < len(self.tracks):
+                SetlistEntry.objects.filter(setlist=self, position__gte=position) \
+                    .update(position=F('position') + len(songs))
+            SetlistEntry.objects.bulk_create([
+                SetlistEntry(setlist=self, song=song, position=position + i) for i, song in enumerate(songs)
+            ])
+            self.tracks[position:position] = [song_track(song) for song in songs]
+            self._save_summary()
+        songs_added.send(sender=Setlist, instance=self, songs=songs)
+
+    def remove_song(self, song):
+        "Removes a song and closes the gap in positions."
+        song_id = getattr(song, 'pk', song)
+        with transaction.atomic():
+            self._lock()
+            if song_id not in self.song_ids:
+                return
+            position = self.song_ids.index(song_id)
+            SetlistEntry.objects.filter(setlist=self, song_id=song_id).delete()
+            SetlistEntry.objects.filter(setlist=self, position__gt=position).update(position=F('position') - 1)
+            del self.tracks[position]
+            self._save_summary()
+
+    def move_song(self, song, position):
+        "Moves one song to a new position; past the end moves it to the end."
+        song_id = getattr(song, 'pk', song)
+        if position < 0:
+            raise ValueError(f"Position must be 0 or more, not {position}.")
+        with transaction.atomic():
+            self._lock()
+            song_ids = self.song_ids
+            if song_id not in song_ids:
+                raise ValueError(f"Song {song_id} is not in the setlist.")
+            song_ids.remove(song_id)
+            song_ids.insert(position, song_id)
+            self._reorder(song_ids)
+
+    def reorder(self, song_ids):
+        """
+        Reorders the whole setlist in a single UPDATE.
+
+        song_ids must contain exactly the songs already in the setlist.
+        """
+        with transaction.atomic():
+            self._lock()
+            self._reorder(list(song_ids))
+
+    def _reorder(self, song_ids):
+        if sorted(song_ids) != sorted(self.song_ids):
+            raise ValueError("reorder() needs exactly the setlist's current songs.")
+        by_id = {track[0]: track for track in self.tracks}
+        self._write_positions(song_ids)
+        self.tracks = [by_id[song_id] for song_id in song_ids]
+        self._save_summary()
+
+    def update_song(self, song):
+        "Refreshes the summary data for a song whose fields changed."
+        with transaction.atomic():
+            self._lock()
+            self.tracks = [song_track(song) if t[0] == song.pk else t for t in self.tracks]
+            self._save_summary()
+
+    def refresh_summary(self):
+        """
+        Rebuilds the summary from the database and renumbers positions, e.g.
+        after songs were added with songs.add() or entries edited directly.
+        """
+        with transaction.atomic():
+            self._lock()
+            self.tracks = [song_track(song) for song in self.ordered_songs()]
+            self._write_positions(self.song_ids)
+            self._save_summary()
+
+
+class SetlistEntry(models.Model):
+    "A Song at a position in a Setlist."
+    setlist = models.ForeignKey('Setlist', on_delete=models.CASCADE)
+    song = models.ForeignKey('Song', on_delete=models.CASCADE)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['setlist', 'song'], name='unique_setlist_song')
+        ]
+        indexes = [
+            models.Index(fields=['setlist', 'position'], name='setlist_entry_position'),
+        ]
+
+    def __str__(self):
+        return f"{self.position}: {self.song_id}"
+
+
+class SetlistOp(models.Model):
+    """
+    An edit made to a Setlist through bandshare.collab, numbered seq, as it
+    was applied: {"op": "add" | "remove" | "move", "song": id, "from": index,
+    "position": index}. Only the most recent are kept; see collab.compact().
+    """
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Indexed by the unique_setlist_op constraint.
+    setlist = models.ForeignKey('Setlist', on_delete=models.CASCADE, related_name='ops', db_index=False)
+    seq = models.PositiveIntegerField()
+    op = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['setlist', 'seq'], name='unique_setlist_op'),
+        ]
+
+    def __str__(self):
+        return f"{self.setlist_id}#{self.seq}"
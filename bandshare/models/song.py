@@ -49,6 +49,13 @@ class TimeSignature(models.TextChoices):
 MIN_BPM = 40
 MAX_BPM = 300
 
+
+def format_length(duration):
+    "Formats a timedelta as m:ss, or h:mm:ss from an hour up, to the nearest second."
+    minutes, seconds = divmod(round(duration.total_seconds()), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
 class Song(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -67,14 +74,31 @@ class Song(models.Model):
         validators=[MaxValueValidator(timedelta(minutes=60))]
     )
 
+    class Meta:
+        indexes = [
+            # Range scans for bandshare.harmony.compatible_songs().
+            models.Index(fields=['musical_key', 'time_signature', 'bpm'], name='song_key_meter_bpm'),
+            # Keyset pagination in bandshare.api.
+            models.Index(fields=['created_at', 'id'], name='song_created'),
+            # Title lookups and sorting, BPM ranges (song search) and release date ranges.
+            # See benchmarks/query_plans.py.
+            models.Index(fields=['title'], name='song_title'),
+            models.Index(fields=['bpm'], name='song_bpm'),
+            models.Index(fields=['release_date'], name='song_release_date'),
+        ]
+
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        song = super().from_db(db, field_names, values)
+        # The artist as loaded, so a save that changes it can move the song between Artist.song_counts.
+        song._loaded_artist_id = song.__dict__.get('artist_id')
+        return song
+
     @property
     def length(self):
-        """Returns a string of the song's runtime."""
-        minutes = int(self.duration_seconds.total_seconds()) // 60
-        seconds = self.duration_seconds.seconds
-        ms = self.duration_seconds.microseconds
-        return f"{minutes}:{seconds}:{ms}"
+        """Returns the song's runtime as m:ss."""
+        return format_length(self.duration_seconds)
 
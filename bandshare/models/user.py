@@ -20,6 +20,11 @@ class User(models.Model):
     instruments = models.ManyToManyField('Instrument', blank=True)
     location = models.ForeignKey('Location', on_delete=models.SET_NULL, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='user_created'),
+        ]
+
     @property
     def age(self):
         "Returns the number of years between birth_date and today."
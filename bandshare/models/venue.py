@@ -0,0 +1,64 @@
+from django.core.exceptions import ValidationError
+from django.db import models
+
+
+class Venue(models.Model):
+    """
+    A place that books Groups, at a Location.
+
+    genre_bits packs the ids of the genres it books into a bitset (bit N set
+    means genre N), like MusicianIndex, so searches test a venue's genres
+    without joining through the M2M table. Kept up to date by
+    bandshare.signals; see bandshare.search.venues.
+    """
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    name = models.CharField(max_length=256)
+    description = models.CharField(max_length=512, blank=True)
+    location = models.ForeignKey('Location', on_delete=models.PROTECT, related_name='venues')
+    capacity = models.PositiveIntegerField()
+    stage_width = models.DecimalField(max_digits=4, decimal_places=1, blank=True, null=True, help_text="Metres.")
+    stage_depth = models.DecimalField(max_digits=4, decimal_places=1, blank=True, null=True, help_text="Metres.")
+    stage_notes = models.CharField(max_length=1024, blank=True, help_text="PA, backline, load-in, etc.")
+
+    genres = models.ManyToManyField('Genre', blank=True, related_name='venues')
+    genre_bits = models.BinaryField(default=b'', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='venue_created'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Gig(models.Model):
+    "A Group playing a Venue on a date, optionally with the Setlist they play."
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Indexed by gig_venue_date.
+    venue = models.ForeignKey('Venue', on_delete=models.CASCADE, related_name='gigs', db_index=False)
+    date = models.DateField()
+    start_time = models.TimeField(blank=True, null=True)
+    end_time = models.TimeField(blank=True, null=True)
+    group = models.ForeignKey('Group', on_delete=models.CASCADE, related_name='gigs', db_index=False)
+    setlist = models.ForeignKey('Setlist', on_delete=models.SET_NULL, blank=True, null=True, related_name='gigs')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='gig_created'),
+            # A venue's calendar, and which of many venues are booked over a range of dates
+            # (search.venues.open_dates): a range scan per venue that reads nothing but the index.
+            models.Index(fields=['venue', 'date'], name='gig_venue_date'),
+            models.Index(fields=['group', 'date'], name='gig_group_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} at {self.venue_id}"
+
+    def clean(self):
+        if self.setlist_id and self.group_id and self.setlist.owner_group_id != self.group_id:
+            raise ValidationError({'setlist': "Must be one of the group's setlists."})
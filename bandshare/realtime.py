@@ -0,0 +1,275 @@
+"""
+WebSockets for editing a setlist together (bandshare.collab), served by
+config.asgi next to the Django app:
+
+    ws://host/ws/setlists/<id>/?since=<seq>
+
+On connecting a client gets the ops since the seq it last saw, or a snapshot
+of the setlist without one. From then on every socket on the setlist is sent
+each op as it is applied. JSON text frames, client to server:
+
+    {"op": "move", "song": 12, "position": 0, "base": 41, "id": "c7"}
+
+base is the seq the client's copy is at and id anything it wants echoed.
+Server to client:
+
+    {"type": "snapshot", "setlist": 3, "seq": 41, "songs": [...]}
+    {"type": "op", "setlist": 3, "seq": 42, "op": "move", "song": 12, "from": 5, "position": 0}
+    {"type": "ack", "id": "c7", "seq": 42, "applied": true}
+    {"type": "error", "id": "c7", "code": "invalid", "error": "..."}
+
+Clients apply ops in seq order, ignoring any at or below their seq. Each
+socket is sent the ops without gaps: an op that arrives ahead of one still
+on its way from another server process is preceded by the missing ops, read
+from the log. An error with code "stale" is followed by a snapshot; one with
+code "unavailable" means the op couldn't be saved and may be sent again. A
+socket that falls SEND_QUEUE messages behind is closed with code 4008 and
+should reconnect with ?since=.
+
+Broadcasts go through a channel layer, BANDSHARE_CHANNEL_LAYER: by default
+InMemoryChannelLayer, which only reaches sockets connected to the same
+process; config.production uses RedisChannelLayer when REDIS_URL is set.
+Each broadcast is encoded once, however many sockets get it.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import weakref
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, close_old_connections
+from django.utils.module_loading import import_string
+
+from . import collab
+from .models import Setlist
+
+PATH = re.compile(r'^/ws/setlists/(\d+)/$')
+SEND_QUEUE = 256
+CLOSE_NOT_FOUND = 4404
+CLOSE_TOO_SLOW = 4008
+CLOSE_INTERNAL_ERROR = 1011
+DEFAULT_CHANNEL_LAYER = 'bandshare.realtime.InMemoryChannelLayer'
+
+logger = logging.getLogger(__name__)
+
+
+def encode(message):
+    return json.dumps(message, cls=DjangoJSONEncoder)
+
+
+class InMemoryChannelLayer:
+    "Groups of sockets in this process."
+
+    def __init__(self):
+        self.groups = defaultdict(set)
+
+    async def group_add(self, group, connection):
+        self.groups[group].add(connection)
+
+    async def group_discard(self, group, connection):
+        members = self.groups.get(group)
+        if members is not None:
+            members.discard(connection)
+            if not members:
+                del self.groups[group]
+
+    async def group_send(self, group, message):
+        self.deliver(group, message['seq'], encode(message))
+
+    def deliver(self, group, seq, text):
+        for connection in list(self.groups.get(group, ())):
+            connection.push(text, seq)
+
+
+class RedisChannelLayer(InMemoryChannelLayer):
+    """
+    Publishes broadcasts to Redis (REDIS_URL), so they reach the sockets of
+    every server process; each process delivers what it hears to its own.
+    """
+    PREFIX = 'bandshare.ws:'
+
+    def __init__(self, url=None):
+        super().__init__()
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url or os.environ['REDIS_URL'])
+        self.listener = None
+
+    async def group_add(self, group, connection):
+        await super().group_add(group, connection)
+        if self.listener is None:
+            self.listener = asyncio.create_task(self.listen())
+
+    async def group_send(self, group, message):
+        await self.redis.publish(self.PREFIX + group, encode(message))
+
+    async def listen(self):
+        pubsub = self.redis.pubsub()
+        await pubsub.psubscribe(self.PREFIX + '*')
+        async for item in pubsub.listen():
+            if item['type'] == 'pmessage':
+                text = item['data'].decode()
+                self.deliver(item['channel'].decode()[len(self.PREFIX):], json.loads(text)['seq'], text)
+
+
+_layer = None
+
+
+def channel_layer():
+    global _layer
+    if _layer is None:
+        _layer = import_string(getattr(settings, 'BANDSHARE_CHANNEL_LAYER', DEFAULT_CHANNEL_LAYER))()
+    return _layer
+
+
+def database(fn):
+    "fn as a coroutine, run like a request: on Django's thread for sync code, with stale connections closed."
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(call)
+
+
+class Connection:
+    """
+    One socket's outgoing messages, sent in order by its own task so a slow
+    client holds up no one else. seq is that of the last op the socket was sent.
+    """
+
+    def __init__(self, send, setlist_id=None, seq=0):
+        self.send = send
+        self.setlist_id = setlist_id
+        self.seq = seq
+        self.queue = asyncio.Queue(SEND_QUEUE)
+        self.close_code = None
+
+    def push(self, text, seq=None):
+        "Queues a message; one with a seq is an op, skipped if already sent."
+        try:
+            self.queue.put_nowait((seq, text))
+        except asyncio.QueueFull:
+            self.close(CLOSE_TOO_SLOW)
+
+    def close(self, code):
+        "Closes the socket with code, dropping anything not yet sent."
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.close_code = code
+        self.queue.put_nowait(None)
+
+    async def run(self):
+        while (item := await self.queue.get()) is not None:
+            seq, text = item
+            if seq is not None and seq > self.seq + 1:
+                # Ahead of an op still being broadcast by another process.
+                try:
+                    missed = await database(collab.catch_up)(self.setlist_id, self.seq)
+                except Setlist.DoesNotExist:
+                    self.close_code = CLOSE_NOT_FOUND
+                    break
+                except DatabaseError:
+                    logger.exception("Couldn't read the ops missed by a socket on setlist %s.", self.setlist_id)
+                    self.close_code = CLOSE_INTERNAL_ERROR
+                    break
+                for message in missed:
+                    await self.send({'type': 'websocket.send', 'text': encode(message)})
+                    self.seq = max(self.seq, message['seq'])
+            if seq is not None:
+                if seq <= self.seq:
+                    continue
+                self.seq = seq
+            await self.send({'type': 'websocket.send', 'text': text})
+        await self.send({'type': 'websocket.close', 'code': self.close_code})
+
+
+# Ops are applied and broadcast one at a time per setlist, so this process sends them in seq order.
+_locks = weakref.WeakValueDictionary()
+
+
+def _apply(setlist_id, message, base):
+    "collab.apply(), and the op's broadcast message if it did something."
+    seq, op = collab.apply(setlist_id, message, base)
+    return seq, op and collab.messages(setlist_id, [(seq, op)])[0]
+
+
+async def _handle(setlist_id, connection, text):
+    try:
+        message = json.loads(text)
+    except ValueError:
+        message = None
+    client_id = message.get('id') if isinstance(message, dict) else None
+    try:
+        try:
+            base = message.get('base') if isinstance(message, dict) else None
+            if base is not None and not isinstance(base, int):
+                raise collab.Rejected("base must be an integer")
+            lock = _locks.get(setlist_id)
+            if lock is None:
+                lock = _locks[setlist_id] = asyncio.Lock()
+            async with lock:
+                seq, broadcast = await database(_apply)(setlist_id, message, base)
+                if broadcast:
+                    await channel_layer().group_send(f'setlist.{setlist_id}', broadcast)
+        except collab.Rejected as e:
+            connection.push(encode({'type': 'error', 'id': client_id, 'code': e.code, 'error': str(e)}))
+            if e.code == 'stale':
+                for catch_up in await database(collab.catch_up)(setlist_id):
+                    connection.push(encode(catch_up))
+            return
+    except Setlist.DoesNotExist:
+        connection.close(CLOSE_NOT_FOUND)
+        return
+    except DatabaseError:
+        logger.exception("Couldn't apply an op to setlist %s.", setlist_id)
+        connection.push(encode({'type': 'error', 'id': client_id, 'code': 'unavailable',
+                                'error': "The setlist couldn't be saved; try again."}))
+        return
+    connection.push(encode({'type': 'ack', 'id': client_id, 'seq': seq, 'applied': broadcast is not None}))
+
+
+async def application(scope, receive, send):
+    "The ASGI application for websocket scopes."
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    match = PATH.match(scope['path'])
+    since = parse_qs(scope.get('query_string', b'').decode()).get('since')
+    if not match or (since and not since[0].isdigit()):
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    setlist_id, since = int(match[1]), int(since[0]) if since else None
+
+    connection = Connection(send, setlist_id)
+    group = f'setlist.{setlist_id}'
+    # Joined first so nothing applied while catching up is missed; clients skip what they already have.
+    await channel_layer().group_add(group, connection)
+    writer = None
+    try:
+        try:
+            catch_up = await database(collab.catch_up)(setlist_id, since)
+        except Setlist.DoesNotExist:
+            await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+            return
+        await send({'type': 'websocket.accept'})
+        for message in catch_up:
+            await send({'type': 'websocket.send', 'text': encode(message)})
+        connection.seq = catch_up[-1]['seq'] if catch_up else since
+        writer = asyncio.create_task(connection.run())
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                break
+            if event['type'] == 'websocket.receive' and (event.get('text') or event.get('bytes')):
+                await _handle(setlist_id, connection, event.get('text') or event['bytes'].decode())
+    finally:
+        await channel_layer().group_discard(group, connection)
+        if writer is not None:
+            writer.cancel()
@@ -0,0 +1,180 @@
+"""
+Group <-> musician recommendations.
+
+Scoring is done in batches with NumPy over dense 0/1 genre and instrument
+matrices built from the M2M through tables (memberships are kept as index
+pairs), never by looping over ORM objects. score_all() is meant
+to run nightly (see the score_recommendations command) and replaces the
+Recommendation table; the read functions below only touch that table.
+
+A candidate's score for a group is the weighted sum of:
+    genre     - fraction of the group's genres the user also likes
+    gap       - 1 if the user plays an instrument no member covers yet
+    proximity - 1 if the user and group share a Location, falling off linearly
+                to 0 at PROXIMITY_RADIUS_KM when both Locations have coordinates
+"""
+import numpy as np
+from django.db import transaction
+
+from . import geo
+from .models import User, Group, GroupMembership, Instrument, Location, Recommendation
+
+GENRE_WEIGHT = 1.0
+GAP_WEIGHT = 0.5
+PROXIMITY_WEIGHT = 0.75
+PROXIMITY_RADIUS_KM = 80
+
+
+def _index(ids):
+    return {id_: i for i, id_ in enumerate(ids)}
+
+
+def _matrix(pairs, rows, cols):
+    "Returns a float32 (len(rows), len(cols)) matrix with 1 at each (row, col) pair."
+    matrix = np.zeros((len(rows), len(cols)), dtype=np.float32)
+    cells = [(rows[a], cols[b]) for a, b in pairs if a in rows and b in cols]
+    if cells:
+        r, c = zip(*cells)
+        matrix[list(r), list(c)] = 1
+    return matrix
+
+
+class ScoringData:
+    "Dense arrays for every group and user, loaded with a fixed number of queries."
+
+    def __init__(self):
+        group_rows = list(Group.objects.order_by('id').values_list('id', 'location_id'))
+        user_rows = list(User.objects.order_by('id').values_list('id', 'location_id'))
+        self.group_ids = np.array([g for g, _ in group_rows], dtype=np.int64)
+        self.user_ids = np.array([u for u, _ in user_rows], dtype=np.int64)
+        # Missing locations get different sentinels so they never match each other.
+        self.group_locations = np.array([loc or -1 for _, loc in group_rows], dtype=np.int64)
+        self.user_locations = np.array([loc or -2 for _, loc in user_rows], dtype=np.int64)
+
+        # Coordinates in radians; NaN where unknown so distances come out NaN.
+        coordinates = {loc: (lat, lon) for loc, lat, lon in
+                       Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+                       .values_list('id', 'latitude', 'longitude')}
+        nowhere = (np.nan, np.nan)
+        self.group_coordinates = np.radians(np.array(
+            [coordinates.get(loc, nowhere) for _, loc in group_rows], dtype=np.float64).reshape(-1, 2))
+        self.user_coordinates = np.radians(np.array(
+            [coordinates.get(loc, nowhere) for _, loc in user_rows], dtype=np.float64).reshape(-1, 2))
+        groups, users = _index(self.group_ids.tolist()), _index(self.user_ids.tolist())
+
+        genre_pairs = list(Group.genres.through.objects.values_list('group_id', 'genre_id'))
+        user_genre_pairs = list(User.genres.through.objects.values_list('user_id', 'genre_id'))
+        genres = _index(sorted({g for _, g in genre_pairs} | {g for _, g in user_genre_pairs}))
+        self.group_genres = _matrix(genre_pairs, groups, genres)
+        self.user_genres = _matrix(user_genre_pairs, users, genres)
+
+        instrument_names = dict(Instrument.objects.values_list('id', 'name'))
+        instruments = _index(sorted(instrument_names))
+        self.user_instruments = _matrix(list(User.instruments.through.objects.values_list('user_id', 'instrument_id')),
+                                        users, instruments)
+
+        # Memberships stay as (group, user) index pairs sorted by group; a dense
+        # groups x users mask would outgrow everything else here.
+        memberships = list(GroupMembership.objects.values_list('group_id', 'member_id', 'role'))
+        pairs = sorted((groups[g], users[m]) for g, m, _ in memberships if g in groups and m in users)
+        self.member_groups = np.array([g for g, _ in pairs], dtype=np.int64)
+        self.member_users = np.array([u for _, u in pairs], dtype=np.int64)
+
+        # An instrument is covered if a member plays it or a member's role names it.
+        covered = np.zeros((len(groups), len(instruments)), dtype=bool)
+        if pairs:
+            starts = np.flatnonzero(np.diff(self.member_groups, prepend=-1))
+            covered[self.member_groups[starts]] = np.logical_or.reduceat(
+                self.user_instruments[self.member_users] > 0, starts, axis=0)
+        role_columns = {}
+        for group_id, _, role in memberships:
+            if role not in role_columns:
+                role_columns[role] = [instruments[i] for i, name in instrument_names.items()
+                                      if name.lower() in role.lower()]
+            covered[groups[group_id], role_columns[role]] = True
+        self.missing_instruments = (~covered).astype(np.float32)
+
+    def score(self, start, stop):
+        "Returns the (stop - start, n_users) score matrix for a slice of groups."
+        group_genres = self.group_genres[start:stop]
+        genre = (group_genres @ self.user_genres.T) / np.maximum(group_genres.sum(axis=1, keepdims=True), 1)
+        gap = (self.missing_instruments[start:stop] @ self.user_instruments.T) > 0
+        proximity = np.maximum(self.group_locations[start:stop, None] == self.user_locations[None, :],
+                               self._nearness(start, stop))
+
+        scores = GENRE_WEIGHT * genre + GAP_WEIGHT * gap + PROXIMITY_WEIGHT * proximity
+        lo, hi = np.searchsorted(self.member_groups, [start, stop])
+        scores[self.member_groups[lo:hi] - start, self.member_users[lo:hi]] = 0
+        return scores
+
+    def _nearness(self, start, stop):
+        "1 - distance / PROXIMITY_RADIUS_KM, clipped to [0, 1], with 0 for unknown locations."
+        lat1, lon1 = self.group_coordinates[start:stop, 0:1], self.group_coordinates[start:stop, 1:2]
+        lat2, lon2 = self.user_coordinates[None, :, 0], self.user_coordinates[None, :, 1]
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        distance = 2 * geo.EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        return np.nan_to_num(np.clip(1 - distance / PROXIMITY_RADIUS_KM, 0, 1), nan=0.0)
+
+
+def _top_k(scores, k):
+    "Returns the column indexes of the k best scores for each row, unordered."
+    k = min(k, scores.shape[1])
+    if k == scores.shape[1]:
+        return np.broadcast_to(np.arange(k), (scores.shape[0], k))
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def score_all(per_group=50, per_user=20, chunk_size=64, batch_size=5000):
+    """
+    Scores every group against every user and replaces the Recommendation
+    table with each group's best per_group users and each user's best
+    per_user groups. Returns the number of rows written.
+    """
+    data = ScoringData()
+    n_groups, n_users = len(data.group_ids), len(data.user_ids)
+    pairs = {}
+
+    # Running best groups for every user, merged chunk by chunk.
+    user_best_scores = np.zeros((n_users, 0), dtype=np.float32)
+    user_best_groups = np.zeros((n_users, 0), dtype=np.int64)
+
+    for start in range(0, n_groups, chunk_size):
+        scores = data.score(start, min(start + chunk_size, n_groups))
+        rows = np.arange(scores.shape[0])[:, None]
+
+        best_users = _top_k(scores, per_group)
+        for row, cols in zip(rows[:, 0].tolist(), best_users.tolist()):
+            for col, score in zip(cols, scores[row, cols].tolist()):
+                if score > 0:
+                    pairs[(start + row, col)] = score
+
+        merged_scores = np.concatenate([user_best_scores, scores.T], axis=1)
+        merged_groups = np.concatenate([user_best_groups, np.broadcast_to(start + rows.T, (n_users, scores.shape[0]))],
+                                       axis=1)
+        keep = _top_k(merged_scores, per_user)
+        user_best_scores = np.take_along_axis(merged_scores, keep, axis=1)
+        user_best_groups = np.take_along_axis(merged_groups, keep, axis=1)
+
+    for col, (groups, scores) in enumerate(zip(user_best_groups.tolist(), user_best_scores.tolist())):
+        for row, score in zip(groups, scores):
+            if score > 0:
+                pairs[(row, col)] = score
+
+    group_ids, user_ids = data.group_ids.tolist(), data.user_ids.tolist()
+    rows = [Recommendation(group_id=group_ids[g], user_id=user_ids[u], score=s) for (g, u), s in pairs.items()]
+    with transaction.atomic():
+        Recommendation.objects.all().delete()
+        Recommendation.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def recommended_users(group, limit=20):
+    "Returns a list of (User, score) for a Group, best first."
+    return [(r.user, r.score) for r in
+            Recommendation.objects.filter(group=group).select_related('user').order_by('-score', 'user_id')[:limit]]
+
+
+def recommended_groups(user, limit=20):
+    "Returns a list of (Group, score) for a User, best first."
+    return [(r.group, r.score) for r in
+            Recommendation.objects.filter(user=user).select_related('group').order_by('-score', 'group_id')[:limit]]
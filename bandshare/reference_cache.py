@@ -0,0 +1,178 @@
+"""
+Read-through caches for small, read-mostly reference tables.
+
+Each ReferenceCache has two tiers: a dict in this process and the Django
+default cache shared between processes. Shared entries are stored as
+(version, object); saving or deleting any row bumps the model's version once
+the transaction commits, so every older entry becomes a miss without having
+to find and delete it. The
+process tier re-checks the version at most every local_ttl seconds, which
+bounds how stale another process's edit can look.
+
+get_many() resolves any number of ids with at most one shared cache round
+trip and one query for whatever is missing from both tiers.
+
+Cached objects are shared between callers and must be treated as read-only.
+"""
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+
+from .models import Artist, Genre, Instrument
+
+
+def _new_version():
+    "A starting version that won't match entries left over from an evicted version key."
+    return time.time_ns()
+
+
+class ReferenceCache:
+    def __init__(self, model, local_ttl=30, timeout=60 * 60):
+        self.model = model
+        self.prefix = f'bandshare:ref:{model._meta.label_lower}'
+        self.version_key = f'{self.prefix}:version'
+        self.local_ttl = local_ttl
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._ids_by_name = {}
+        self._version = None
+        self._checked = 0.0
+        self.local_hits = self.shared_hits = self.misses = 0
+
+    def _id_key(self, pk):
+        return f'{self.prefix}:id:{pk}'
+
+    def _name_key(self, name):
+        return f'{self.prefix}:name:{hashlib.md5(name.encode()).hexdigest()}'
+
+    @property
+    def hit_ratio(self):
+        total = self.local_hits + self.shared_hits + self.misses
+        return (self.local_hits + self.shared_hits) / total if total else 0.0
+
+    def stats(self):
+        return {'local_hits': self.local_hits, 'shared_hits': self.shared_hits, 'misses': self.misses,
+                'hit_ratio': self.hit_ratio}
+
+    def _set_version(self, version):
+        with self._lock:
+            if version != self._version:
+                self._by_id.clear()
+                self._ids_by_name.clear()
+                self._version = version
+            self._checked = time.monotonic()
+
+    def _local_is_fresh(self):
+        return self._version is not None and time.monotonic() - self._checked < self.local_ttl
+
+    def _shared_get(self, keys):
+        "Fetches keys and the current version in one round trip; returns (version, {key: value})."
+        found = cache.get_many([self.version_key, *keys])
+        version = found.pop(self.version_key, None)
+        if version is None:
+            cache.add(self.version_key, _new_version(), None)
+            version = cache.get(self.version_key)
+        self._set_version(version)
+        return version, {k: v[1] for k, v in found.items() if v[0] == version}
+
+    def _store_local(self, version, objects=(), ids_by_name=None):
+        with self._lock:
+            if version != self._version:
+                return
+            for o in objects:
+                self._by_id[o.pk] = o
+                self._ids_by_name[o.name] = o.pk
+            self._ids_by_name.update(ids_by_name or {})
+
+    def _store(self, version, objects):
+        if objects:
+            cache.set_many({**{self._id_key(o.pk): (version, o) for o in objects},
+                            **{self._name_key(o.name): (version, o.pk) for o in objects}}, self.timeout)
+        self._store_local(version, objects)
+
+    def get_many(self, ids):
+        "Returns {id: object} for the ids that exist."
+        ids = set(ids)
+        result = {}
+        if self._local_is_fresh():
+            result = {pk: self._by_id[pk] for pk in ids if pk in self._by_id}
+            self.local_hits += len(result)
+        missing = ids - result.keys()
+        if not missing:
+            return result
+
+        keys = {self._id_key(pk): pk for pk in missing}
+        version, found = self._shared_get(keys)
+        shared = {keys[k]: obj for k, obj in found.items()}
+        self.shared_hits += len(shared)
+        result.update(shared)
+
+        self._store_local(version, shared.values())
+
+        missing -= shared.keys()
+        if missing:
+            self.misses += len(missing)
+            loaded = list(self.model.objects.filter(pk__in=missing))
+            self._store(version, loaded)
+            result.update((o.pk, o) for o in loaded)
+        return result
+
+    def get(self, pk):
+        return self.get_many([pk]).get(pk)
+
+    def ids_for_names(self, names):
+        "Returns {name: id} for the names that exist."
+        names = set(names)
+        result = {}
+        if self._local_is_fresh():
+            result = {n: self._ids_by_name[n] for n in names if n in self._ids_by_name}
+            self.local_hits += len(result)
+        missing = names - result.keys()
+        if not missing:
+            return result
+
+        keys = {self._name_key(n): n for n in missing}
+        version, found = self._shared_get(keys)
+        shared = {keys[k]: pk for k, pk in found.items()}
+        self.shared_hits += len(shared)
+        result.update(shared)
+        self._store_local(version, ids_by_name=shared)
+
+        missing -= shared.keys()
+        if missing:
+            self.misses += len(missing)
+            loaded = list(self.model.objects.filter(name__in=missing))
+            self._store(version, loaded)
+            result.update((o.name, o.pk) for o in loaded)
+        return result
+
+    def get_by_name(self, name):
+        pk = self.ids_for_names([name]).get(name)
+        return None if pk is None else self.get(pk)
+
+    def invalidate(self):
+        "Makes every cached entry for this model stale, in every process."
+        try:
+            version = cache.incr(self.version_key)
+        except ValueError:
+            version = _new_version()
+            cache.set(self.version_key, version, None)
+        self._set_version(version)
+
+    def clear_local(self):
+        self._set_version(None)
+
+
+genres = ReferenceCache(Genre)
+instruments = ReferenceCache(Instrument)
+artists = ReferenceCache(Artist)
+
+BY_MODEL = {Genre: genres, Instrument: instruments, Artist: artists}
+
+
+def all_stats():
+    "Returns hit/miss counters for every reference cache in this process."
+    return {model._meta.model_name: ref.stats() for model, ref in BY_MODEL.items()}
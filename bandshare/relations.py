@@ -0,0 +1,192 @@
+"""
+Bulk changes to many-to-many relations.
+
+Every call diffs what is wanted against the current rows (one query) and
+then writes with at most one bulk_create and one DELETE, plus one role
+update for memberships, however many rows are involved (a DELETE is split
+only past the database's parameter limit). Memberships are deleted with a
+plain DELETE, so without post_delete; their member counts are updated here.
+Re-syncing an unchanged relation costs just the read.
+
+m2m_changed is sent the way the related managers send it (pre_/post_add,
+pre_/post_remove), so signal handlers such as the musician index stay in
+sync. For relations touching many objects on both sides the signals are
+grouped by whichever side has fewer objects, using reverse=True when that
+is the target side.
+
+Relations are given as descriptors: Song.genres, Group.genres, User.genres,
+User.instruments. Objects may be given as instances or ids.
+"""
+from collections import Counter, namedtuple
+
+from django.db import connection, transaction
+from django.db.models.signals import m2m_changed
+
+from . import counters, response_cache
+from .models import Group, GroupMembership
+
+Changes = namedtuple('Changes', 'added removed updated', defaults=(0,))
+
+
+def _pk(obj):
+    return getattr(obj, 'pk', obj)
+
+
+class _Relation:
+    "Column names and models for the two sides of a many-to-many descriptor."
+
+    def __init__(self, descriptor):
+        field = descriptor.field
+        self.through = descriptor.through
+        self.source_model = field.model
+        self.target_model = field.related_model
+        self.source = self.through._meta.get_field(field.m2m_field_name()).attname
+        self.target = self.through._meta.get_field(field.m2m_reverse_field_name()).attname
+        self._instances = {self.source_model: {}, self.target_model: {}}
+
+    def current(self, source_ids):
+        "Returns {(source_id, target_id): through row id}."
+        rows = self.through.objects.filter(**{f'{self.source}__in': source_ids}) \
+            .values_list('id', self.source, self.target)
+        return {(source, target): pk for pk, source, target in rows}
+
+    def send(self, action, pairs):
+        "Sends m2m_changed for (source_id, target_id) pairs, grouped by the smaller side."
+        if not pairs:
+            return
+        by_source, by_target = {}, {}
+        for source, target in pairs:
+            by_source.setdefault(source, set()).add(target)
+            by_target.setdefault(target, set()).add(source)
+        reverse = len(by_target) < len(by_source)
+        grouped, model, pk_model = (by_target, self.target_model, self.source_model) if reverse else \
+            (by_source, self.source_model, self.target_model)
+        instances = self._instances[model]
+        missing = grouped.keys() - instances.keys()
+        if missing:
+            instances.update(model.objects.in_bulk(missing))
+        for pk, pk_set in grouped.items():
+            if pk in instances:
+                m2m_changed.send(sender=self.through, action=action, instance=instances[pk], reverse=reverse,
+                                 model=pk_model, pk_set=pk_set, using=self.through.objects.db)
+
+
+def _delete(relation, remove):
+    "Deletes the through rows {(source_id, target_id): row id} in remove."
+    if relation.through is not GroupMembership:
+        # No delete signals, so already a single DELETE.
+        relation.through.objects.filter(pk__in=remove.values()).delete()
+        return
+    # delete() would load every membership to send post_delete; the rows go
+    # in a plain DELETE instead, the member counts are taken off here, and
+    # post_remove invalidates the pages.
+    ids = list(remove.values())
+    table = connection.ops.quote_name(GroupMembership._meta.db_table)
+    batch = connection.ops.bulk_batch_size(['id'], ids)
+    with connection.cursor() as cursor:
+        for i in range(0, len(ids), batch):
+            chunk = ids[i:i + batch]
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+    removed = Counter(group for group, _ in remove)
+    counters.increment(Group, 'member_count', {group: -n for group, n in removed.items()})
+
+
+def _write(relation, add, remove):
+    "Creates links for the pairs in add and deletes the through rows {pair: row id} in remove."
+    add = sorted(add)
+    if not add and not remove:
+        return Changes(0, 0)
+    with transaction.atomic(), counters.deferred():
+        relation.send('pre_remove', list(remove))
+        relation.send('pre_add', add)
+        if remove:
+            _delete(relation, remove)
+        if add:
+            relation.through.objects.bulk_create([
+                relation.through(**{relation.source: source, relation.target: target})
+                for source, target in add
+            ])
+        relation.send('post_remove', list(remove))
+        relation.send('post_add', add)
+    return Changes(len(add), len(remove))
+
+
+def _wanted(links):
+    return {(_pk(source), _pk(target)) for source, targets in links.items() for target in targets}
+
+
+def add_links(descriptor, links):
+    "Adds links {source: [targets]}, skipping those that exist. Returns Changes."
+    relation = _Relation(descriptor)
+    wanted = _wanted(links)
+    current = relation.current({source for source, _ in wanted})
+    return _write(relation, wanted - current.keys(), {})
+
+
+def remove_links(descriptor, links):
+    "Removes links {source: [targets]}. Returns Changes."
+    relation = _Relation(descriptor)
+    unwanted = _wanted(links)
+    current = relation.current({source for source, _ in unwanted})
+    return _write(relation, (), {pair: pk for pair, pk in current.items() if pair in unwanted})
+
+
+def set_links(descriptor, links):
+    "Makes each source's targets exactly those in links {source: [targets]}. Returns Changes."
+    relation = _Relation(descriptor)
+    wanted = _wanted(links)
+    current = relation.current({_pk(source) for source in links})
+    return _write(relation, wanted - current.keys(),
+                  {pair: pk for pair, pk in current.items() if pair not in wanted})
+
+
+def _sync_members(group, roles, remove_others):
+    roles = {_pk(user): role for user, role in roles.items()}
+    current = {m.member_id: m for m in GroupMembership.objects.filter(group=group).only('id', 'member_id', 'role')}
+    relation = _Relation(Group.members)
+    relation._instances[Group][group.pk] = group
+
+    changed = [m for user, m in current.items() if user in roles and m.role != roles[user]]
+    for m in changed:
+        m.role = roles[m.member_id]
+    added = [user for user in roles if user not in current]
+    removed = {(group.pk, user): m.pk for user, m in current.items() if remove_others and user not in roles}
+    if not (changed or added or removed):
+        return Changes(0, 0, 0)
+
+    with transaction.atomic(), counters.deferred():
+        relation.send('pre_remove', list(removed))
+        relation.send('pre_add', [(group.pk, user) for user in added])
+        if removed:
+            _delete(relation, removed)
+        if added:
+            GroupMembership.objects.bulk_create([
+                GroupMembership(group_id=group.pk, member_id=user, role=roles[user]) for user in added
+            ])
+        if changed:
+            GroupMembership.objects.bulk_update(changed, ['role'], batch_size=1000)
+        # bulk_update() sends no signals; the group page shows roles.
+        response_cache.invalidate(f'group:{group.pk}')
+        relation.send('post_remove', list(removed))
+        relation.send('post_add', [(group.pk, user) for user in added])
+    return Changes(len(added), len(removed), len(changed))
+
+
+def add_members(group, roles):
+    "Adds members {user: role} to group, updating the role of existing members. Returns Changes."
+    return _sync_members(group, roles, remove_others=False)
+
+
+def set_members(group, roles):
+    "Makes group's roster exactly {user: role}. Returns Changes."
+    return _sync_members(group, roles, remove_others=True)
+
+
+def remove_members(group, users):
+    "Removes users from group. Returns Changes."
+    users = {_pk(user) for user in users}
+    relation = _Relation(Group.members)
+    relation._instances[Group][group.pk] = group
+    removed = dict(((group.pk, user), pk) for pk, user in
+                   GroupMembership.objects.filter(group=group, member__in=users).values_list('id', 'member_id'))
+    return _write(relation, (), removed)
@@ -0,0 +1,123 @@
+"""
+Per-object response caching with tag-based invalidation and conditional GET.
+
+A view wrapped with @cached(key_tags) is rendered once and its response
+stored in the default cache together with the versions of the tags it
+depends on, such as "setlist:12" and "song:345" for every song in the
+setlist. invalidate("song:345") (sent by the signal handlers once the
+transaction commits) gives the tag a new version, which makes every
+response that depends on it stale and nothing else. A fresh entry is served
+without touching the database.
+
+Tag versions are time_ns() stamps, so they double as modification times:
+responses carry an ETag built from the object's updated_at and the tag
+versions, and a Last-Modified of the later of the two. A client sending
+either back gets a 304 while nothing it depends on has changed.
+
+The key tags, known from the URL, are read before the view runs so that an
+edit committed while the page was being rendered can't be stored under the
+new version; the dependency tags the view adds are read afterwards.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+DEFAULT_TIMEOUT = 60 * 60
+PREFIX = 'bandshare:response'
+
+
+def _tag_key(tag):
+    return f'{PREFIX}:tag:{tag}'
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def tag_versions(tags):
+    "Returns {tag: version}, starting a version for tags that have none (new, or evicted)."
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys.keys() - found.keys()}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, None)
+        found.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in found.items()}
+
+
+def _bump(tags):
+    cache.set_many({_tag_key(tag): _new_version() for tag in tags}, None)
+
+
+def invalidate(*tags):
+    "Makes every response depending on any of tags stale, once the current transaction commits."
+    transaction.on_commit(lambda: _bump(tags))
+
+
+def tagged(response, updated_at, tags=()):
+    "Marks a view's response with the object's updated_at and the extra tags it depends on."
+    response.cache_updated_at = updated_at
+    response.cache_tags = set(tags)
+    return response
+
+
+def _validators(updated_at, versions):
+    digest = hashlib.md5(updated_at.isoformat().encode())
+    for tag in sorted(versions):
+        digest.update(f'|{tag}={versions[tag]}'.encode())
+    # Whole seconds, as HTTP dates have no finer resolution.
+    last_modified = int(max(updated_at.timestamp(), max(versions.values(), default=0) / 1e9))
+    return f'"{digest.hexdigest()}"', last_modified
+
+
+def _respond(request, content, content_type, etag, last_modified):
+    response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return get_conditional_response(request, etag, last_modified, response)
+
+
+def cached(key_tags):
+    """
+    Caches a GET view per URL. key_tags(**view_kwargs) returns the tags of the
+    object the page is for; the view returns tagged(response, ...).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            entry_key = f'{PREFIX}:{view.__module__}.{view.__name__}:{path}'
+            entry = cache.get(entry_key)
+            if entry is not None:
+                content, content_type, versions, etag, last_modified = entry
+                if tag_versions(versions) == versions:
+                    wrapper.hits += 1
+                    return _respond(request, content, content_type, etag, last_modified)
+
+            wrapper.misses += 1
+            versions = tag_versions(key_tags(**kwargs))
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or not hasattr(response, 'cache_tags'):
+                return response
+            versions.update(tag_versions(response.cache_tags - versions.keys()))
+            etag, last_modified = _validators(response.cache_updated_at, versions)
+            content_type = response['Content-Type']
+            cache.set(entry_key, (response.content, content_type, versions, etag, last_modified),
+                      getattr(settings, 'BANDSHARE_RESPONSE_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+            return _respond(request, response.content, content_type, etag, last_modified)
+
+        wrapper.hits = wrapper.misses = 0
+        return wrapper
+    return decorator
@@ -0,0 +1,4 @@
+from .musicians import search_musicians, index_users, rebuild_index
+from .nearby import locations_within, users_within, groups_within
+from .fulltext import search as search_text, search_objects
+from .venues import open_dates
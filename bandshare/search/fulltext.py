@@ -0,0 +1,343 @@
+"""
+Full-text search over songs, artists, groups and user bios.
+
+Every searchable object is one document with a title (weighted higher) and
+a body:
+
+    song    title: Song.title              body: the artist's name
+    artist  title: Artist.name
+    group   title: Group.name              body: description and bio
+    user    title: User.display_name       body: bio
+
+Documents live in a single index table whose integer key packs the kind and
+the object id (object_id * len(KINDS) + kind code), so updates and deletes
+are key lookups and no join table is needed. Signals keep it in sync; the
+rebuild_search_index command rebuilds it from scratch.
+
+The storage backend depends on the database: SQLite uses an FTS5 table,
+PostgreSQL a tsvector column with a GIN index. BANDSHARE_SEARCH_BACKEND
+(a dotted path) overrides the choice.
+
+Queries match every word, the last one as a prefix ("thro mus" finds
+Throwing Muses). Words that aren't in the index are swapped for indexed
+words within one edit (two for words of 8+ letters) that share their first
+letter, so a typo still finds something. Results are ranked with BM25
+(SQLite) or ts_rank_cd (PostgreSQL).
+"""
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from ..models import Artist, Group, Song, User
+
+TABLE = 'bandshare_search'
+KINDS = ('song', 'artist', 'group', 'user')
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+
+Hit = namedtuple('Hit', 'kind id score')
+
+_WORDS = re.compile(r'\w+')
+
+
+def doc_id(kind, pk):
+    return pk * len(KINDS) + KIND_CODES[kind]
+
+
+def split_doc_id(value):
+    "Returns (kind, object_id) for a document id."
+    pk, code = divmod(value, len(KINDS))
+    return KINDS[code], pk
+
+
+def words(query):
+    return _WORDS.findall(query.lower())
+
+
+def edit_distance(a, b, limit):
+    "Levenshtein distance between a and b, or limit + 1 if it is more than limit."
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def max_edits(word):
+    if len(word) < 4:
+        return 0
+    return 1 if len(word) < 8 else 2
+
+
+class Source:
+    "How to build the documents of one kind from its model."
+
+    def __init__(self, kind, model, title_fields, body_fields=()):
+        self.kind = kind
+        self.model = model
+        self.title_fields = title_fields
+        self.body_fields = body_fields
+
+    def documents(self, limit=None, **filters):
+        "Returns [(doc_id, title, body)] for the matching objects, in id order."
+        fields = (*self.title_fields, *self.body_fields)
+        n = len(self.title_fields)
+        rows = self.model.objects.filter(**filters).order_by('pk').values_list('pk', *fields)[:limit]
+        return [self._document(pk, values, n) for pk, *values in rows]
+
+    def _document(self, pk, values, n):
+        title = ' '.join(v for v in values[:n] if v)
+        body = '\n'.join(v for v in values[n:] if v)
+        return doc_id(self.kind, pk), title, body
+
+
+SOURCES = {
+    'song': Source('song', Song, ('title',), ('artist__name',)),
+    'artist': Source('artist', Artist, ('name',)),
+    'group': Source('group', Group, ('name',), ('description', 'bio')),
+    'user': Source('user', User, ('display_name',), ('bio',)),
+}
+SOURCE_BY_MODEL = {source.model: source for source in SOURCES.values()}
+
+
+class SQLiteBackend:
+    "An FTS5 table (created by migration 0013) plus an fts5vocab table for typo correction."
+
+    vocab_table = TABLE + '_vocab'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def insert(self, documents):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {TABLE} (rowid, title, body) VALUES (%s, %s, %s)', documents)
+
+    def replace(self, documents):
+        if documents:
+            self.delete([d[0] for d in documents])
+            self.insert(documents)
+
+    def delete(self, ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(i,) for i in ids])
+
+    def clear(self, kind=None):
+        with self.connection.cursor() as cursor:
+            if kind is None:
+                cursor.execute(f'DELETE FROM {TABLE}')
+            else:
+                cursor.execute(f'DELETE FROM {TABLE} WHERE rowid %% %s = %s', [len(KINDS), KIND_CODES[kind]])
+
+    def optimize(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+
+    def _known(self, cursor, word, prefix):
+        if prefix:
+            cursor.execute(f'SELECT 1 FROM {self.vocab_table} WHERE term >= %s AND term < %s LIMIT 1',
+                           [word, word + '\U0010ffff'])
+        else:
+            cursor.execute(f'SELECT 1 FROM {self.vocab_table} WHERE term = %s', [word])
+        return cursor.fetchone() is not None
+
+    def _corrections(self, cursor, word, limit=3):
+        edits = max_edits(word)
+        if not edits:
+            return []
+        cursor.execute(f'SELECT term, doc FROM {self.vocab_table} WHERE term >= %s AND term < %s '
+                       f'AND length(term) BETWEEN %s AND %s',
+                       [word[0], word[0] + '\U0010ffff', len(word) - edits, len(word) + edits])
+        close = [(d, -docs, term) for term, docs in cursor.fetchall()
+                 if (d := edit_distance(word, term, edits)) <= edits]
+        return [term for _, _, term in sorted(close)[:limit]]
+
+    def match_expression(self, query, typos=True):
+        "Builds the FTS5 MATCH expression for a query, or None if it has no words."
+        terms = words(query)
+        if not terms:
+            return None
+        groups = []
+        with self.connection.cursor() as cursor:
+            for i, word in enumerate(terms):
+                prefix = i == len(terms) - 1
+                options = [f'"{word}"*' if prefix else f'"{word}"']
+                if typos and not self._known(cursor, word, prefix):
+                    options += [f'"{term}"' for term in self._corrections(cursor, word)]
+                groups.append(options[0] if len(options) == 1 else f"({' OR '.join(options)})")
+        return ' AND '.join(groups)
+
+    def search(self, query, kinds, limit):
+        expression = self.match_expression(query)
+        if expression is None:
+            return []
+        codes = ', '.join(str(KIND_CODES[k]) for k in kinds)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid, bm25({TABLE}, 10.0, 1.0) FROM {TABLE} '
+                           f'WHERE {TABLE} MATCH %s AND rowid %% {len(KINDS)} IN ({codes}) '
+                           f'ORDER BY 2 LIMIT %s', [expression, limit])
+            return [Hit(*split_doc_id(rowid), -rank) for rowid, rank in cursor.fetchall()]
+
+    def id_subquery(self, kind, query):
+        "SQL and params selecting the ids of matching objects of one kind, without typo correction."
+        terms = words(query)
+        expression = ' AND '.join(f'"{w}"*' if i == len(terms) - 1 else f'"{w}"' for i, w in enumerate(terms))
+        return (f'SELECT rowid / {len(KINDS)} FROM {TABLE} WHERE {TABLE} MATCH %s '
+                f'AND rowid %% {len(KINDS)} = {KIND_CODES[kind]}', [expression])
+
+
+class PostgresBackend:
+    """
+    A table with a generated, weighted tsvector and a GIN index (created by
+    migration 0013). Typo correction uses pg_trgm similarity on titles when
+    the full-text query finds nothing.
+    """
+
+    config = 'simple'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def insert(self, documents):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {TABLE} (id, title, body) VALUES (%s, %s, %s)', documents)
+
+    def replace(self, documents):
+        if not documents:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {TABLE} (id, title, body) VALUES (%s, %s, %s) '
+                               f'ON CONFLICT (id) DO UPDATE SET title = EXCLUDED.title, body = EXCLUDED.body',
+                               documents)
+
+    def delete(self, ids):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE} WHERE id = ANY(%s)', [list(ids)])
+
+    def clear(self, kind=None):
+        with self.connection.cursor() as cursor:
+            if kind is None:
+                cursor.execute(f'TRUNCATE {TABLE}')
+            else:
+                cursor.execute(f'DELETE FROM {TABLE} WHERE id %% %s = %s', [len(KINDS), KIND_CODES[kind]])
+
+    def optimize(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'VACUUM ANALYZE {TABLE}')
+
+    def tsquery(self, query):
+        terms = words(query)
+        return ' & '.join(f'{w}:*' if i == len(terms) - 1 else w for i, w in enumerate(terms)) or None
+
+    def search(self, query, kinds, limit):
+        tsquery = self.tsquery(query)
+        if tsquery is None:
+            return []
+        codes = [KIND_CODES[k] for k in kinds]
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'SELECT id, ts_rank_cd(document, q) FROM {TABLE}, to_tsquery(%s, %s) q '
+                           f'WHERE document @@ q AND id %% {len(KINDS)} = ANY(%s) ORDER BY 2 DESC LIMIT %s',
+                           [self.config, tsquery, codes, limit])
+            rows = cursor.fetchall()
+            if not rows:
+                cursor.execute(f'SELECT id, similarity(title, %s) FROM {TABLE} '
+                               f'WHERE title %% %s AND id %% {len(KINDS)} = ANY(%s) ORDER BY 2 DESC LIMIT %s',
+                               [query, query, codes, limit])
+                rows = cursor.fetchall()
+        return [Hit(*split_doc_id(pk), rank) for pk, rank in rows]
+
+    def id_subquery(self, kind, query):
+        return (f'SELECT id / {len(KINDS)} FROM {TABLE} WHERE document @@ to_tsquery(%s, %s) '
+                f'AND id %% {len(KINDS)} = {KIND_CODES[kind]}', [self.config, self.tsquery(query) or ''])
+
+
+BACKENDS = {'sqlite': SQLiteBackend, 'postgresql': PostgresBackend}
+
+
+def get_backend():
+    path = getattr(settings, 'BANDSHARE_SEARCH_BACKEND', None)
+    backend = import_string(path) if path else BACKENDS[connection.vendor]
+    return backend(connection)
+
+
+def search(query, kinds=KINDS, limit=20):
+    "Returns up to limit Hits (kind, id, score) for query, best first."
+    return get_backend().search(query, kinds, limit)
+
+
+def search_objects(query, kinds=KINDS, limit=20):
+    "Like search() but returns (kind, object, score), loading each kind with one query."
+    hits = search(query, kinds, limit)
+    objects = {kind: SOURCES[kind].model.objects.in_bulk([h.id for h in hits if h.kind == kind])
+               for kind in {h.kind for h in hits}}
+    return [(h.kind, objects[h.kind][h.id], h.score) for h in hits if h.id in objects[h.kind]]
+
+
+def matching(queryset, query):
+    """
+    Filters a queryset of a searchable model to the objects matching query
+    (every word, last one as a prefix). Lazy, so it also works with the async ORM.
+    """
+    source = SOURCE_BY_MODEL[queryset.model]
+    if not words(query):
+        return queryset
+    return queryset.filter(pk__in=RawSQL(*get_backend().id_subquery(source.kind, query)))
+
+
+def index(kind, **filters):
+    "(Re)indexes the objects of one kind matching filters."
+    get_backend().replace(SOURCES[kind].documents(**filters))
+
+
+def add(kind, **filters):
+    "Indexes objects of one kind that aren't in the index yet (e.g. after bulk_create())."
+    documents = SOURCES[kind].documents(**filters)
+    if documents:
+        get_backend().insert(documents)
+
+
+def remove(kind, ids):
+    get_backend().delete([doc_id(kind, pk) for pk in ids])
+
+
+def sync(kind, pk):
+    "Indexes one object, or removes it from the index if it no longer exists."
+    documents = SOURCES[kind].documents(pk=pk)
+    if documents:
+        get_backend().replace(documents)
+    else:
+        remove(kind, [pk])
+
+
+def rebuild(kinds=KINDS, batch_size=2000, progress=None):
+    """
+    Rebuilds the index for kinds from the database in batches of batch_size
+    documents, each written in its own transaction. Returns {kind: count}.
+    """
+    backend = get_backend()
+    counts = {}
+    for kind in kinds:
+        source = SOURCES[kind]
+        backend.clear(kind)
+        counts[kind] = 0
+        last = 0
+        while True:
+            batch = source.documents(limit=batch_size, pk__gt=last)
+            if not batch:
+                break
+            with transaction.atomic():
+                backend.insert(batch)
+            counts[kind] += len(batch)
+            last = split_doc_id(batch[-1][0])[1]
+            if progress:
+                progress(kind, counts[kind])
+    backend.optimize()
+    return counts
@@ -0,0 +1,147 @@
+"""
+Musician discovery ("bass players near me who like funk").
+
+Every User has a MusicianIndex row with their location and bitsets of their
+genre and instrument ids. A search reads the rows for one location and does
+the matching with integer bit operations, so the cost does not depend on how
+many genres or instruments each user has. Without a location, the rows are
+first narrowed in SQL to the users linked to the requested genres and
+instruments (the M2M tables are indexed by both), so a search never reads
+every row.
+"""
+import heapq
+
+from .. import reference_cache
+from ..models import User, Location, MusicianIndex
+from .nearby import locations_within
+
+
+def ids_to_bits(ids):
+    "Returns an int with bit N set for every id N."
+    bits = 0
+    for i in ids:
+        bits |= 1 << i
+    return bits
+
+
+def bits_to_bytes(bits):
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def bytes_to_bits(data):
+    return int.from_bytes(bytes(data or b''), 'little')
+
+
+def _resolve_ids(ref_cache, values):
+    "Accepts ids or names and returns a set of ids."
+    ids = {v for v in values if isinstance(v, int)}
+    names = [v for v in values if not isinstance(v, int)]
+    if names:
+        ids.update(ref_cache.ids_for_names(names).values())
+    return ids
+
+
+def _build_rows(user_ids):
+    "Builds unsaved MusicianIndex rows for the given users with three queries."
+    genres = {}
+    for user_id, genre_id in User.genres.through.objects.filter(user_id__in=user_ids) \
+            .values_list('user_id', 'genre_id'):
+        genres.setdefault(user_id, []).append(genre_id)
+
+    instruments = {}
+    for user_id, instrument_id in User.instruments.through.objects.filter(user_id__in=user_ids) \
+            .values_list('user_id', 'instrument_id'):
+        instruments.setdefault(user_id, []).append(instrument_id)
+
+    return [
+        MusicianIndex(user_id=user_id, location_id=location_id,
+                      genre_bits=bits_to_bytes(ids_to_bits(genres.get(user_id, ()))),
+                      instrument_bits=bits_to_bytes(ids_to_bits(instruments.get(user_id, ()))))
+        for user_id, location_id in User.objects.filter(id__in=user_ids).values_list('id', 'location_id')
+    ]
+
+
+def index_users(user_ids):
+    "Recomputes the index rows for the given users."
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    rows = _build_rows(user_ids)
+    MusicianIndex.objects.bulk_create(rows, update_conflicts=True, unique_fields=['user'],
+                                      update_fields=['location', 'genre_bits', 'instrument_bits'])
+
+
+def update_bits(user_id, field, add=(), remove=(), clear=False):
+    "Incrementally sets or clears bits on one user's index row."
+    row, _ = MusicianIndex.objects.get_or_create(user_id=user_id)
+    bits = 0 if clear else bytes_to_bits(getattr(row, field))
+    bits |= ids_to_bits(add)
+    bits &= ~ids_to_bits(remove)
+    setattr(row, field, bits_to_bytes(bits))
+    row.save(update_fields=[field])
+
+
+def rebuild_index(batch_size=1000):
+    "Rebuilds the whole index in batches. Returns the number of users indexed."
+    MusicianIndex.objects.all().delete()
+    count = 0
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.filter(id__gt=last_id).order_by('id')
+                        .values_list('id', flat=True)[:batch_size])
+        if not user_ids:
+            return count
+        MusicianIndex.objects.bulk_create(_build_rows(user_ids))
+        count += len(user_ids)
+        last_id = user_ids[-1]
+
+
+def search_musicians(genres=(), instruments=(), location=None, radius_km=None, match_all=False, limit=20):
+    """
+    Returns a list of (User, score) ranked by how many of the requested genres
+    and instruments each user has.
+
+    genres and instruments may be ids or names. By default a user needs at
+    least one of the requested genres and one of the requested instruments;
+    with match_all they need every one of them. With radius_km, users at any
+    Location within that distance of location are included. Raises
+    ValueError with neither a location nor any genres or instruments.
+    """
+    if location is None and not (genres or instruments):
+        raise ValueError("search_musicians() needs genres, instruments or a location.")
+    genre_ids = _resolve_ids(reference_cache.genres, genres)
+    instrument_ids = _resolve_ids(reference_cache.instruments, instruments)
+    genre_mask, instrument_mask = ids_to_bits(genre_ids), ids_to_bits(instrument_ids)
+    if (genres and not genre_mask) or (instruments and not instrument_mask):
+        return []
+
+    rows = MusicianIndex.objects.all()
+    if location is not None and radius_km:
+        if not isinstance(location, Location):
+            location = Location.objects.get(pk=location)
+        rows = rows.filter(location__in=list(locations_within(location, radius_km)))
+    elif location is not None:
+        rows = rows.filter(location=location)
+    else:
+        for through, column, ids in ((User.genres.through, 'genre_id', genre_ids),
+                                     (User.instruments.through, 'instrument_id', instrument_ids)):
+            for required in ([[i] for i in ids] if match_all else [ids] if ids else []):
+                rows = rows.filter(pk__in=through.objects.filter(**{f'{column}__in': required}).values('user_id'))
+
+    def matches():
+        for user_id, genre_bits, instrument_bits in rows.values_list('user_id', 'genre_bits',
+                                                                     'instrument_bits').iterator():
+            score = 0
+            for mask, data in ((genre_mask, genre_bits), (instrument_mask, instrument_bits)):
+                if not mask:
+                    continue
+                hits = bytes_to_bits(data) & mask
+                if not hits or (match_all and hits != mask):
+                    break
+                score += hits.bit_count()
+            else:
+                yield score, -user_id
+
+    best = heapq.nlargest(limit, matches())
+    users = User.objects.in_bulk([-neg_id for _, neg_id in best])
+    return [(users[-neg_id], score) for score, neg_id in best if -neg_id in users]
@@ -0,0 +1,31 @@
+"""
+Radius and nearest-neighbour queries for anything with a Location FK.
+
+The geohash index on Location narrows the candidates; callers then filter
+their own model by the matching location ids.
+"""
+from ..models import Location, User, Group
+
+
+def locations_within(location, radius_km):
+    "Returns {location_id: distance_km} for Locations within radius_km of a Location."
+    if not location.has_coordinates:
+        return {location.pk: 0.0}
+    return {loc.pk: distance for loc, distance in
+            Location.objects.within(location.latitude, location.longitude, radius_km)}
+
+
+def _with_distances(queryset, distances):
+    found = [(obj, distances[obj.location_id]) for obj in queryset.filter(location__in=distances)]
+    found.sort(key=lambda pair: (pair[1], pair[0].pk))
+    return found
+
+
+def users_within(location, radius_km):
+    "Returns a list of (User, distance_km) within radius_km of a Location, nearest first."
+    return _with_distances(User.objects.all(), locations_within(location, radius_km))
+
+
+def groups_within(location, radius_km):
+    "Returns a list of (Group, distance_km) within radius_km of a Location, nearest first."
+    return _with_distances(Group.objects.all(), locations_within(location, radius_km))
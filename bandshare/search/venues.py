@@ -0,0 +1,108 @@
+"""
+Venue discovery ("open dates next month at venues within 40 km that book
+funk").
+
+The geohash index on Location finds the venues in range, and each Venue's
+genre_bits (the ids of the genres it books, as a bitset) are matched with
+integer bit operations, so there is no join through the genre table. The
+venues that match are then checked nearest first, GIG_QUERY_VENUES at a
+time, for gigs over the dates asked for: one query per batch, a range scan
+per venue on the gig_venue_date index that never reads the gig rows. The
+search stops as soon as it has found `limit` venues with an open date, so
+it reads only the gigs of the venues it returns (or skips), however many
+venues and gigs there are in all (benchmarks/venues.py).
+"""
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.utils.timezone import localdate
+
+from .. import geo, reference_cache
+from ..models import Gig, Location, Venue
+from .musicians import _resolve_ids, bits_to_bytes, bytes_to_bits, ids_to_bits
+
+GIG_QUERY_VENUES = 500
+
+Opening = namedtuple('Opening', 'venue distance_km dates')
+
+
+def index_venues(venue_ids):
+    "Recomputes genre_bits for the given venues."
+    venue_ids = list(venue_ids)
+    genres = defaultdict(list)
+    for venue_id, genre_id in Venue.genres.through.objects.filter(venue_id__in=venue_ids) \
+            .values_list('venue_id', 'genre_id'):
+        genres[venue_id].append(genre_id)
+    Venue.objects.bulk_update([Venue(pk=pk, genre_bits=bits_to_bytes(ids_to_bits(genres[pk]))) for pk in venue_ids],
+                              ['genre_bits'], batch_size=500)
+
+
+def update_bits(venue_id, add=(), remove=(), clear=False):
+    "Incrementally sets or clears genre bits on one venue."
+    venue = Venue.objects.filter(pk=venue_id)
+    bits = 0 if clear else bytes_to_bits(venue.values_list('genre_bits', flat=True).first())
+    bits |= ids_to_bits(add)
+    bits &= ~ids_to_bits(remove)
+    venue.update(genre_bits=bits_to_bytes(bits))
+
+
+def open_dates(location, radius_km, start=None, days=30, genres=(), min_capacity=None, max_capacity=None,
+               weekdays=None, limit=20):
+    """
+    Returns up to `limit` Openings, nearest venue first: the venues within
+    radius_km of location with no gig on some of the `days` dates from start
+    (default today), and those dates.
+
+    genres may be ids or names; venues booking any of them match. weekdays
+    (0 is Monday) narrows the dates, e.g. {4, 5} for Fridays and Saturdays.
+    """
+    genre_mask = ids_to_bits(_resolve_ids(reference_cache.genres, genres))
+    if (genres and not genre_mask) or limit < 1:
+        return []
+    start = start or localdate()
+    dates = [start + timedelta(days=i) for i in range(days)]
+    dates = [d for d in dates if weekdays is None or d.weekday() in weekdays]
+    if not dates:
+        return []
+
+    if not isinstance(location, Location):
+        location = Location.objects.get(pk=location)
+    if location.has_coordinates:
+        venues = Venue.objects.filter(location__in=Location.objects.in_cells(location.latitude, location.longitude,
+                                                                             radius_km))
+    else:
+        venues = Venue.objects.filter(location=location)
+    if min_capacity is not None:
+        venues = venues.filter(capacity__gte=min_capacity)
+    if max_capacity is not None:
+        venues = venues.filter(capacity__lte=max_capacity)
+    candidates = []
+    for venue_id, latitude, longitude, genre_bits in venues.values_list(
+            'id', 'location__latitude', 'location__longitude', 'genre_bits').iterator():
+        if genre_mask and not bytes_to_bits(genre_bits) & genre_mask:
+            continue
+        distance = geo.haversine_km(location.latitude, location.longitude, latitude, longitude) \
+            if location.has_coordinates else 0.0
+        if distance <= radius_km:
+            candidates.append((distance, venue_id))
+    candidates.sort()
+
+    found = []
+    for i in range(0, len(candidates), GIG_QUERY_VENUES):
+        batch = candidates[i:i + GIG_QUERY_VENUES]
+        booked = defaultdict(set)
+        for venue_id, date in Gig.objects.filter(date__range=(dates[0], dates[-1]),
+                                                 venue__in=[venue_id for _, venue_id in batch]) \
+                .values_list('venue_id', 'date'):
+            booked[venue_id].add(date)
+        for distance, venue_id in batch:
+            free = [d for d in dates if d not in booked[venue_id]]
+            if free:
+                found.append((venue_id, distance, free))
+            if len(found) >= limit:
+                break
+        if len(found) >= limit:
+            break
+
+    by_id = Venue.objects.select_related('location').in_bulk([venue_id for venue_id, _, _ in found])
+    return [Opening(by_id[venue_id], distance, free) for venue_id, distance, free in found]
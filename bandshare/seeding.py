@@ -0,0 +1,308 @@
+"""
+Synthetic data for load and scaling tests (manage.py seed).
+
+Distributions are meant to look like real usage rather than uniform noise:
+
+    genres, instruments, artists and songs are picked with Zipfian weights,
+        so a few are very popular and most are rare
+    locations cluster around real cities, weighted by size
+    birth dates, BPMs and song lengths follow triangular distributions
+
+Rows are written with executemany() in batches, bypassing model
+instantiation, and ids are assigned up front so nothing has to be read back.
+Signals don't fire, so the musician and full-text search indexes are rebuilt
+at the end (unless skipped) and Setlist summaries are computed while
+generating the entries.
+"""
+import bisect
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.timezone import now
+
+from . import counters, geo
+from .models import (Artist, Genre, Group, GroupMembership, Instrument, Location, MusicalKey, Setlist,
+                     SetlistEntry, Song, TimeSignature, User)
+from .search import fulltext, rebuild_index
+
+GENRES = [
+    'Rock', 'Pop', 'Indie', 'Hip Hop', 'Country', 'Jazz', 'Blues', 'Folk', 'Punk', 'Metal', 'R&B', 'Soul',
+    'Funk', 'Electronic', 'Reggae', 'Alternative', 'Classical', 'Bluegrass', 'Gospel', 'Latin', 'Ska',
+    'Grunge', 'Emo', 'Hardcore', 'Shoegaze', 'Dream Pop', 'Post-Rock', 'Math Rock', 'Americana', 'Disco',
+    'House', 'Techno', 'Ambient', 'Surf', 'Rockabilly', 'Swing', 'Bebop', 'Fusion', 'Prog', 'Psychedelic',
+    'Garage', 'New Wave', 'Synthpop', 'Trip Hop', 'Drum and Bass', 'Dubstep', 'Zydeco', 'Cajun', 'Polka',
+    'Afrobeat', 'Bossa Nova', 'Salsa', 'Cumbia', 'Klezmer', 'Celtic', 'Doo-wop', 'Motown', 'Lo-fi',
+]
+INSTRUMENTS = [
+    'Guitar', 'Vocals', 'Bass', 'Drums', 'Keyboard', 'Piano', 'Violin', 'Saxophone', 'Trumpet', 'Cello',
+    'Ukulele', 'Banjo', 'Mandolin', 'Harmonica', 'Flute', 'Clarinet', 'Trombone', 'Synthesizer',
+    'Percussion', 'Accordion', 'Upright Bass', 'Pedal Steel', 'Fiddle', 'Organ', 'Turntables',
+]
+# (city, state, latitude, longitude, relative size)
+CITIES = [
+    ('New York', 'New York', 40.71, -74.01, 84), ('Los Angeles', 'California', 34.05, -118.24, 39),
+    ('Chicago', 'Illinois', 41.88, -87.63, 27), ('Houston', 'Texas', 29.76, -95.37, 23),
+    ('Phoenix', 'Arizona', 33.45, -112.07, 16), ('Philadelphia', 'Pennsylvania', 39.95, -75.17, 16),
+    ('San Antonio', 'Texas', 29.42, -98.49, 15), ('San Diego', 'California', 32.72, -117.16, 14),
+    ('Dallas', 'Texas', 32.78, -96.80, 13), ('Austin', 'Texas', 30.27, -97.74, 10),
+    ('Seattle', 'Washington', 47.61, -122.33, 7), ('Denver', 'Colorado', 39.74, -104.99, 7),
+    ('Nashville', 'Tennessee', 36.16, -86.78, 7), ('Portland', 'Oregon', 45.52, -122.68, 6),
+    ('Atlanta', 'Georgia', 33.75, -84.39, 5), ('Minneapolis', 'Minnesota', 44.98, -93.27, 4),
+    ('New Orleans', 'Louisiana', 29.95, -90.07, 4), ('Oakland', 'California', 37.80, -122.27, 4),
+    ('Athens', 'Georgia', 33.96, -83.38, 1), ('Olympia', 'Washington', 47.04, -122.90, 1),
+]
+FIRST_NAMES = ['Jim', 'Pam', 'Dwight', 'Angela', 'Kevin', 'Oscar', 'Kelly', 'Ryan', 'Erin', 'Andy', 'Stanley',
+               'Phyllis', 'Meredith', 'Creed', 'Toby', 'Darryl', 'Jan', 'Karen', 'Holly', 'Gabe']
+LAST_NAMES = ['Halpert', 'Beesly', 'Schrute', 'Martin', 'Malone', 'Martinez', 'Kapoor', 'Howard', 'Hannon',
+              'Bernard', 'Hudson', 'Vance', 'Palmer', 'Bratton', 'Flenderson', 'Philbin', 'Levinson']
+WORDS = ['Velvet', 'Electric', 'Midnight', 'Silver', 'Broken', 'Golden', 'Neon', 'Paper', 'Crystal', 'Hollow',
+         'Wild', 'Lonely', 'Burning', 'Quiet', 'Northern', 'Static', 'Honey', 'Iron', 'Lucky', 'Blue',
+         'Heart', 'River', 'Ghost', 'Highway', 'Moon', 'Fire', 'Garden', 'Engine', 'Mirror', 'Ocean',
+         'Sparrow', 'Radio', 'Summer', 'Thunder', 'Shadow', 'Canyon', 'Daydream', 'Satellite', 'Harbor']
+
+
+def zipf_cum_weights(n, s=1.07):
+    "Cumulative Zipf weights for ranks 1..n, for random.choices()."
+    return list(itertools.accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+
+class Popularity:
+    "Picks items with Zipfian weights; popularity is assigned in a random order."
+
+    def __init__(self, rng, items, s=1.07):
+        self.rng = rng
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = zipf_cum_weights(len(self.items), s)
+        self.total = self.cum_weights[-1] if self.items else 0
+
+    def pick(self):
+        return self.items[bisect.bisect(self.cum_weights, self.rng.random() * self.total)]
+
+    def sample(self, k):
+        "Up to k distinct items."
+        return list(dict.fromkeys(self.pick() for _ in range(k)))
+
+
+class TableWriter:
+    "Buffers rows for one table and writes them batch_size at a time with executemany()."
+
+    PREPARED_TYPES = {'DateField', 'DateTimeField', 'DurationField', 'JSONField', 'BinaryField'}
+
+    def __init__(self, model, field_names, batch_size):
+        fields = [model._meta.get_field(name) for name in field_names]
+        quote = connection.ops.quote_name
+        self.table = model._meta.db_table
+        self.sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            quote(self.table), ', '.join(quote(f.column) for f in fields), ', '.join(['%s'] * len(fields)))
+        self.prepare = [f.get_db_prep_save if f.get_internal_type() in self.PREPARED_TYPES else None
+                        for f in fields]
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+
+    def add(self, *values):
+        self.rows.append([v if prep is None or v is None else prep(v, connection)
+                          for prep, v in zip(self.prepare, values)])
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(self.sql, self.rows)
+            self.count += len(self.rows)
+            self.rows = []
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def ensure_names(model, names):
+    "Creates the missing names and returns all ids of the model."
+    model.objects.bulk_create([model(name=n) for n in names], ignore_conflicts=True)
+    return list(model.objects.values_list('id', flat=True))
+
+
+class Seeder:
+    """
+    Generates a dataset. Counts not given are derived from users:
+    users/20 locations, users/4 groups, users/10 artists, users*2 songs and
+    three setlists per group.
+    """
+
+    def __init__(self, users, locations=None, groups=None, artists=None, songs=None, setlists=None,
+                 seed=1, batch_size=5000):
+        self.counts = {
+            'users': users,
+            'locations': locations if locations is not None else max(1, users // 20),
+            'groups': groups if groups is not None else users // 4,
+            'artists': artists if artists is not None else max(1, users // 10),
+            'songs': songs if songs is not None else users * 2,
+        }
+        self.counts['setlists'] = setlists if setlists is not None else self.counts['groups'] * 3
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.now = now()
+        self.today = self.now.date()
+        self.rows = {}
+
+    def writer(self, model, *fields):
+        "A TableWriter for model whose rows start with the id."
+        return TableWriter(model, ('id', *fields), self.batch_size)
+
+    def _finish(self, *writers):
+        for w in writers:
+            w.flush()
+            self.rows[w.table] = self.rows.get(w.table, 0) + w.count
+
+    def _ids(self, model, n):
+        start = next_id(model)
+        return range(start, start + n)
+
+    def _random_date(self, years_back):
+        return self.today - timedelta(days=self.rng.randrange(max(1, int(years_back * 365))))
+
+    def seed_reference_data(self):
+        self.genres = Popularity(self.rng, ensure_names(Genre, GENRES))
+        self.instruments = Popularity(self.rng, ensure_names(Instrument, INSTRUMENTS))
+        self.instrument_names = dict(Instrument.objects.values_list('id', 'name'))
+
+    def seed_locations(self):
+        ids = self._ids(Location, self.counts['locations'])
+        cities = Popularity(self.rng, CITIES)
+        cities.items.sort(key=lambda c: -c[4])  # bigger cities are more popular
+        locations = self.writer(Location, 'name', 'address', 'state', 'city', 'postal_code', 'country',
+                                'latitude', 'longitude', 'geohash')
+        for pk in ids:
+            city, state, lat, lon, _ = cities.pick()
+            lat, lon = lat + self.rng.gauss(0, 0.12), lon + self.rng.gauss(0, 0.12)
+            locations.add(pk, '', f'{pk} Seed Street', state, city, f'{self.rng.randrange(10000, 99999)}',
+                          'United States of America', lat, lon, geo.encode(lat, lon))
+        self._finish(locations)
+        self.locations = Popularity(self.rng, ids, s=0.9)
+
+    def seed_users(self):
+        rng = self.rng
+        ids = self._ids(User, self.counts['users'])
+        users = self.writer(User, 'created_at', 'updated_at', 'display_name', 'first_name', 'last_name',
+                            'birth_date', 'description', 'bio', 'location')
+        user_genres = TableWriter(User.genres.through, ('user', 'genre'), self.batch_size)
+        user_instruments = TableWriter(User.instruments.through, ('user', 'instrument'), self.batch_size)
+        for pk in ids:
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            location = self.locations.pick() if self.locations.items and rng.random() < 0.9 else None
+            birth_date = self.today - timedelta(days=int(rng.triangular(16, 70, 27) * 365.25))
+            users.add(pk, self.now, self.now, f'{first.lower()}{pk}', first, last, birth_date, '',
+                      f'{rng.choice(WORDS)} {rng.choice(WORDS).lower()} fan.', location)
+            for genre in self.genres.sample(rng.randint(1, 4)):
+                user_genres.add(pk, genre)
+            if rng.random() < 0.8:
+                for instrument in self.instruments.sample(rng.randint(1, 3)):
+                    user_instruments.add(pk, instrument)
+        self._finish(users, user_genres, user_instruments)
+        self.user_ids = ids
+
+    def seed_groups(self):
+        rng = self.rng
+        ids = self._ids(Group, self.counts['groups'])
+        groups = self.writer(Group, 'created_at', 'updated_at', 'started_date', 'created_by', 'owned_by',
+                             'name', 'description', 'bio', 'location')
+        memberships = TableWriter(GroupMembership, ('group', 'member', 'role'), self.batch_size)
+        group_genres = TableWriter(Group.genres.through, ('group', 'genre'), self.batch_size)
+        for pk in ids:
+            creator = rng.choice(self.user_ids)
+            location = self.locations.pick() if self.locations.items else None
+            groups.add(pk, self.now, self.now, self._random_date(15), creator, creator,
+                       f'The {rng.choice(WORDS)} {rng.choice(WORDS)}s', '', '', location)
+            members = {creator, *(rng.choice(self.user_ids) for _ in range(rng.randint(1, 5)))}
+            for member in members:
+                memberships.add(pk, member, self.instrument_names[self.instruments.pick()])
+            for genre in self.genres.sample(rng.randint(1, 3)):
+                group_genres.add(pk, genre)
+        self._finish(groups, memberships, group_genres)
+        self.group_ids = ids
+
+    def seed_songs(self):
+        rng = self.rng
+        artist_ids = self._ids(Artist, self.counts['artists'])
+        artists = self.writer(Artist, 'created_at', 'updated_at', 'name')
+        for pk in artist_ids:
+            artists.add(pk, self.now, self.now, f'{rng.choice(WORDS)} {rng.choice(WORDS)} {pk}')
+        self._finish(artists)
+
+        popular_artists = Popularity(rng, artist_ids)
+        keys = [k for k in MusicalKey.values if k]
+        meters = [TimeSignature.Four_Four] * 16 + [TimeSignature.Three_Four] * 2 + [
+            TimeSignature.Six_Eight, TimeSignature.Twelve_Eight]
+        ids = self._ids(Song, self.counts['songs'])
+        songs = self.writer(Song, 'created_at', 'updated_at', 'title', 'release_date', 'artist', 'musical_key',
+                            'time_signature', 'bpm', 'duration_seconds')
+        song_genres = TableWriter(Song.genres.through, ('song', 'genre'), self.batch_size)
+        self.tracks = {}
+        for pk in ids:
+            key = rng.choice(keys) if rng.random() < 0.9 else ''
+            meter = rng.choice(meters)
+            bpm, seconds = int(rng.triangular(60, 190, 118)), int(rng.triangular(90, 600, 215))
+            songs.add(pk, self.now, self.now, f'{rng.choice(WORDS)} {rng.choice(WORDS)}',
+                      self._random_date(60) if rng.random() < 0.8 else None, popular_artists.pick(),
+                      key, meter, bpm, timedelta(seconds=seconds))
+            self.tracks[pk] = [pk, seconds, bpm, key, meter]  # as song_track()
+            for genre in self.genres.sample(rng.randint(1, 2)):
+                song_genres.add(pk, genre)
+        self._finish(songs, song_genres)
+        self.songs = Popularity(rng, ids, s=0.8)
+
+    def seed_setlists(self):
+        rng = self.rng
+        if not self.group_ids or not self.songs.items:
+            return
+        ids = self._ids(Setlist, self.counts['setlists'])
+        setlists = self.writer(Setlist, 'created_at', 'updated_at', 'title', 'description', 'owner_group',
+                               'tracks', 'song_count', 'total_duration', 'bpm_curve', 'key_changes',
+                               'time_signature_counts')
+        entries = TableWriter(SetlistEntry, ('setlist', 'song', 'position'), self.batch_size)
+        summary = Setlist()
+        for pk in ids:
+            song_ids = self.songs.sample(rng.randint(8, 20))
+            summary._set_tracks([self.tracks[song_id] for song_id in song_ids])
+            setlists.add(pk, self.now, self.now, f'{rng.choice(WORDS)} Tour', '', rng.choice(self.group_ids),
+                         summary.tracks, summary.song_count, summary.total_duration, summary.bpm_curve,
+                         summary.key_changes, summary.time_signature_counts)
+            for position, song_id in enumerate(song_ids):
+                entries.add(pk, song_id, position)
+        self._finish(setlists, entries)
+
+    def run(self, build_indexes=True, progress=None):
+        "Generates everything; returns {table: rows inserted}."
+        steps = [self.seed_reference_data, self.seed_locations, self.seed_users, self.seed_groups,
+                 self.seed_songs, self.seed_setlists]
+        for step in steps:
+            start = time.perf_counter()
+            with transaction.atomic():
+                step()
+            if progress:
+                progress(step.__name__.replace('seed_', ''), time.perf_counter() - start)
+
+        # The rows were written without signals.
+        counters.recount()
+
+        models = [Location, User, Group, GroupMembership, Artist, Song, Setlist, SetlistEntry,
+                  User.genres.through, User.instruments.through, Group.genres.through, Song.genres.through]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
+        if build_indexes:
+            start = time.perf_counter()
+            rebuild_index(batch_size=self.batch_size)
+            fulltext.rebuild(batch_size=self.batch_size)
+            if progress:
+                progress('indexes', time.perf_counter() - start)
+        return self.rows
@@ -0,0 +1,215 @@
+"""
+Automatic setlist generation.
+
+Given a pool of Songs and a target length, plan_setlist() searches for an
+order that lands within tolerance of the target while keeping key and tempo
+transitions smooth. It runs a beam search (keeping the beam_width cheapest
+partial sets at each step and extending each with its branch cheapest next
+songs), then spends whatever is left of the time budget improving the best
+set with pairwise swaps.
+
+Hard constraints:
+    opener / closer       - fixed first / last song
+    no back-to-back ballads (songs slower than ballad_bpm)
+    at most max_same_key songs in a row in the same key
+"""
+import time
+from datetime import timedelta
+
+from django.db import transaction
+
+from .harmony import key_distance
+from .models import Setlist, Song
+
+KEY_WEIGHT = 1.0
+TEMPO_WEIGHT = 0.1      # per BPM of difference
+METER_WEIGHT = 0.5      # for a change of time signature
+UNKNOWN_KEY_COST = 1.0
+DURATION_WEIGHT = 0.05  # per second away from the target, for the finished set
+
+
+class Plan:
+    "The result of plan_setlist(): the songs in order and how good the order is."
+
+    def __init__(self, songs, cost, duration, complete):
+        self.songs = songs
+        self.cost = cost
+        self.duration = duration
+        self.complete = complete
+
+    def __repr__(self):
+        return f"Plan({len(self.songs)} songs, {self.duration}, cost={self.cost:.2f}, complete={self.complete})"
+
+
+def transition_cost(a, b):
+    "How jarring it is to play b straight after a."
+    distance = key_distance(a.musical_key, b.musical_key)
+    cost = UNKNOWN_KEY_COST if distance is None else KEY_WEIGHT * distance
+    cost += TEMPO_WEIGHT * abs(a.bpm - b.bpm)
+    if a.time_signature != b.time_signature:
+        cost += METER_WEIGHT
+    return cost
+
+
+class _Search:
+    def __init__(self, songs, target, tolerance, opener, closer, ballad_bpm, max_same_key):
+        self.songs = list(songs)
+        self.n = len(self.songs)
+        self.seconds = [s.duration_seconds.total_seconds() for s in self.songs]
+        self.keys = [s.musical_key for s in self.songs]
+        self.ballad = [s.bpm < ballad_bpm for s in self.songs]
+        self.target = target.total_seconds()
+        self.tolerance = tolerance.total_seconds()
+        self.max_same_key = max_same_key
+
+        index = {s.pk: i for i, s in enumerate(self.songs)}
+        self.opener = index[opener.pk] if opener is not None else None
+        self.closer = index[closer.pk] if closer is not None else None
+
+        self.cost = [[transition_cost(a, b) for b in self.songs] for a in self.songs]
+        # Candidate next songs for each song, cheapest transition first.
+        self.nearest = [sorted(range(self.n), key=row.__getitem__) for row in self.cost]
+
+    def allowed(self, sequence, nxt):
+        last = sequence[-1]
+        if self.ballad[last] and self.ballad[nxt]:
+            return False
+        key = self.keys[nxt]
+        if key and self.max_same_key:
+            run = 0
+            for i in reversed(sequence):
+                if self.keys[i] != key:
+                    break
+                run += 1
+            if run >= self.max_same_key:
+                return False
+        return True
+
+    def sequence_cost(self, sequence):
+        return sum(self.cost[a][b] for a, b in zip(sequence, sequence[1:]))
+
+    def total_cost(self, sequence):
+        duration = sum(self.seconds[i] for i in sequence)
+        return self.sequence_cost(sequence) + DURATION_WEIGHT * abs(duration - self.target)
+
+    def valid(self, sequence):
+        return all(self.allowed(sequence[:i], sequence[i]) for i in range(1, len(sequence)))
+
+    def finish(self, sequence, duration):
+        "Returns the sequence with the closer appended if that completes the set, else None."
+        if self.closer is not None:
+            if not self.allowed(sequence, self.closer):
+                return None
+            sequence = sequence + (self.closer,)
+            duration += self.seconds[self.closer]
+        if abs(duration - self.target) <= self.tolerance:
+            return sequence
+        return None
+
+    def beam(self, beam_width, branch, deadline):
+        closer_seconds = self.seconds[self.closer] if self.closer is not None else 0
+        limit = self.target + self.tolerance - closer_seconds
+        starts = [self.opener] if self.opener is not None else [i for i in range(self.n) if i != self.closer]
+        beam = [(0.0, (i,), self.seconds[i]) for i in starts if self.seconds[i] <= limit]
+        best = None
+        best_partial = min(beam, default=None)
+
+        while beam and time.perf_counter() < deadline:
+            extended = []
+            for cost, sequence, duration in beam:
+                done = self.finish(sequence, duration)
+                if done is not None:
+                    total = self.total_cost(done)
+                    if best is None or total < best[0]:
+                        best = (total, done)
+
+                used = set(sequence)
+                last = sequence[-1]
+                added = 0
+                for nxt in self.nearest[last]:
+                    if added == branch:
+                        break
+                    if nxt in used or nxt == self.closer or duration + self.seconds[nxt] > limit:
+                        continue
+                    if not self.allowed(sequence, nxt):
+                        continue
+                    extended.append((cost + self.cost[last][nxt], sequence + (nxt,), duration + self.seconds[nxt]))
+                    added += 1
+
+            extended.sort(key=lambda state: state[0])
+            beam = extended[:beam_width]
+            if beam:
+                best_partial = beam[0]
+
+        if best is not None:
+            return best[1], True
+        if best_partial is None:
+            return (), False
+        sequence = best_partial[1]
+        if self.closer is not None:
+            sequence = sequence + (self.closer,)
+        return sequence, False
+
+    def improve(self, sequence, deadline):
+        "Pairwise swaps of interior songs, keeping any swap that lowers the cost."
+        sequence = list(sequence)
+        first = 1 if self.opener is not None else 0
+        last = len(sequence) - (1 if self.closer is not None else 0)
+        best = self.sequence_cost(sequence)
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            for i in range(first, last):
+                if time.perf_counter() >= deadline:
+                    break
+                for j in range(i + 1, last):
+                    sequence[i], sequence[j] = sequence[j], sequence[i]
+                    cost = self.sequence_cost(sequence)
+                    if cost < best - 1e-9 and self.valid(sequence):
+                        best = cost
+                        improved = True
+                    else:
+                        sequence[i], sequence[j] = sequence[j], sequence[i]
+        return tuple(sequence)
+
+
+def plan_setlist(songs, target, tolerance=timedelta(minutes=3), opener=None, closer=None,
+                 ballad_bpm=80, max_same_key=2, time_budget=0.5, beam_width=64, branch=8):
+    """
+    Orders a subset of songs into a set of about target length.
+
+    Returns a Plan. If no set within tolerance could be found inside the time
+    budget, the best partial set is returned with complete=False.
+    """
+    deadline = time.perf_counter() + time_budget
+    songs = list(dict.fromkeys(s for s in (opener, *songs, closer) if s is not None))
+    if not songs:
+        return Plan([], 0.0, timedelta(0), False)
+    search = _Search(songs, target, tolerance, opener, closer, ballad_bpm, max_same_key)
+
+    # Leave a slice of the budget for the improvement pass.
+    sequence, complete = search.beam(beam_width, branch, deadline - time_budget * 0.2)
+    if complete:
+        sequence = search.improve(sequence, deadline)
+
+    return Plan([search.songs[i] for i in sequence], search.total_cost(sequence),
+                timedelta(seconds=sum(search.seconds[i] for i in sequence)), complete)
+
+
+def group_song_pool(group):
+    "Returns every Song that appears in one of the group's setlists."
+    return Song.objects.filter(setlist__owner_group=group).distinct()
+
+
+def generate_setlist(group, title, target, songs=None, **options):
+    """
+    Plans a set from songs (default: group_song_pool(group)) and saves it as
+    a new Setlist owned by group. Returns (setlist, plan).
+    """
+    if songs is None:
+        songs = group_song_pool(group)
+    plan = plan_setlist(songs, target, **options)
+    with transaction.atomic():
+        setlist = Setlist.objects.create(title=title, owner_group=group)
+        setlist.add_songs(plan.songs)
+    return setlist, plan
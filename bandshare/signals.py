@@ -0,0 +1,294 @@
+"""
+Model signal handlers that keep denormalized data in sync.
+
+Connected in BandshareConfig.ready().
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import counters, feed, jobs, reference_cache, response_cache
+from .models import (Activity, Artist, Genre, Group, GroupMembership, Location, User, MusicianIndex, Setlist, Song,
+                     Venue)
+from .models.setlist import songs_added
+from .search import fulltext, musicians, venues
+
+
+@receiver(post_save, sender=User)
+def index_user_location(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        MusicianIndex.objects.create(user=instance, location_id=instance.location_id)
+    elif not MusicianIndex.objects.filter(user=instance).update(location_id=instance.location_id):
+        musicians.index_users([instance.pk])
+
+
+def _index_user_m2m(field):
+    def handler(sender, instance, action, reverse, pk_set, **kwargs):
+        if reverse:
+            # A Genre/Instrument gained or lost users; recompute those users.
+            if action == 'pre_clear':
+                instance._cleared_user_ids = list(instance.user_set.values_list('id', flat=True))
+            elif action == 'post_clear':
+                musicians.index_users(getattr(instance, '_cleared_user_ids', ()))
+            elif action in ('post_add', 'post_remove'):
+                musicians.index_users(pk_set)
+        elif action == 'post_add':
+            musicians.update_bits(instance.pk, field, add=pk_set)
+        elif action == 'post_remove':
+            musicians.update_bits(instance.pk, field, remove=pk_set)
+        elif action == 'post_clear':
+            musicians.update_bits(instance.pk, field, clear=True)
+    return handler
+
+
+index_user_genres = _index_user_m2m('genre_bits')
+index_user_instruments = _index_user_m2m('instrument_bits')
+m2m_changed.connect(index_user_genres, sender=User.genres.through)
+m2m_changed.connect(index_user_instruments, sender=User.instruments.through)
+
+
+@receiver(m2m_changed, sender=Venue.genres.through)
+def index_venue_genres(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # A Genre gained or lost venues; recompute those venues.
+        if action == 'pre_clear':
+            instance._cleared_venue_ids = list(instance.venues.values_list('id', flat=True))
+        elif action == 'post_clear':
+            venues.index_venues(getattr(instance, '_cleared_venue_ids', ()))
+        elif action in ('post_add', 'post_remove'):
+            venues.index_venues(pk_set)
+    elif action == 'post_add':
+        venues.update_bits(instance.pk, add=pk_set)
+    elif action == 'post_remove':
+        venues.update_bits(instance.pk, remove=pk_set)
+    elif action == 'post_clear':
+        venues.update_bits(instance.pk, clear=True)
+
+
+@receiver(m2m_changed, sender=Setlist.songs.through)
+def refresh_setlist_summary(sender, instance, action, reverse, pk_set, **kwargs):
+    "Keeps summaries right when songs are added through the plain M2M manager."
+    if reverse and action == 'pre_clear':
+        instance._cleared_setlist_ids = list(instance.setlist_set.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            setlist_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_setlist_ids', ())
+            for setlist in Setlist.objects.filter(pk__in=setlist_ids):
+                setlist.refresh_summary()
+        else:
+            instance.refresh_summary()
+
+
+@receiver(post_save, sender=Song)
+def update_setlist_tracks(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    for setlist in Setlist.objects.filter(songs=instance):
+        setlist.update_song(instance)
+
+
+@receiver(pre_delete, sender=Song)
+def remove_deleted_song_from_setlists(sender, instance, **kwargs):
+    for setlist in Setlist.objects.filter(songs=instance):
+        setlist.remove_song(instance)
+
+
+def invalidate_reference_cache(sender, **kwargs):
+    # After commit: bumped sooner, a concurrent read could cache the old row under the new version.
+    transaction.on_commit(reference_cache.BY_MODEL[sender].invalidate)
+
+
+for model in reference_cache.BY_MODEL:
+    post_save.connect(invalidate_reference_cache, sender=model)
+    post_delete.connect(invalidate_reference_cache, sender=model)
+
+
+def _sync_document(kind, pk):
+    # Several saves of one object before a worker gets to it index it once.
+    jobs.enqueue('search.sync', {'kind': kind, 'pk': pk}, dedupe_key=f'search.sync:{kind}:{pk}')
+
+
+def index_document(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    source = fulltext.SOURCE_BY_MODEL[sender]
+    _sync_document(source.kind, instance.pk)
+    if source.kind == 'artist' and not created:
+        # Songs carry their artist's name.
+        jobs.enqueue('search.index', {'kind': 'song', 'filters': {'artist': instance.pk}},
+                     dedupe_key=f'search.index:song:artist:{instance.pk}')
+
+
+def remove_document(sender, instance, **kwargs):
+    _sync_document(fulltext.SOURCE_BY_MODEL[sender].kind, instance.pk)
+
+
+for model in fulltext.SOURCE_BY_MODEL:
+    post_save.connect(index_document, sender=model)
+    post_delete.connect(remove_document, sender=model)
+
+
+@receiver(post_save, sender=Setlist)
+def record_setlist_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.record_on_commit(Activity.Verb.SETLIST_CREATED, group=instance.owner_group_id, setlist=instance.pk)
+
+
+def _record_songs_added(setlist, song_ids):
+    song_ids = sorted(song_ids)
+    feed.record_on_commit(Activity.Verb.SONGS_ADDED, group=setlist.owner_group_id, setlist=setlist.pk,
+                          song=song_ids[0], song_ids=song_ids)
+
+
+@receiver(songs_added, sender=Setlist)
+def record_setlist_songs(sender, instance, songs, **kwargs):
+    _record_songs_added(instance, [song.pk for song in songs])
+
+
+@receiver(m2m_changed, sender=Setlist.songs.through)
+def record_setlist_songs_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        for setlist in Setlist.objects.filter(pk__in=pk_set).only('id', 'owner_group_id'):
+            _record_songs_added(setlist, [instance.pk])
+    else:
+        _record_songs_added(instance, pk_set)
+
+
+@receiver(post_save, sender=GroupMembership)
+def record_member_joined(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.record_on_commit(Activity.Verb.MEMBER_JOINED, group=instance.group_id, user=instance.member_id,
+                              user_ids=[instance.member_id])
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+def record_members_joined(sender, instance, action, reverse, pk_set, **kwargs):
+    "Memberships added with members.add() or bulk relations, which skip post_save."
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        for group in pk_set:
+            feed.record_on_commit(Activity.Verb.MEMBER_JOINED, group=group, user=instance.pk, user_ids=[instance.pk])
+    else:
+        # One activity for the whole batch, however many joined.
+        user_ids = sorted(pk_set)
+        feed.record_on_commit(Activity.Verb.MEMBER_JOINED, group=instance.pk, user=user_ids[0], user_ids=user_ids)
+
+
+# Response cache tags: see bandshare.response_cache and the cached views.
+TAGGED_MODELS = {Group: 'group', Setlist: 'setlist', Song: 'song', Artist: 'artist', User: 'user',
+                 Location: 'location', Genre: 'genre'}
+
+
+def invalidate_object_responses(sender, instance, raw=False, **kwargs):
+    if not raw:
+        response_cache.invalidate(f'{TAGGED_MODELS[sender]}:{instance.pk}')
+
+
+def invalidate_membership_responses(sender, instance, raw=False, **kwargs):
+    if not raw:
+        response_cache.invalidate(f'group:{instance.group_id}')
+
+
+def invalidate_group_m2m_responses(sender, instance, action, reverse, pk_set, **kwargs):
+    "Group.members and Group.genres changes, from either side."
+    if reverse and action == 'pre_clear':
+        instance._cleared_group_ids = list(instance.group_set.values_list('id', flat=True))
+    elif not action.startswith('post_'):
+        return
+    elif not reverse:
+        response_cache.invalidate(f'group:{instance.pk}')
+    elif action == 'post_clear':
+        response_cache.invalidate(*(f'group:{pk}' for pk in getattr(instance, '_cleared_group_ids', ())))
+    else:
+        response_cache.invalidate(*(f'group:{pk}' for pk in pk_set))
+
+
+for model in TAGGED_MODELS:
+    post_save.connect(invalidate_object_responses, sender=model)
+    post_delete.connect(invalidate_object_responses, sender=model)
+post_save.connect(invalidate_membership_responses, sender=GroupMembership)
+post_delete.connect(invalidate_membership_responses, sender=GroupMembership)
+m2m_changed.connect(invalidate_group_m2m_responses, sender=Group.members.through)
+m2m_changed.connect(invalidate_group_m2m_responses, sender=Group.genres.through)
+
+
+# Counters: see bandshare.counters.
+
+@receiver(post_save, sender=GroupMembership)
+def count_member_joined(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.increment(Group, 'member_count', {instance.group_id: 1})
+
+
+@receiver(post_delete, sender=GroupMembership)
+def count_member_left(sender, instance, **kwargs):
+    # Removals in bulk (bandshare.relations) skip this and count themselves.
+    counters.increment(Group, 'member_count', {instance.group_id: -1})
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+def count_members_joined(sender, instance, action, reverse, pk_set, **kwargs):
+    "Memberships added with members.add() or bulk relations, which skip post_save."
+    if action == 'post_add' and pk_set:
+        counters.increment(Group, 'member_count', dict.fromkeys(pk_set, 1) if reverse else {instance.pk: len(pk_set)})
+
+
+@receiver(post_save, sender=Song)
+def count_artist_songs(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_artist_id', None)
+    if created:
+        counters.increment(Artist, 'song_count', {instance.artist_id: 1})
+    elif loaded is not None and loaded != instance.artist_id:
+        counters.increment(Artist, 'song_count', {loaded: -1, instance.artist_id: 1})
+    instance._loaded_artist_id = instance.artist_id
+
+
+@receiver(post_delete, sender=Song)
+def uncount_artist_song(sender, instance, **kwargs):
+    counters.increment(Artist, 'song_count', {instance.artist_id: -1})
+
+
+def _uncount_genre_links(links, field):
+    counts = Counter(links.values_list('genre_id', flat=True))
+    counters.increment(Genre, field, {genre: -n for genre, n in counts.items()})
+
+
+def _count_genre_links(model, field):
+    """
+    Group.genres or Song.genres changes, from either side. Removals are
+    counted before the rows go, from the links that actually exist.
+    """
+    through = model.genres.through
+    source = f'{model._meta.model_name}_id'
+
+    def handler(sender, instance, action, reverse, pk_set, **kwargs):
+        if action == 'post_add' and pk_set:
+            counters.increment(Genre, field, {instance.pk: len(pk_set)} if reverse else dict.fromkeys(pk_set, 1))
+        elif action in ('pre_remove', 'pre_clear'):
+            links = through.objects.filter(**{'genre_id' if reverse else source: instance.pk})
+            if action == 'pre_remove':
+                links = links.filter(**{f'{source}__in' if reverse else 'genre_id__in': pk_set})
+            _uncount_genre_links(links, field)
+
+    def deleted(sender, instance, **kwargs):
+        # The links are deleted with the object, without m2m_changed.
+        _uncount_genre_links(through.objects.filter(**{source: instance.pk}), field)
+
+    return handler, deleted
+
+
+count_group_genres, uncount_deleted_group_genres = _count_genre_links(Group, 'group_count')
+count_song_genres, uncount_deleted_song_genres = _count_genre_links(Song, 'song_count')
+m2m_changed.connect(count_group_genres, sender=Group.genres.through)
+m2m_changed.connect(count_song_genres, sender=Song.genres.through)
+pre_delete.connect(uncount_deleted_group_genres, sender=Group)
+pre_delete.connect(uncount_deleted_song_genres, sender=Song)
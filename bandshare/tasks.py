@@ -0,0 +1,54 @@
+"""
+Background tasks, queued with bandshare.jobs.enqueue() and run by
+`manage.py run_workers`. Imported in BandshareConfig.ready().
+"""
+import logging
+
+from . import collab, feed, jobs
+from .importers import SongImporter, read_rows
+from .recommendations import score_all
+from .search import fulltext
+
+logger = logging.getLogger(__name__)
+
+
+@jobs.task('feed.record', priority=jobs.HIGH)
+def record_activity(verb, **kwargs):
+    feed.record(verb, **kwargs)
+
+
+@jobs.task('search.sync')
+def sync_search_document(kind, pk):
+    fulltext.sync(kind, pk)
+
+
+@jobs.task('search.index')
+def index_search_documents(kind, filters):
+    fulltext.index(kind, **filters)
+
+
+@jobs.task('search.rebuild', priority=jobs.LOW, timeout=60 * 60, atomic=False)
+def rebuild_search_index(kinds=fulltext.KINDS, batch_size=2000):
+    counts = fulltext.rebuild(kinds, batch_size)
+    logger.info("Rebuilt the search index: %s", counts)
+
+
+@jobs.task('setlists.compact', priority=jobs.LOW)
+def compact_setlist_ops(setlist):
+    collab.compact(setlist)
+
+
+@jobs.task('recommendations.score_all', priority=jobs.LOW, timeout=60 * 60)
+def score_recommendations(per_group=50, per_user=20, chunk_size=64):
+    count = score_all(per_group=per_group, per_user=per_user, chunk_size=chunk_size)
+    logger.info("Wrote %d recommendations.", count)
+
+
+@jobs.task('songs.import', priority=jobs.LOW, max_attempts=1, timeout=60 * 60, atomic=False)
+def import_songs(path, format, batch_size=1000):
+    # Not retried: a partly imported file would be imported twice.
+    with open(path, newline='', encoding='utf-8') as f:
+        stats = SongImporter(batch_size=batch_size).run(read_rows(f, format))
+    for line, messages in stats.errors:
+        logger.warning("%s row %d: %s", path, line, '; '.join(messages))
+    logger.info("Imported %d songs from %s, skipped %d.", stats.imported, path, stats.skipped)
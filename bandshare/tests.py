@@ -1,8 +1,27 @@
 # import unittest
+import collections
+import csv
+import contextvars
 import datetime as dt
-
-from django.test import TestCase
+import importlib
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from operator import itemgetter
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models.signals import m2m_changed
 
 from bandshare.models.group import GroupMembership
 
@@ -11,7 +30,19 @@ from bandshare.models.group import GroupMembership
 # Create your tests here.
 
 from .models import (User, Group, GroupMembership, Genre, Location, Instrument, Artist, Song, Setlist,
-                    TimeSignature, MusicalKey)
+                    TimeSignature, MusicalKey, Recommendation, PostalCode, MusicianIndex, Activity, Follow,
+                    PullSource, TimelineEntry, Job, Availability, Event, TimeOff, Venue, Gig, SetlistOp)
+from . import async_views, counters, feed, geo, instrumentation, jobs, reference_cache, relations, response_cache
+from . import collab, exports, realtime, scheduling
+from .api import RESOURCES, page
+from .harmony import COMPATIBLE_KEYS, key_distance, compatible_songs
+from .importers import NameCache, SongImporter
+from .seeding import Popularity
+from .setlist_generator import plan_setlist, generate_setlist, transition_cost
+from .recommendations import score_all, recommended_users, recommended_groups
+from .routers import PinPrimaryMiddleware, ReplicaRouter
+from .search import search_musicians, rebuild_index, users_within, groups_within
+from .search import fulltext, venues
 
 some_date = dt.date(1980, 1, 1)
 
@@ -370,3 +401,1918 @@ class SongModelTests(TestCase):
         self.assertEqual(time_signature, song.time_signature)
         self.assertEqual(bpm, song.bpm)
         self.assertEqual(duration_seconds, song.duration_seconds)
+
+
+class MusicianSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.here = Location.objects.create(state='California', city='Oakland', postal_code='94607')
+        cls.there = Location.objects.create(state='Tenneesee', city='Nashville', postal_code='37203')
+        cls.funk = Genre.objects.create(name='Funk')
+        cls.jazz = Genre.objects.create(name='Jazz')
+        cls.bass = Instrument.objects.create(name='Bass')
+        cls.drums = Instrument.objects.create(name='Drums')
+
+        cls.bootsy = User.objects.create(first_name='Bootsy', last_name='Collins', display_name='bootsy',
+                                         birth_date=some_date, location=cls.here)
+        cls.bootsy.genres.add(cls.funk, cls.jazz)
+        cls.bootsy.instruments.add(cls.bass)
+
+        cls.larry = User.objects.create(first_name='Larry', last_name='Graham', display_name='larry',
+                                        birth_date=some_date, location=cls.here)
+        cls.larry.genres.add(cls.funk)
+        cls.larry.instruments.add(cls.bass, cls.drums)
+
+        cls.clyde = User.objects.create(first_name='Clyde', last_name='Stubblefield', display_name='clyde',
+                                        birth_date=some_date, location=cls.here)
+        cls.clyde.genres.add(cls.funk)
+        cls.clyde.instruments.add(cls.drums)
+
+        cls.jaco = User.objects.create(first_name='Jaco', last_name='Pastorius', display_name='jaco',
+                                       birth_date=some_date, location=cls.there)
+        cls.jaco.genres.add(cls.funk)
+        cls.jaco.instruments.add(cls.bass)
+
+    def search(self, **kwargs):
+        return [user for user, score in search_musicians(**kwargs)]
+
+    def test_finds_by_genre_instrument_and_location(self):
+        found = self.search(genres=['Funk'], instruments=['Bass'], location=self.here)
+        self.assertEqual([self.bootsy, self.larry], found)
+
+    def test_ranks_by_number_of_matches(self):
+        found = self.search(genres=['Funk', 'Jazz'], instruments=['Bass'])
+        self.assertEqual(self.bootsy, found[0])
+        self.assertCountEqual([self.bootsy, self.larry, self.jaco], found)
+
+    def test_match_all(self):
+        found = self.search(instruments=['Bass', 'Drums'], match_all=True)
+        self.assertEqual([self.larry], found)
+
+    def test_unknown_names_match_nothing(self):
+        self.assertEqual([], self.search(genres=['Polka']))
+
+    def test_without_location_narrows_in_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual([self.larry], self.search(instruments=['Bass', 'Drums'], match_all=True))
+        search = [q['sql'] for q in queries.captured_queries if 'bandshare_musicianindex' in q['sql']]
+        self.assertIn('bandshare_user_instruments', search[0])
+        with self.assertRaises(ValueError):
+            self.search()
+        self.assertEqual(400, self.client.get('/bandshare/musicians/search/').status_code)
+
+    def test_index_follows_changes(self):
+        self.clyde.instruments.add(self.bass)
+        self.assertIn(self.clyde, self.search(instruments=['Bass'], location=self.here))
+
+        self.larry.instruments.remove(self.bass)
+        self.assertNotIn(self.larry, self.search(instruments=['Bass']))
+
+        self.jaco.location = self.here
+        self.jaco.save()
+        self.assertIn(self.jaco, self.search(instruments=['Bass'], location=self.here))
+
+        self.funk.user_set.clear()
+        self.assertEqual([], self.search(genres=['Funk']))
+
+    def test_rebuild_matches_incremental_index(self):
+        before = self.search(genres=['Funk'], instruments=['Bass', 'Drums'])
+        self.assertEqual(4, rebuild_index(batch_size=2))
+        self.assertEqual(before, self.search(genres=['Funk'], instruments=['Bass', 'Drums']))
+
+    def test_search_view(self):
+        response = self.client.get('/bandshare/musicians/search/',
+                                   {'genre': 'Funk', 'instrument': 'Bass', 'location': self.here.id})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['bootsy', 'larry'], [r['display_name'] for r in response.json()['results']])
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.here = Location.objects.create(state='California', city='Oakland', postal_code='94607')
+        cls.funk = Genre.objects.create(name='Funk')
+        cls.polka = Genre.objects.create(name='Polka')
+        cls.bass = Instrument.objects.create(name='Bass')
+        cls.drums = Instrument.objects.create(name='Drums')
+
+        def user(name, genres=(), instruments=(), location=None):
+            u = User.objects.create(first_name=name, last_name='X', display_name=name.lower(),
+                                    birth_date=some_date, location=location)
+            u.genres.add(*genres)
+            u.instruments.add(*instruments)
+            return u
+
+        cls.leader = user('Leader', [cls.funk], [cls.drums])
+        cls.bassist = user('Bassist', [cls.funk], [cls.bass], cls.here)
+        cls.drummer = user('Drummer', [cls.funk], [cls.drums])
+        cls.polka_fan = user('Polka', [cls.polka], [cls.drums])
+
+        cls.group = Group.objects.create(name='The Funk', created_by=cls.leader, location=cls.here)
+        cls.group.genres.add(cls.funk)
+        cls.group.members.add(cls.leader, through_defaults={'role': 'Drums'})
+
+    def test_scores_genre_gap_and_proximity(self):
+        score_all()
+        ranked = recommended_users(self.group)
+        users = [u for u, _ in ranked]
+        # Bassist likes funk, fills the bass gap and is local; drummer only likes funk.
+        self.assertEqual([self.bassist, self.drummer], users)
+        self.assertAlmostEqual(2.25, ranked[0][1])
+        self.assertAlmostEqual(1.0, ranked[1][1])
+        self.assertNotIn(self.leader, users)
+
+    def test_members_cover_their_instruments_in_every_chunk(self):
+        side = Group.objects.create(name='Side', created_by=self.drummer)
+        side.genres.add(self.funk)
+        side.members.add(self.drummer, through_defaults={'role': 'Leader'})
+        score_all(chunk_size=1)
+        # The drummer's drums are covered though the role names no instrument; only bass is missing.
+        ranked = recommended_users(side)
+        self.assertEqual([self.bassist, self.leader], [u for u, _ in ranked])
+        self.assertAlmostEqual(1.5, ranked[0][1])
+        self.assertAlmostEqual(1.0, ranked[1][1])
+        self.assertEqual([self.bassist, self.drummer], [u for u, _ in recommended_users(self.group)])
+
+    def test_recommends_groups_to_users(self):
+        score_all(per_group=1)
+        self.assertEqual([self.group], [g for g, _ in recommended_groups(self.drummer)])
+        self.assertEqual([], recommended_groups(self.polka_fan))
+
+    def test_rescoring_replaces_rows(self):
+        first = score_all()
+        self.assertEqual(first, score_all())
+        self.assertEqual(first, Recommendation.objects.count())
+
+    def test_views(self):
+        score_all()
+        response = self.client.get(f'/bandshare/groups/{self.group.id}/recommendations/')
+        self.assertEqual(['bassist', 'drummer'], [r['display_name'] for r in response.json()['results']])
+        response = self.client.get(f'/bandshare/users/{self.bassist.id}/recommendations/')
+        self.assertEqual([self.group.id], [r['id'] for r in response.json()['results']])
+        self.assertEqual(404, self.client.get('/bandshare/groups/999/recommendations/').status_code)
+
+
+class GeoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('load_postal_codes', stdout=io.StringIO())
+        cls.oakland = Location.objects.create(state='California', city='Oakland', postal_code='94607')
+        cls.san_francisco = Location.objects.create(state='California', city='San Francisco', postal_code='94103')
+        cls.beverly_hills = Location.objects.create(state='California', city='Beverly Hills', postal_code='90210')
+        cls.nowhere = Location.objects.create(state='Nowhere', city='Nowhere', postal_code='00000')
+
+        cls.jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim',
+                                      birth_date=some_date, location=cls.san_francisco)
+        cls.pam = User.objects.create(first_name='Pam', last_name='Beesly', display_name='pam',
+                                      birth_date=some_date, location=cls.beverly_hills)
+        cls.group = Group.objects.create(name='Scranton Strangler', created_by=cls.jim, location=cls.oakland)
+
+    def test_geohash(self):
+        self.assertEqual('u4pruydqqvj', geo.encode(57.64911, 10.40744, 11))
+        lat, lon, lat_err, lon_err = geo.decode('u4pruydqqvj')
+        self.assertAlmostEqual(57.64911, lat, delta=lat_err)
+        self.assertAlmostEqual(10.40744, lon, delta=lon_err)
+        self.assertEqual(8, len(geo.neighbors('9q8yy')))
+
+    def test_haversine(self):
+        # Oakland to Beverly Hills is roughly 540 km.
+        distance = geo.haversine_km(37.8044, -122.2940, 34.0901, -118.4065)
+        self.assertAlmostEqual(540, distance, delta=5)
+
+    def test_locations_are_geocoded_from_postal_codes(self):
+        self.assertAlmostEqual(37.8044, self.oakland.latitude)
+        self.assertTrue(self.oakland.geohash.startswith('9q9p'))
+        self.assertFalse(self.nowhere.has_coordinates)
+        self.assertEqual('', self.nowhere.geohash)
+
+    def test_within(self):
+        found = Location.objects.within(self.oakland.latitude, self.oakland.longitude, 25)
+        self.assertEqual([self.oakland, self.san_francisco], [loc for loc, _ in found])
+        self.assertAlmostEqual(0, found[0][1])
+
+        found = Location.objects.within(self.oakland.latitude, self.oakland.longitude, 600)
+        self.assertEqual([self.oakland, self.san_francisco, self.beverly_hills], [loc for loc, _ in found])
+
+    def test_nearest(self):
+        found = Location.objects.nearest(self.beverly_hills.latitude, self.beverly_hills.longitude, k=2,
+                                         max_radius_km=1000)
+        self.assertEqual([self.beverly_hills, self.oakland], [loc for loc, _ in found])
+
+    def test_users_and_groups_within(self):
+        self.assertEqual([self.jim], [u for u, _ in users_within(self.oakland, 25)])
+        self.assertEqual([self.group], [g for g, _ in groups_within(self.san_francisco, 25)])
+        self.assertEqual([], groups_within(self.beverly_hills, 25))
+
+    def test_musician_search_by_radius(self):
+        bass = Instrument.objects.create(name='Bass')
+        self.jim.instruments.add(bass)
+        self.pam.instruments.add(bass)
+        found = search_musicians(instruments=['Bass'], location=self.oakland, radius_km=25)
+        self.assertEqual([self.jim], [u for u, _ in found])
+        self.assertEqual([], search_musicians(instruments=['Bass'], location=self.oakland))
+
+    def test_load_postal_codes_geocodes_existing_locations(self):
+        Location.objects.filter(pk=self.nowhere.pk).update(latitude=None, longitude=None)
+        PostalCode.objects.create(country=self.nowhere.country, postal_code='00000', latitude=10, longitude=10)
+        call_command('load_postal_codes', stdout=io.StringIO())
+        self.nowhere.refresh_from_db()
+        self.assertEqual(geo.encode(10, 10), self.nowhere.geohash)
+
+
+class SetlistModelTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        cls.group = Group.objects.create(name='Supergroup', created_by=cls.jim)
+        cls.artist = Artist.objects.create(name='Throwing Muses')
+
+        def song(title, minutes, bpm, key, meter):
+            return Song.objects.create(title=title, artist=cls.artist, bpm=bpm, musical_key=key, time_signature=meter,
+                                       duration_seconds=dt.timedelta(minutes=minutes))
+
+        cls.a = song('A', 3, 100, MusicalKey.C_Major, TimeSignature.Four_Four)
+        cls.b = song('B', 4, 120, MusicalKey.G_Major, TimeSignature.Four_Four)
+        cls.c = song('C', 5, 90, MusicalKey.G_Major, TimeSignature.Three_Four)
+
+    def setUp(self):
+        self.setlist = Setlist.objects.create(title='Tour', owner_group=self.group)
+
+    def assertOrder(self, songs):
+        self.assertEqual([s.id for s in songs], self.setlist.song_ids)
+        self.assertEqual(songs, list(self.setlist.ordered_songs()))
+
+    def test_add_songs_maintains_summary(self):
+        self.setlist.add_songs([self.a, self.b])
+        self.setlist.add_song(self.c, position=1)
+        self.assertOrder([self.a, self.c, self.b])
+
+        setlist = Setlist.objects.get(pk=self.setlist.pk)
+        self.assertEqual(3, setlist.song_count)
+        self.assertEqual(dt.timedelta(minutes=12), setlist.total_duration)
+        self.assertEqual([100, 90, 120], setlist.bpm_curve)
+        self.assertEqual(1, setlist.key_changes)
+        self.assertEqual({'4/4': 2, '3/4': 1}, setlist.time_signature_counts)
+
+    def test_summary_is_one_query(self):
+        self.setlist.add_songs([self.a, self.b, self.c])
+        with self.assertNumQueries(1):
+            summary = Setlist.objects.get(pk=self.setlist.pk).summary
+        self.assertEqual(3, summary['song_count'])
+
+    def test_duplicates_are_skipped(self):
+        self.setlist.add_songs([self.a, self.a])
+        self.setlist.add_song(self.a)
+        self.assertEqual(1, self.setlist.song_count)
+
+    def test_remove_song(self):
+        self.setlist.add_songs([self.a, self.b, self.c])
+        self.setlist.remove_song(self.b)
+        self.assertOrder([self.a, self.c])
+        self.assertEqual(dt.timedelta(minutes=8), self.setlist.total_duration)
+        self.assertEqual(1, self.setlist.key_changes)
+
+    def test_reorder_is_one_write(self):
+        self.setlist.add_songs([self.a, self.b, self.c])
+        # Locking the row, then one UPDATE for positions and one for the summary, inside a savepoint.
+        with self.assertNumQueries(5):
+            self.setlist.reorder([self.c.id, self.a.id, self.b.id])
+        self.assertOrder([self.c, self.a, self.b])
+        self.assertEqual([90, 100, 120], self.setlist.bpm_curve)
+        self.assertEqual(2, self.setlist.key_changes)
+
+        self.setlist.move_song(self.b, 0)
+        self.assertOrder([self.b, self.c, self.a])
+
+        with self.assertRaises(ValueError):
+            self.setlist.reorder([self.a.id])
+
+    def test_bad_positions_and_missing_songs_are_rejected(self):
+        self.setlist.add_songs([self.a, self.b])
+        with self.assertRaisesRegex(ValueError, "Position must be 0 or more"):
+            self.setlist.add_songs([self.c], position=-1)
+        with self.assertRaisesRegex(ValueError, "Position must be 0 or more"):
+            self.setlist.move_song(self.a, -1)
+        with self.assertRaisesRegex(ValueError, f"Song {self.c.id} is not in the setlist"):
+            self.setlist.move_song(self.c, 0)
+        self.setlist.move_song(self.a, 10)
+        self.assertOrder([self.b, self.a])
+
+    def test_edits_through_stale_instances_are_not_lost(self):
+        other = Setlist.objects.get(pk=self.setlist.pk)
+        self.setlist.add_songs([self.a, self.b])
+        other.add_song(self.c, 0)
+        other.remove_song(self.a)
+        self.setlist.move_song(self.c, 1)
+        self.setlist.refresh_from_db()
+        self.assertOrder([self.b, self.c])
+
+    def test_m2m_manager_keeps_summary(self):
+        self.setlist.songs.add(self.a, self.b)
+        self.setlist.refresh_from_db()
+        self.assertEqual(2, self.setlist.song_count)
+        self.setlist.songs.remove(self.a)
+        self.setlist.refresh_from_db()
+        self.assertOrder([self.b])
+
+    def test_song_changes_update_summary(self):
+        self.setlist.add_songs([self.a, self.b])
+        self.b.bpm = 140
+        self.b.save()
+        self.setlist.refresh_from_db()
+        self.assertEqual([100, 140], self.setlist.bpm_curve)
+
+        self.a.delete()
+        self.setlist.refresh_from_db()
+        self.assertOrder([self.b])
+        self.assertEqual(dt.timedelta(minutes=4), self.setlist.total_duration)
+
+
+class ImportSongsTests(TestCase):
+    def import_file(self, content, suffix, **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.unlink, f.name)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_songs', f.name, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_csv(self):
+        Artist.objects.create(name='Throwing Muses')
+        out, err = self.import_file(
+            "title,artist,genres,release_date,musical_key,time_signature,bpm,duration\n"
+            "Bright Yellow Gun,Throwing Muses,Indie Rock;Alternative,1994-12-01,E,4/4,132,3:41\n"
+            "Dizzy,Throwing Muses,Indie Rock,,,,,\n"
+            "Too Fast,Someone,,,,,400,\n"
+            "Too Long,Someone,,,,,,3601\n"
+            "Bad Key,Someone,,,H,,,\n", '.csv')
+
+        self.assertIn("Imported 2 songs, skipped 3", out)
+        self.assertIn("Row 3: bpm", err)
+        self.assertEqual(1, Artist.objects.filter(name='Throwing Muses').count())
+        self.assertFalse(Artist.objects.filter(name='Someone').exists())
+
+        song = Song.objects.get(title='Bright Yellow Gun')
+        self.assertEqual(dt.timedelta(minutes=3, seconds=41), song.duration_seconds)
+        self.assertEqual(dt.date(1994, 12, 1), song.release_date)
+        self.assertEqual(132, song.bpm)
+        self.assertEqual({'Indie Rock', 'Alternative'}, set(song.genres.values_list('name', flat=True)))
+        self.assertEqual(120, Song.objects.get(title='Dizzy').bpm)
+
+    def test_import_jsonl(self):
+        rows = [{'title': f'Song {i}', 'artist': f'Artist {i % 3}', 'genres': ['Rock', f'Genre {i % 2}'],
+                 'bpm': 100, 'duration': 200} for i in range(25)]
+        self.import_file('\n'.join(json.dumps(r) for r in rows), '.jsonl', batch_size=10)
+        self.assertEqual(25, Song.objects.count())
+        self.assertEqual(3, Artist.objects.count())
+        self.assertEqual(3, Genre.objects.count())
+        self.assertEqual(50, Song.genres.through.objects.count())
+        self.assertEqual([9, 8, 8], list(Artist.objects.order_by('name').values_list('song_count', flat=True)))
+        self.assertEqual(25, Genre.objects.get(name='Rock').song_count)
+
+    def test_malformed_jsonl_lines_are_skipped(self):
+        lines = ['{"title": "Dizzy", "artist": "Throwing Muses"}', '{"title": "Broken', '["not", "an", "object"]',
+                 '{"title": 7, "artist": "Someone"}', '{"title": "Long", "artist": "%s"}' % ('x' * 300),
+                 '{"title": "Odd", "artist": "Someone", "genres": ["Rock", 5], "duration": [3]}',
+                 '{"title": "Bad date", "artist": "Someone", "release_date": 1994}',
+                 '{"title": "Late", "artist": "Throwing Muses", "genres": "Rock"}']
+        out, err = self.import_file('\n'.join(lines), '.jsonl', batch_size=1)
+        self.assertIn("Imported 2 songs, skipped 6", out)
+        self.assertIn("Row 2: Invalid JSON", err)
+        self.assertIn("Row 4: title: Must be a string.", err)
+        self.assertEqual(['Dizzy', 'Late'], list(Song.objects.order_by('id').values_list('title', flat=True)))
+
+    def test_queries_do_not_grow_per_row(self):
+        rows = [{'title': f'Song {i}', 'artist': 'Artist', 'genres': 'Rock'} for i in range(200)]
+        # Artist and genre lookups/creates (and indexing the artist) in the first batch,
+        # then per batch two inserts, two to index the songs and two to count them.
+        with self.assertNumQueries(8 + 4 * 8):
+            SongImporter(batch_size=50).run(enumerate(rows, start=1))
+        self.assertEqual(200, Song.objects.count())
+
+    def test_rows_are_numbered_by_file_line(self):
+        out, err = self.import_file('{"title": "Dizzy", "artist": "Throwing Muses"}\n\n\n{"title": 7}\n', '.jsonl')
+        self.assertIn("Imported 1 songs, skipped 1", out)
+        self.assertIn("Row 4: title: Must be a string.", err)
+        out, err = self.import_file("title,artist,bpm\nDizzy,Throwing Muses,\n\nToo Fast,Someone,400\n", '.csv')
+        self.assertIn("Row 3: bpm", err)
+
+    def test_name_cache_keeps_recently_used_names(self):
+        names = NameCache(Genre, max_size=2)
+        names.resolve(['Rock'])
+        names.resolve(['Jazz'])
+        with self.assertNumQueries(0):
+            names.resolve(['Rock'])
+        names.resolve(['Folk'])
+        self.assertEqual(['Rock', 'Folk'], list(names.ids))
+        # A batch bigger than max_size is kept whole until the next one.
+        names.resolve(['Blues', 'Soul', 'Funk'])
+        self.assertEqual({'Blues', 'Soul', 'Funk'}, set(names.ids))
+
+
+class HarmonyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = Artist.objects.create(name='Throwing Muses')
+
+        def song(title, key, bpm, meter=TimeSignature.Four_Four):
+            return Song.objects.create(title=title, artist=cls.artist, musical_key=key, bpm=bpm, time_signature=meter)
+
+        cls.seed = song('Seed', MusicalKey.C_Major, 120)
+        cls.same_key = song('Same key', MusicalKey.C_Major, 124)
+        cls.relative = song('Relative', MusicalKey.A_Minor, 118)
+        cls.fifth = song('Fifth', MusicalKey.G_Major, 120)
+        cls.fourth = song('Fourth', MusicalKey.F_Major, 127)
+        cls.far_key = song('Far key', MusicalKey.Fs_Major, 120)
+        cls.too_fast = song('Too fast', MusicalKey.C_Major, 140)
+        cls.waltz = song('Waltz', MusicalKey.C_Major, 120, TimeSignature.Three_Four)
+
+    def test_compatible_keys(self):
+        self.assertEqual(['C', 'Am', 'F', 'G'], [COMPATIBLE_KEYS['C'][0], *sorted(COMPATIBLE_KEYS['C'][1:])])
+        self.assertCountEqual(['Am', 'C', 'Dm', 'Em'], COMPATIBLE_KEYS['Am'])
+        self.assertCountEqual(['F♯', 'D♯m', 'B', 'D♭'], COMPATIBLE_KEYS['F♯'])
+        self.assertEqual(6, key_distance('C', 'F♯'))
+        self.assertEqual(2, key_distance('C', 'Em'))
+        self.assertIsNone(key_distance('C', ''))
+
+    def test_compatible_songs(self):
+        found = compatible_songs(self.seed)
+        self.assertEqual([self.same_key, self.fifth, self.relative, self.fourth], [s for s, _, _ in found])
+        self.assertEqual((0, 4), found[0][1:])
+
+        found = compatible_songs(self.seed, bpm_window=3, exclude=[self.fifth.pk])
+        self.assertEqual([self.relative], [s for s, _, _ in found])
+
+    def test_query_count_is_bounded(self):
+        with self.assertNumQueries(8):
+            compatible_songs(self.seed, limit=2)
+
+    def test_next_view(self):
+        response = self.client.get(f'/bandshare/songs/{self.seed.id}/next/', {'limit': 2})
+        self.assertEqual(['Same key', 'Fifth'], [r['title'] for r in response.json()['results']])
+        for params in ({'limit': -1}, {'limit': 0}, {'bpm_window': -2}, {'limit': 'ten'}):
+            self.assertEqual(400, self.client.get(f'/bandshare/songs/{self.seed.id}/next/', params).status_code)
+
+
+class SetlistGeneratorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        cls.group = Group.objects.create(name='Supergroup', created_by=cls.jim)
+        artist = Artist.objects.create(name='Throwing Muses')
+        keys = [MusicalKey.C_Major, MusicalKey.G_Major, MusicalKey.A_Minor, MusicalKey.E_Minor, MusicalKey.D_Major]
+        cls.songs = [
+            Song.objects.create(title=f'Song {i}', artist=artist, musical_key=keys[i % len(keys)],
+                                bpm=70 if i % 4 == 0 else 100 + i, time_signature=TimeSignature.Four_Four,
+                                duration_seconds=dt.timedelta(minutes=3, seconds=10 * (i % 5)))
+            for i in range(40)
+        ]
+        old = Setlist.objects.create(title='Old set', owner_group=cls.group)
+        old.add_songs(cls.songs)
+
+    def test_plan_meets_target_and_constraints(self):
+        opener, closer = self.songs[5], self.songs[6]
+        plan = plan_setlist(self.songs, dt.timedelta(minutes=60), opener=opener, closer=closer)
+
+        self.assertTrue(plan.complete)
+        self.assertLessEqual(abs(plan.duration - dt.timedelta(minutes=60)), dt.timedelta(minutes=3))
+        self.assertEqual(plan.duration, sum((s.duration_seconds for s in plan.songs), dt.timedelta()))
+        self.assertEqual(opener, plan.songs[0])
+        self.assertEqual(closer, plan.songs[-1])
+        self.assertEqual(len(plan.songs), len(set(plan.songs)))
+        for a, b in zip(plan.songs, plan.songs[1:]):
+            self.assertFalse(a.bpm < 80 and b.bpm < 80, "back-to-back ballads")
+        for a, b, c in zip(plan.songs, plan.songs[1:], plan.songs[2:]):
+            self.assertFalse(a.musical_key == b.musical_key == c.musical_key, "three in a row in one key")
+
+    def test_plan_prefers_smooth_transitions(self):
+        plan = plan_setlist(self.songs, dt.timedelta(minutes=30))
+        shuffled = list(plan.songs)
+        random.Random(1).shuffle(shuffled)
+
+        def cost(songs):
+            return sum(transition_cost(a, b) for a, b in zip(songs, songs[1:]))
+        self.assertLess(cost(plan.songs), cost(shuffled))
+
+    def test_unreachable_target_is_incomplete(self):
+        plan = plan_setlist(self.songs[:3], dt.timedelta(hours=2))
+        self.assertFalse(plan.complete)
+
+    def test_generate_setlist_from_group_pool(self):
+        setlist, plan = generate_setlist(self.group, 'Friday', dt.timedelta(minutes=45))
+        self.assertEqual([s.id for s in plan.songs], setlist.song_ids)
+        self.assertEqual(plan.duration, setlist.total_duration)
+        self.assertEqual(self.group, setlist.owner_group)
+
+
+@override_settings(BANDSHARE_QUERY_STATS_SAMPLE_RATE=1.0, BANDSHARE_QUERY_STATS_ENDPOINT=True)
+class QueryStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        artist = Artist.objects.create(name='Throwing Muses')
+        cls.song = Song.objects.create(title='Dizzy', artist=artist)
+        cls.jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        cls.group = Group.objects.create(name='Supergroup', created_by=cls.jim)
+        for i in range(3):
+            member = User.objects.create(first_name=f'M{i}', last_name='X', display_name=f'm{i}', birth_date=some_date)
+            cls.group.members.add(member, through_defaults={'role': 'Guitar'})
+
+    def setUp(self):
+        instrumentation.stats.clear()
+
+    def test_normalize_sql(self):
+        self.assertEqual(instrumentation.normalize_sql('SELECT * FROM t WHERE id = 12 AND name = \'x\''),
+                         instrumentation.normalize_sql('SELECT * FROM t WHERE id = 3 AND name = \'yy\''))
+        self.assertEqual('SELECT * FROM t WHERE id IN (...)',
+                         instrumentation.normalize_sql('SELECT * FROM t WHERE id IN (%s, %s, %s)'))
+
+    def test_recorder_detects_repeated_queries(self):
+        recorder = instrumentation.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for membership in GroupMembership.objects.filter(group=self.group):
+                membership.member
+        self.assertEqual(4, recorder.count)
+        [(sql, n)] = recorder.duplicates.items()
+        self.assertEqual(3, n)
+        self.assertIn('"bandshare_user"', sql)
+
+    def test_middleware_records_per_view(self):
+        for _ in range(3):
+            self.client.get(f'/bandshare/songs/{self.song.id}/next/')
+        summary = instrumentation.view_stats()
+        self.assertEqual(3, summary['song_next']['requests'])
+        self.assertGreater(summary['song_next']['queries']['p50'], 0)
+        self.assertGreaterEqual(summary['song_next']['total_ms']['p99'], summary['song_next']['db_ms']['p99'])
+
+    def test_endpoint_and_command(self):
+        self.client.get(f'/bandshare/songs/{self.song.id}/next/')
+        response = self.client.get('/bandshare/stats/queries/')
+        self.assertIn('song_next', response.json()['views'])
+
+        out = io.StringIO()
+        call_command('query_stats', stdout=out)
+        self.assertIn('song_next', out.getvalue())
+
+    @override_settings(BANDSHARE_QUERY_STATS_SAMPLE_RATE=0.0, BANDSHARE_QUERY_STATS_ENDPOINT=False)
+    def test_disabled(self):
+        self.client.get(f'/bandshare/songs/{self.song.id}/next/')
+        self.assertEqual({}, instrumentation.view_stats())
+        self.assertEqual(404, self.client.get('/bandshare/stats/queries/').status_code)
+
+
+class GroupDetailLoaderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.location = Location.objects.create(state='California', city='Oakland', postal_code='94607')
+        cls.rock = Genre.objects.create(name='Rock')
+        cls.pop = Genre.objects.create(name='Pop')
+        users = [User.objects.create(first_name=f'U{i}', last_name='X', display_name=f'u{i}', birth_date=some_date)
+                 for i in range(5)]
+        for i in range(100):
+            group = Group.objects.create(name=f'Group {i}', created_by=users[0], location=cls.location)
+            group.genres.add(cls.rock, cls.pop)
+            for user in users[:1 + i % 5]:
+                group.members.add(user, through_defaults={'role': 'Guitar'})
+
+    def load(self, n):
+        groups = list(Group.objects.with_details().order_by('id')[:n])
+        return [(g.location.city, g.created_by.display_name, [x.name for x in g.genres.all()], g.member_roles)
+                for g in groups]
+
+    def test_constant_query_count(self):
+        for n in (1, 10, 100):
+            with self.subTest(groups=n), self.assertNumQueries(3):
+                loaded = self.load(n)
+            self.assertEqual(n, len(loaded))
+
+    def test_member_roles_uses_prefetch(self):
+        group = Group.objects.with_details().get(name='Group 2')
+        with self.assertNumQueries(0):
+            roles = group.member_roles
+        self.assertEqual(['u0', 'u1', 'u2'], [r['user'].display_name for r in roles])
+
+    def test_member_roles_without_prefetch_is_one_query(self):
+        group = Group.objects.get(name='Group 4')
+        with self.assertNumQueries(1):
+            roles = group.member_roles
+        self.assertEqual(5, len(roles))
+
+    def test_group_detail_view(self):
+        cache.clear()  # Rendered pages are cached; see ResponseCacheTests.
+        group = Group.objects.get(name='Group 1')
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/bandshare/groups/{group.id}/')
+        data = response.json()
+        self.assertEqual('Group 1', data['name'])
+        self.assertEqual('Oakland', data['location']['city'])
+        self.assertCountEqual(['Rock', 'Pop'], data['genres'])
+        self.assertEqual([{'id': group.members.order_by('id')[0].id, 'display_name': 'u0', 'role': 'Guitar'},
+                          {'id': group.members.order_by('id')[1].id, 'display_name': 'u1', 'role': 'Guitar'}],
+                         data['members'])
+
+
+class ReferenceCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.genres = [Genre.objects.create(name=f'Genre {i}') for i in range(20)]
+        cls.ids = [g.id for g in cls.genres]
+
+    def setUp(self):
+        cache.clear()
+        self.ref = reference_cache.ReferenceCache(Genre)
+
+    def test_get_many_reads_through(self):
+        with self.assertNumQueries(1):
+            found = self.ref.get_many(self.ids)
+        self.assertEqual({g.id: g.name for g in self.genres}, {pk: g.name for pk, g in found.items()})
+        self.assertEqual(20, self.ref.misses)
+
+        with self.assertNumQueries(0):
+            self.ref.get_many(self.ids)
+        self.assertEqual(20, self.ref.local_hits)
+
+    def test_shared_tier_is_one_round_trip(self):
+        self.ref.get_many(self.ids)
+        other_process = reference_cache.ReferenceCache(Genre)
+        with self.assertNumQueries(0), mock.patch.object(reference_cache.cache, 'get_many',
+                                                         wraps=reference_cache.cache.get_many) as get_many:
+            found = other_process.get_many(self.ids)
+        self.assertEqual(1, get_many.call_count)
+        self.assertEqual(20, len(found))
+        self.assertEqual(20, other_process.shared_hits)
+        self.assertEqual(1.0, other_process.hit_ratio)
+
+    def test_names(self):
+        self.assertEqual({'Genre 1': self.ids[1]}, self.ref.ids_for_names(['Genre 1', 'Nope']))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ids[1], self.ref.get_by_name('Genre 1').id)
+
+    def test_save_and_delete_invalidate(self):
+        ref = reference_cache.genres
+        ref.clear_local()
+        self.assertEqual('Genre 0', ref.get(self.ids[0]).name)
+
+        Genre.objects.filter(pk=self.ids[0]).update(name='Stale')
+        self.assertEqual('Genre 0', ref.get(self.ids[0]).name)
+
+        genre = Genre.objects.get(pk=self.ids[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            genre.name = 'Renamed'
+            genre.save()
+            # Not until the edit commits, so no one caches the old row under the new version.
+            self.assertEqual('Genre 0', ref.get(self.ids[0]).name)
+        self.assertEqual('Renamed', ref.get(self.ids[0]).name)
+        self.assertEqual({'Renamed': self.ids[0]}, ref.ids_for_names(['Renamed']))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            genre.delete()
+        self.assertIsNone(ref.get(self.ids[0]))
+
+    def test_version_change_from_another_process_clears_local(self):
+        self.ref.get_many(self.ids)
+        reference_cache.ReferenceCache(Genre).invalidate()
+        self.ref._checked = 0  # local_ttl has passed
+        with self.assertNumQueries(1):
+            self.ref.get_many(self.ids)
+
+
+class KeysetApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = Artist.objects.create(name='Throwing Muses')
+        cls.songs = [Song.objects.create(title=f'Song {i}', artist=cls.artist, bpm=100 + i) for i in range(23)]
+        # Ties on created_at must be broken by id.
+        Song.objects.filter(pk__in=[s.pk for s in cls.songs[5:10]]).update(created_at=cls.songs[5].created_at)
+
+    def get(self, path='/bandshare/songs/', **params):
+        return self.client.get(path, params)
+
+    def test_walks_every_row_once_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            response = self.get(limit=5, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(200, response.status_code)
+            data = response.json()
+            seen += [row['id'] for row in data['results']]
+            cursor = data['next']
+            if not cursor:
+                break
+        expected = list(Song.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(expected, seen)
+
+    def test_deep_page_is_one_query(self):
+        cursor = page(RESOURCES['songs'], limit=20)['next']
+        with self.assertNumQueries(1):
+            data = page(RESOURCES['songs'], limit=20, cursor=cursor)
+        self.assertEqual(3, len(data['results']))
+        self.assertIsNone(data['next'])
+
+    def test_field_selection(self):
+        data = self.get(fields='id,bpm,duration', limit=1).json()
+        self.assertEqual([{'id': self.songs[-1].id, 'bpm': 122, 'duration': 180.0}], data['results'])
+        with CaptureQueriesContext(connection) as queries:
+            self.get(fields='title', limit=1)
+        sql = queries.captured_queries[0]['sql']
+        self.assertIn('"title"', sql)
+        self.assertNotIn('"bpm"', sql)
+
+    def test_errors(self):
+        self.assertEqual(400, self.get(fields='password').status_code)
+        self.assertEqual(400, self.get(cursor='not-a-cursor').status_code)
+        self.assertEqual(400, self.get(limit=1000).status_code)
+
+    def test_etag(self):
+        response = self.get(limit=3)
+        etag = response['ETag']
+        self.assertEqual(304, self.client.get('/bandshare/songs/', {'limit': 3}, HTTP_IF_NONE_MATCH=etag).status_code)
+        Song.objects.create(title='Newest', artist=self.artist)
+        self.assertEqual(200, self.client.get('/bandshare/songs/', {'limit': 3}, HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_other_resources(self):
+        jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        group = Group.objects.create(name='Supergroup', created_by=jim)
+        setlist = Setlist.objects.create(title='Tour', owner_group=group)
+        setlist.add_songs(self.songs[:2])
+
+        self.assertEqual([{'id': self.artist.id, 'name': 'Throwing Muses'}],
+                         [{k: r[k] for k in ('id', 'name')} for r in self.get('/bandshare/artists/').json()['results']])
+        self.assertEqual('jim', self.get('/bandshare/users/').json()['results'][0]['display_name'])
+        self.assertNotIn('birth_date', self.get('/bandshare/users/').json()['results'][0])
+        self.assertEqual('Supergroup', self.get('/bandshare/groups/').json()['results'][0]['name'])
+        self.assertEqual({'id': setlist.id, 'song_count': 2, 'total_duration': 360.0},
+                         self.get('/bandshare/setlists/', fields='id,song_count,total_duration').json()['results'][0])
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        cls.group = Group.objects.create(name='Supergroup', created_by=cls.jim)
+        cls.group.members.add(cls.jim, through_defaults={'role': 'Drums'})
+        artist = Artist.objects.create(name='Throwing Muses')
+        cls.songs = [Song.objects.create(title=f'Song {i}', artist=artist, bpm=80 + 10 * i,
+                                         musical_key=MusicalKey.C_Major, time_signature=TimeSignature.Four_Four,
+                                         duration_seconds=dt.timedelta(minutes=3))
+                     for i in range(5)]
+        cls.setlist = Setlist.objects.create(title='Tour', owner_group=cls.group)
+        cls.setlist.add_songs(reversed(cls.songs))
+
+    async def assertSameAsSync(self, path):
+        sync = await sync_to_async(self.client.get)(f'/bandshare{path}')
+        response = await self.async_client.get(f'/bandshare/async{path}')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(sync.json(), response.json())
+        return response.json()
+
+    async def test_song_search(self):
+        data = await self.assertSameAsSync('/songs/search/?bpm_min=90&bpm_max=110&q=song')
+        self.assertEqual(['Song 3', 'Song 2', 'Song 1'], [s['title'] for s in data['results']])
+        self.assertEqual('Throwing Muses', data['results'][0]['artist'])
+
+    async def test_song_search_rejects_bad_numbers(self):
+        response = await self.async_client.get('/bandshare/async/songs/search/?bpm_min=fast')
+        self.assertEqual(400, response.status_code)
+
+    async def test_group_detail(self):
+        await sync_to_async(cache.clear)()
+        data = await self.assertSameAsSync(f'/groups/{self.group.id}/')
+        self.assertEqual([{'id': self.jim.id, 'display_name': 'jim', 'role': 'Drums'}], data['members'])
+
+    async def test_setlist_detail(self):
+        await sync_to_async(cache.clear)()
+        data = await self.assertSameAsSync(f'/setlists/{self.setlist.id}/')
+        self.assertEqual([s.id for s in reversed(self.songs)], [s['id'] for s in data['songs']])
+        self.assertEqual(900.0, data['total_duration'])
+
+    async def test_missing_objects_404(self):
+        for path in ('/groups/0/', '/setlists/0/'):
+            response = await self.async_client.get(f'/bandshare/async{path}')
+            self.assertEqual(404, response.status_code)
+
+    async def test_run_blocking(self):
+        self.assertEqual(6, await async_views.run_blocking(sum, [1, 2, 3]))
+
+    @override_settings(BANDSHARE_QUERY_STATS_SAMPLE_RATE=1.0)
+    async def test_query_stats_records_async_views(self):
+        await sync_to_async(instrumentation.stats.clear)()
+        await self.async_client.get(f'/bandshare/async/setlists/{self.setlist.id}/')
+        samples = instrumentation.stats.snapshot()['async_setlist_detail']
+        self.assertEqual(2, samples[0][0])
+
+
+class FullTextSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date,
+                                      bio='Drummer into shoegaze and dream pop.')
+        cls.muses = Artist.objects.create(name='Throwing Muses')
+        cls.gun = Song.objects.create(title='Bright Yellow Gun', artist=cls.muses, bpm=130,
+                                      duration_seconds=dt.timedelta(minutes=3))
+        cls.counting = Song.objects.create(title='Counting Backwards', artist=cls.muses, bpm=120,
+                                           duration_seconds=dt.timedelta(minutes=3))
+        cls.group = Group.objects.create(name='Supergroup', created_by=cls.jim, description='Loud guitars',
+                                         bio='A shoegaze band from Dunder Mifflin.')
+
+    def kinds_and_ids(self, query, **kwargs):
+        return [(h.kind, h.id) for h in fulltext.search(query, **kwargs)]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(('artist', self.muses.id), self.kinds_and_ids('throwing muses')[0])
+        self.assertEqual({('song', self.gun.id), ('song', self.counting.id)},
+                         set(self.kinds_and_ids('throwing muses')[1:]))
+
+    def test_prefix_and_kind_filter(self):
+        self.assertEqual([('song', self.gun.id)], self.kinds_and_ids('bright yel'))
+        self.assertEqual([('group', self.group.id)], self.kinds_and_ids('shoe', kinds=['group']))
+        self.assertEqual({'group', 'user'}, {kind for kind, _ in self.kinds_and_ids('shoegaze')})
+
+    def test_typo_tolerance(self):
+        self.assertEqual([('song', self.counting.id)], self.kinds_and_ids('cuonting backwards'))
+        self.assertEqual([('group', self.group.id)], self.kinds_and_ids('dundr mifflin'))
+        self.assertEqual([], self.kinds_and_ids('xyzzy'))
+
+    def test_signals_keep_index_in_sync(self):
+        self.gun.title = 'Dizzy'
+        self.gun.save()
+        self.assertEqual([], self.kinds_and_ids('bright'))
+        self.assertEqual([('song', self.gun.id)], self.kinds_and_ids('dizzy'))
+
+        self.muses.name = 'Kristin Hersh'
+        self.muses.save()
+        self.assertEqual(3, len(self.kinds_and_ids('hersh')))
+
+        group_id = self.group.id
+        self.group.delete()
+        self.assertNotIn(('group', group_id), self.kinds_and_ids('shoegaze'))
+
+    def test_rebuild_command(self):
+        fulltext.get_backend().clear()
+        self.assertEqual([], self.kinds_and_ids('throwing'))
+        out = io.StringIO()
+        call_command('rebuild_search_index', batch_size=1, stdout=out)
+        self.assertIn("Indexed 2 song documents.", out.getvalue())
+        self.assertEqual(3, len(self.kinds_and_ids('throwing')))
+
+    def test_imported_songs_are_indexed(self):
+        SongImporter().run(enumerate([{'title': 'Not Too Soon', 'artist': 'Throwing Muses'},
+                                      {'title': 'Dizzy', 'artist': 'Tanya Donelly'}], start=1))
+        self.assertEqual(['Not Too Soon'], [obj.title for _, obj, _ in fulltext.search_objects('soon')])
+        self.assertEqual(['artist', 'song'], [kind for kind, _, _ in fulltext.search_objects('tanya')])
+
+    def test_views(self):
+        results = self.client.get('/bandshare/search/', {'q': 'muses', 'kind': 'artist'}).json()['results']
+        self.assertEqual([{'kind': 'artist', 'id': self.muses.id, 'title': 'Throwing Muses'}],
+                         [{k: r[k] for k in ('kind', 'id', 'title')} for r in results])
+        self.assertEqual(400, self.client.get('/bandshare/search/', {'q': 'x', 'kind': 'venue'}).status_code)
+        self.assertEqual(400, self.client.get('/bandshare/search/', {'q': 'muses', 'limit': -1}).status_code)
+
+        results = self.client.get('/bandshare/songs/search/', {'q': 'muses count'}).json()['results']
+        self.assertEqual([self.counting.id], [r['id'] for r in results])
+
+
+class IndexTests(TestCase):
+    "The plans benchmarks/query_plans.py relies on, on a small table."
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        cls.group = Group.objects.create(name='Supergroup', created_by=cls.jim)
+
+    def assertUsesIndex(self, queryset, index):
+        self.assertIn(f'USING INDEX {index}', queryset.explain())
+
+    def test_song_indexes(self):
+        self.assertUsesIndex(Song.objects.filter(title='Dizzy'), 'song_title')
+        self.assertUsesIndex(Song.objects.filter(bpm__range=(100, 110)).order_by('bpm'), 'song_bpm')
+        self.assertUsesIndex(Song.objects.filter(release_date__year=1995), 'song_release_date')
+
+    def test_group_setlists_index(self):
+        queryset = Setlist.objects.filter(owner_group=self.group).order_by('-created_at')
+        self.assertUsesIndex(queryset, 'setlist_group_created')
+        self.assertNotIn('TEMP B-TREE', queryset.explain())
+
+    def test_membership_is_unique(self):
+        GroupMembership.objects.create(group=self.group, member=self.jim, role='Drums')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            GroupMembership.objects.create(group=self.group, member=self.jim, role='Vocals')
+
+
+class SeedTests(TestCase):
+    def test_seed_command(self):
+        out = io.StringIO()
+        call_command('seed', users=60, songs=200, stdout=out)
+        self.assertIn("rows/s", out.getvalue())
+
+        self.assertEqual(60, User.objects.count())
+        self.assertEqual(15, Group.objects.count())
+        self.assertEqual(200, Song.objects.count())
+        self.assertEqual(45, Setlist.objects.count())
+        self.assertFalse(Location.objects.filter(geohash='').exists())
+        self.assertTrue(all(group.member_roles for group in Group.objects.with_details()))
+
+        setlist = Setlist.objects.order_by('id').last()
+        self.assertEqual(setlist.song_ids, [s.id for s in setlist.ordered_songs()])
+        self.assertEqual(sum((s.duration_seconds for s in setlist.ordered_songs()), dt.timedelta(0)),
+                         setlist.total_duration)
+
+        # Derived indexes are rebuilt and new rows get fresh ids.
+        self.assertEqual(60, MusicianIndex.objects.count())
+        self.assertTrue(fulltext.search(Song.objects.first().title, kinds=['song']))
+        user = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        self.assertEqual(61, user.id)
+
+    def test_zipf_popularity(self):
+        popularity = Popularity(random.Random(1), range(100))
+        counts = collections.Counter(popularity.pick() for _ in range(10000))
+        (top, top_count), = counts.most_common(1)
+        self.assertGreater(top_count, 1000)
+        self.assertEqual(popularity.items[0], top)
+        sample = popularity.sample(5)
+        self.assertEqual(len(sample), len(set(sample)))
+        self.assertLessEqual(len(sample), 5)
+
+
+class RelationsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        cls.group = Group.objects.create(name='Supergroup', created_by=cls.jim)
+        User.objects.bulk_create([User(first_name=f'U{i}', last_name='X', display_name=f'u{i}', birth_date=some_date)
+                                  for i in range(2000)])
+        cls.user_ids = list(User.objects.exclude(pk=cls.jim.pk).order_by('id').values_list('id', flat=True))
+        cls.funk = Genre.objects.create(name='Funk')
+        cls.jazz = Genre.objects.create(name='Jazz')
+        cls.bass = Instrument.objects.create(name='Bass')
+        artist = Artist.objects.create(name='Throwing Muses')
+        Song.objects.bulk_create([Song(title=f'Song {i}', artist=artist) for i in range(50)])
+        cls.song_ids = list(Song.objects.values_list('id', flat=True))
+
+    def roles(self):
+        return dict(GroupMembership.objects.filter(group=self.group).values_list('member_id', 'role'))
+
+    def test_set_members_diffs_large_roster(self):
+        roster = {user_id: 'Guitar' for user_id in self.user_ids}
+        self.assertEqual((2000, 0, 0), relations.set_members(self.group, roster))
+        self.assertEqual(roster, self.roles())
+
+        # Re-syncing an unchanged roster is just the read.
+        with self.assertNumQueries(1):
+            self.assertEqual((0, 0, 0), relations.set_members(self.group, roster))
+
+        roster = {**{user_id: 'Bass' for user_id in self.user_ids[:10]},
+                  **{user_id: 'Guitar' for user_id in self.user_ids[20:]}, self.jim: 'Drums'}
+        # read, savepoint, delete, insert, update, member count, release
+        with self.assertNumQueries(7):
+            self.assertEqual((1, 10, 10), relations.set_members(self.group, roster))
+        self.assertEqual({relations._pk(k): v for k, v in roster.items()}, self.roles())
+        self.group.refresh_from_db()
+        self.assertEqual(len(roster), self.group.member_count)
+
+    def test_add_and_remove_members(self):
+        relations.add_members(self.group, {self.jim: 'Drums', self.user_ids[0]: 'Bass'})
+        self.assertEqual((0, 0, 1), relations.add_members(self.group, {self.jim: 'Vocals'}))
+        self.assertEqual({self.jim.id: 'Vocals', self.user_ids[0]: 'Bass'}, self.roles())
+        self.assertEqual((0, 1, 0), relations.remove_members(self.group, [self.jim]))
+        self.assertEqual({self.user_ids[0]: 'Bass'}, self.roles())
+        self.group.refresh_from_db()
+        self.assertEqual(1, self.group.member_count)
+
+    def test_remove_members_in_batches(self):
+        relations.set_members(self.group, {user_id: 'Guitar' for user_id in self.user_ids})
+        with mock.patch.object(connection.ops, 'bulk_batch_size', return_value=300):
+            self.assertEqual((0, 2000, 0), relations.set_members(self.group, {}))
+        self.assertFalse(GroupMembership.objects.filter(group=self.group).exists())
+        self.group.refresh_from_db()
+        self.assertEqual(0, self.group.member_count)
+
+    def test_members_send_m2m_changed(self):
+        received = []
+
+        def handler(sender, action, instance, pk_set, **kwargs):
+            received.append((action, instance, pk_set))
+
+        m2m_changed.connect(handler, sender=GroupMembership)
+        try:
+            relations.set_members(self.group, {self.jim: 'Drums'})
+            relations.set_members(self.group, {})
+        finally:
+            m2m_changed.disconnect(handler, sender=GroupMembership)
+        self.assertEqual([('pre_add', self.group, {self.jim.id}), ('post_add', self.group, {self.jim.id}),
+                          ('pre_remove', self.group, {self.jim.id}), ('post_remove', self.group, {self.jim.id})],
+                         received)
+
+    def test_song_genres_for_many_songs(self):
+        links = {song_id: [self.funk, self.jazz] if song_id % 2 else [self.funk] for song_id in self.song_ids}
+        # read, savepoint, the genres for the signals, insert, a count update per distinct change, release
+        with self.assertNumQueries(7):
+            self.assertEqual((75, 0, 0), relations.set_links(Song.genres, links))
+        self.assertEqual(25, self.jazz.song_set.count())
+
+        self.assertEqual((0, 0, 0), relations.add_links(Song.genres, {self.song_ids[1]: [self.funk]}))
+        self.assertEqual((0, 25, 0), relations.remove_links(Song.genres, {s: [self.jazz] for s in self.song_ids}))
+        self.assertEqual(0, self.jazz.song_set.count())
+        self.assertEqual(50, self.funk.song_set.count())
+
+    def test_user_links_keep_musician_index_in_sync(self):
+        relations.set_links(User.genres, {user_id: [self.funk] for user_id in self.user_ids[:30]})
+        relations.set_links(User.instruments, {self.jim: [self.bass], self.user_ids[0]: [self.bass]})
+        found = {user.id for user, _ in search_musicians(genres=['Funk'], instruments=['Bass'], match_all=True)}
+        self.assertEqual({self.user_ids[0]}, found)
+
+        relations.remove_links(User.genres, {self.user_ids[0]: [self.funk]})
+        self.assertEqual([], search_musicians(genres=['Funk'], instruments=['Bass'], match_all=True))
+
+
+class FeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        cls.pam = User.objects.create(first_name='Pam', last_name='Beesly', display_name='pam', birth_date=some_date)
+        cls.fan = User.objects.create(first_name='Fan', last_name='Tastic', display_name='fan', birth_date=some_date)
+        cls.group = Group.objects.create(name='Scrantonicity', created_by=cls.jim)
+        GroupMembership.objects.create(group=cls.group, member=cls.jim, role='Guitar')
+        Follow.objects.create(follower=cls.fan, user=cls.pam)
+        artist = Artist.objects.create(name='Throwing Muses')
+        cls.songs = [Song.objects.create(title=f'Song {i}', artist=artist) for i in range(3)]
+
+    def verbs(self, user, **kwargs):
+        return [(a.verb, a.group_id, a.user_id) for a in feed.feed(user, **kwargs)]
+
+    def test_changes_reach_members_and_followers(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            setlist = Setlist.objects.create(title='Gig', owner_group=self.group)
+        with self.captureOnCommitCallbacks(execute=True):
+            setlist.add_songs(self.songs[:2])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.members.add(self.pam, through_defaults={'role': 'Vocals'})
+
+        group = self.group.pk
+        self.assertEqual([('member_joined', group, self.pam.pk), ('songs_added', group, None),
+                          ('setlist_created', group, None)], self.verbs(self.jim))
+        self.assertEqual([('member_joined', group, self.pam.pk)], self.verbs(self.pam))
+        self.assertEqual([('member_joined', group, self.pam.pk)], self.verbs(self.fan))
+        songs_added = Activity.objects.get(verb='songs_added')
+        self.assertEqual(sorted(s.pk for s in self.songs[:2]), songs_added.data['song_ids'])
+
+    def test_rolled_back_changes_are_not_recorded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Setlist.objects.create(title='Gig', owner_group=self.group)
+                transaction.set_rollback(True)
+        self.assertFalse(Activity.objects.exists())
+
+    def test_bulk_membership_changes_are_recorded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            relations.add_members(self.group, {self.pam: 'Vocals', self.fan: 'Drums'})
+        joined = Activity.objects.get(verb='member_joined')
+        self.assertEqual(sorted([self.pam.pk, self.fan.pk]), joined.data['user_ids'])
+        self.assertEqual([joined], feed.feed(self.jim))
+
+    def test_large_group_is_pulled_and_pages_merge(self):
+        with override_settings(BANDSHARE_FEED_FANOUT_LIMIT=1):
+            feed.record(Activity.Verb.SETLIST_CREATED, group=self.group)
+            GroupMembership.objects.create(group=self.group, member=self.fan, role='Bass')
+            big = feed.record(Activity.Verb.SETLIST_CREATED, group=self.group)
+            feed.record(Activity.Verb.MEMBER_JOINED, group=Group.objects.create(name='Solo', created_by=self.pam),
+                        user=self.pam)
+        self.assertTrue(PullSource.objects.filter(group=self.group).exists())
+        self.assertFalse(TimelineEntry.objects.filter(activity=big).exists())
+
+        # The fan gets pam's activity pushed and the big group's pulled, newest first.
+        ids = feed.feed_ids(self.fan)
+        self.assertEqual(3, len(ids))
+        self.assertEqual(sorted(ids, reverse=True), ids)
+        self.assertEqual(ids[:1], feed.feed_ids(self.fan, limit=1))
+        self.assertEqual(ids[1:], feed.feed_ids(self.fan, before=ids[0]))
+
+        # One query for pushed entries and one for every pull source's activities.
+        with override_settings(BANDSHARE_FEED_FANOUT_LIMIT=0):
+            feed.record(Activity.Verb.SETLIST_CREATED, group=self.group, user=self.pam)
+        self.assertEqual(2, PullSource.objects.count())
+        with self.assertNumQueries(2):
+            self.assertEqual(4, len(feed.feed_ids(self.fan)))
+
+    def test_feed_view(self):
+        for i in range(3):
+            feed.record(Activity.Verb.SONGS_ADDED, group=self.group, song=self.songs[i])
+        response = self.client.get(f'/bandshare/users/{self.jim.pk}/feed/', {'limit': 2})
+        data = response.json()
+        self.assertEqual(['Song 2', 'Song 1'], [a['song']['title'] for a in data['results']])
+        data = self.client.get(f'/bandshare/users/{self.jim.pk}/feed/', {'before': data['next']}).json()
+        self.assertEqual(['Song 0'], [a['song']['title'] for a in data['results']])
+        self.assertIsNone(data['next'])
+        for params in ({'before': 'x'}, {'limit': 0}, {'limit': -3}):
+            self.assertEqual(400, self.client.get(f'/bandshare/users/{self.jim.pk}/feed/', params).status_code)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.router.replicas = ['replica1']
+
+    def test_reads_go_to_the_primary_after_a_write(self):
+        def request():
+            first = self.router.db_for_read(Song)
+            self.assertEqual('default', self.router.db_for_write(Song))
+            return first, self.router.db_for_read(Song)
+
+        self.assertEqual(('replica1', 'default'), contextvars.copy_context().run(request))
+        self.assertEqual('default', ReplicaRouter().db_for_read(Song))
+        self.assertFalse(self.router.allow_migrate('replica1', 'bandshare'))
+
+    def test_middleware_pins_unsafe_requests(self):
+        routed = []
+        middleware = PinPrimaryMiddleware(lambda request: routed.append(self.router.db_for_read(Song)))
+        context = contextvars.copy_context()
+        for request in (RequestFactory().post('/'), RequestFactory().get('/')):
+            context.run(middleware, request)
+        self.assertEqual(['default', 'replica1'], routed)
+
+    def test_production_settings(self):
+        environ = {'DJANGO_SECRET_KEY': 'x', 'DJANGO_ALLOWED_HOSTS': 'a.example, b.example',
+                   'POSTGRES_HOST': 'db', 'POSTGRES_REPLICA_HOSTS': 'db-r1,db-r2'}
+        with mock.patch.dict(os.environ, environ):
+            production = importlib.import_module('config.production')
+            production = importlib.reload(production)
+        self.assertEqual(['a.example', 'b.example'], production.ALLOWED_HOSTS)
+        self.assertEqual(['default', 'replica1', 'replica2'], list(production.DATABASES))
+        self.assertEqual('db-r2', production.DATABASES['replica2']['HOST'])
+        self.assertEqual(10, production.DATABASES['default']['OPTIONS']['pool']['max_size'])
+        self.assertNotIn('CONN_MAX_AGE', production.DATABASES['default'])
+
+        with mock.patch.dict(os.environ, {'DJANGO_SECRET_KEY': 'x'}, clear=True):
+            production = importlib.reload(production)
+        self.assertEqual(['default'], list(production.DATABASES))
+        self.assertEqual(600, production.DATABASES['default']['CONN_MAX_AGE'])
+
+
+class SQLiteSettingsTests(TestCase):
+    def test_pragmas_are_applied(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(1, cursor.fetchone()[0])  # NORMAL
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(2, cursor.fetchone()[0])  # MEMORY
+
+
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        cls.pam = User.objects.create(first_name='Pam', last_name='Beesly', display_name='pam', birth_date=some_date)
+        cls.group = Group.objects.create(name='Scrantonicity', created_by=cls.jim)
+        GroupMembership.objects.create(group=cls.group, member=cls.jim, role='Guitar')
+        cls.artist = Artist.objects.create(name='Throwing Muses')
+        cls.other_artist = Artist.objects.create(name='Pixies')
+        cls.song = Song.objects.create(title='Bright Yellow Gun', artist=cls.artist)
+        cls.other_song = Song.objects.create(title='Gigantic', artist=cls.other_artist)
+        cls.setlist = Setlist.objects.create(title='Gig', owner_group=cls.group)
+        cls.setlist.add_songs([cls.song])
+        cls.other_setlist = Setlist.objects.create(title='Encore', owner_group=cls.group)
+        cls.other_setlist.add_songs([cls.other_song])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_group_page_is_cached_until_it_changes(self):
+        url = f'/bandshare/groups/{self.group.pk}/'
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.members.add(self.pam, through_defaults={'role': 'Vocals'})
+        third = self.client.get(url)
+        self.assertEqual(['jim', 'pam'], [m['display_name'] for m in third.json()['members']])
+        self.assertNotEqual(first['ETag'], third['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pam.display_name = 'pb'
+            self.pam.save()
+        self.assertEqual(['jim', 'pb'], [m['display_name'] for m in self.client.get(url).json()['members']])
+
+    def test_group_page_follows_roles_location_and_genres(self):
+        url = f'/bandshare/groups/{self.group.pk}/'
+        place = Location.objects.create(state='Pennsylvania', city='Scranton', postal_code='18503')
+        polka = Genre.objects.create(name='Polka')
+        with self.captureOnCommitCallbacks(execute=True):
+            Group.objects.filter(pk=self.group.pk).update(location=place)
+            self.group.genres.add(polka)
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            relations.add_members(self.group, {self.jim: 'Drums'})
+        self.assertEqual(['Drums'], [m['role'] for m in self.client.get(url).json()['members']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place.city = 'Dunmore'
+            place.save()
+            polka.name = 'Polka Rock'
+            polka.save()
+        page = self.client.get(url).json()
+        self.assertEqual(('Dunmore', ['Polka Rock']), (page['location']['city'], page['genres']))
+
+    def test_conditional_get(self):
+        url = f'/bandshare/setlists/{self.setlist.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+        self.assertEqual(304, self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code)
+        self.assertEqual(200, self.client.get(url, HTTP_IF_NONE_MATCH='"stale"').status_code)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.setlist.add_songs([self.other_song])
+        self.assertEqual(200, self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+
+    def test_song_edit_invalidates_only_setlists_containing_it(self):
+        url, other_url = f'/bandshare/setlists/{self.setlist.pk}/', f'/bandshare/setlists/{self.other_setlist.pk}/'
+        self.client.get(url)
+        self.client.get(other_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.artist.name = 'Muses'
+            self.artist.save()
+        with self.assertNumQueries(0):
+            self.client.get(other_url)
+        self.assertEqual('Muses', self.client.get(url).json()['songs'][0]['artist'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Song.objects.get(pk=self.other_song.pk).save()
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(other_url)
+        self.assertTrue(queries.captured_queries)
+
+    def test_missing_objects_and_rolled_back_changes(self):
+        self.assertEqual(404, self.client.get('/bandshare/setlists/0/').status_code)
+        self.assertEqual(404, self.client.get('/bandshare/setlists/0/').status_code)
+
+        url = f'/bandshare/groups/{self.group.pk}/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.group.members.add(self.pam, through_defaults={'role': 'Vocals'})
+                transaction.set_rollback(True)
+        self.assertEqual(etag, self.client.get(url)['ETag'])
+
+
+@override_settings(BANDSHARE_JOBS_EAGER=False)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(jobs.TASKS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+        self.failures = 0
+
+        @jobs.task('test.record')
+        def record(value):
+            self.calls.append(value)
+
+        @jobs.task('test.flaky', max_attempts=2)
+        def flaky(value):
+            if self.failures:
+                self.failures -= 1
+                raise ValueError("flaky")
+            self.calls.append(value)
+
+        @jobs.task('test.slow', max_attempts=1, timeout=0.05)
+        def slow():
+            time.sleep(1)
+
+    def test_higher_priorities_run_first(self):
+        jobs.enqueue('test.record', {'value': 'low'}, priority=jobs.LOW)
+        jobs.enqueue('test.record', {'value': 'normal'})
+        jobs.enqueue('test.record', {'value': 'high'}, priority=jobs.HIGH)
+        self.assertEqual(3, jobs.work(burst=True))
+        self.assertEqual(['high', 'normal', 'low'], self.calls)
+        stats = jobs.metrics()['test.record']
+        self.assertEqual((3, 0, 0), (stats['done'], stats['failed'], stats['queued']))
+        self.assertIsNotNone(stats['duration_ms']['p95'])
+
+    def test_failed_jobs_are_retried_with_backoff(self):
+        self.failures = 3
+        job = jobs.enqueue('test.flaky', {'value': 1})
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((Job.Status.QUEUED, 1), (job.status, job.attempts))
+        self.assertIn("ValueError: flaky", job.last_error)
+        self.assertGreater(job.run_after, job.finished_at)
+        self.assertEqual(0, jobs.work(burst=True))  # Not due yet.
+
+        Job.objects.filter(pk=job.pk).update(run_after=job.finished_at)
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((Job.Status.FAILED, 2), (job.status, job.attempts))
+
+        self.failures = 1
+        job = jobs.enqueue('test.flaky', {'value': 2})
+        jobs.work(burst=True)
+        Job.objects.filter(pk=job.pk).update(run_after=job.created_at)
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((Job.Status.DONE, 2), (job.status, job.attempts))
+        self.assertEqual([2], self.calls)
+        self.assertEqual(2, jobs.metrics()['test.flaky']['retried'])
+
+    def test_dedupe_keys(self):
+        first = jobs.enqueue('test.record', {'value': 1}, dedupe_key='one')
+        second = jobs.enqueue('test.record', {'value': 1}, dedupe_key='one', priority=jobs.HIGH)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(jobs.HIGH, Job.objects.get(pk=first.pk).priority)
+
+        claimed = jobs.claim('test')
+        third = jobs.enqueue('test.record', {'value': 1}, dedupe_key='one')
+        self.assertNotEqual(claimed.pk, third.pk)
+        jobs.run(claimed)
+        jobs.work(burst=True)
+        self.assertEqual([1, 1], self.calls)
+
+    def test_timeouts_and_expired_leases(self):
+        job = jobs.enqueue('test.slow')
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual(Job.Status.FAILED, job.status)
+        self.assertIn("Timed out", job.last_error)
+
+        job = jobs.enqueue('test.record', {'value': 1})
+        jobs.claim('gone')
+        Job.objects.filter(pk=job.pk).update(locked_until=job.created_at)
+        self.assertEqual(1, jobs.requeue_expired())
+        job.refresh_from_db()
+        self.assertEqual((Job.Status.QUEUED, 1), (job.status, job.attempts))
+        self.assertIn("Worker gone stopped", job.last_error)
+
+    def test_eager_mode_runs_immediately(self):
+        with self.settings(BANDSHARE_JOBS_EAGER=True):
+            self.assertIsNone(jobs.enqueue('test.record', {'value': 1}))
+        self.assertEqual([1], self.calls)
+        self.assertFalse(Job.objects.exists())
+
+    def test_run_workers_command(self):
+        jobs.enqueue('test.record', {'value': 1})
+        jobs.enqueue('test.record', {'value': 2})
+        out = io.StringIO()
+        call_command('run_workers', workers=0, burst=True, stdout=out)
+        self.assertIn("Ran 2 jobs.", out.getvalue())
+        out = io.StringIO()
+        call_command('run_workers', stats=True, stdout=out)
+        self.assertIn('test.record', out.getvalue())
+
+    def test_search_indexing_is_queued_once_per_object(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            artist = Artist.objects.create(name='Throwing Muses')
+            artist.name = 'Throwing Muses!'
+            artist.save()
+        self.assertEqual(1, Job.objects.filter(name='search.sync').count())
+        self.assertEqual([], fulltext.search('muses', kinds=['artist']))
+        jobs.work(burst=True)
+        self.assertEqual(1, len(fulltext.search('muses', kinds=['artist'])))
+
+
+class SchedulingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.monday = dt.datetime(2030, 1, 7, tzinfo=dt.timezone.utc)
+        cls.ann, cls.bob, cls.cat = (
+            User.objects.create(first_name=name, last_name='X', display_name=name, birth_date=some_date)
+            for name in ('ann', 'bob', 'cat'))
+        cls.group = Group.objects.create(name='Trio', created_by=cls.ann)
+        cls.other = Group.objects.create(name='Side Project', created_by=cls.cat)
+        for user in (cls.ann, cls.bob, cls.cat):
+            GroupMembership.objects.create(group=cls.group, member=user, role='Any')
+        GroupMembership.objects.create(group=cls.other, member=cls.cat, role='Drums')
+
+        Availability.objects.create(user=cls.ann, weekly=scheduling.weekly_slots(
+            [(1, dt.time(18), dt.time(23)), (3, dt.time(18), dt.time(23))]))
+        Availability.objects.create(user=cls.bob, weekly=scheduling.weekly_slots(
+            [(1, dt.time(19), dt.time(22)), (3, dt.time(18), dt.time(23))]))
+        # Cat has no weekly availability, but rehearses with the side project on Thursdays.
+        Event.objects.create(group=cls.other, start=cls.monday + dt.timedelta(days=3, hours=19),
+                             end=cls.monday + dt.timedelta(days=3, hours=23), recurrence='FREQ=WEEKLY')
+
+    def suggest(self, **kwargs):
+        return [(slot.start, slot.missing) for slot in
+                scheduling.suggest(self.group, dt.timedelta(hours=2), start=self.monday, days=14, **kwargs)]
+
+    def test_weekly_slots(self):
+        bits = scheduling.unpack(scheduling.weekly_slots([(6, dt.time(22, 10), dt.time(1))]))
+        sunday = 6 * 96
+        self.assertEqual([0, 1, 2, 3] + list(range(sunday + 4 * 22 + 1, 7 * 96)), list(bits.nonzero()[0]))
+
+    def test_suggests_times_every_member_is_free(self):
+        tuesday = self.monday + dt.timedelta(days=1, hours=19)
+        with self.assertNumQueries(5):
+            suggestions = self.suggest()
+        self.assertEqual([(tuesday, []), (tuesday + dt.timedelta(days=7), [])], suggestions)
+
+        TimeOff.objects.create(user=self.bob, start=tuesday, end=tuesday + dt.timedelta(hours=2))
+        self.assertEqual([(tuesday + dt.timedelta(days=7), [])], self.suggest())
+
+        thursday = self.monday + dt.timedelta(days=3, hours=18)
+        with_two = self.suggest(min_members=2, earliest=dt.time(18, 30))
+        self.assertEqual((tuesday + dt.timedelta(days=7), []), with_two[0])
+        self.assertIn((thursday + dt.timedelta(minutes=30), [self.cat.pk]), with_two)
+
+    def test_events_of_groups_scheduled_together(self):
+        Event.objects.create(group=self.other, start=self.monday + dt.timedelta(days=8, hours=18),
+                             end=self.monday + dt.timedelta(days=8, hours=22))
+        suggestions = scheduling.suggest([self.group, self.other], dt.timedelta(hours=2), start=self.monday,
+                                         days=14)
+        self.assertEqual([self.monday + dt.timedelta(days=1, hours=19)], [slot.start for slot in suggestions])
+
+    def test_recurring_events_are_expanded_on_demand(self):
+        event = Event(group=self.group, start=self.monday, end=self.monday + dt.timedelta(hours=2),
+                      recurrence='FREQ=WEEKLY;COUNT=3')
+        weeks = [self.monday + dt.timedelta(weeks=n) for n in range(3)]
+        self.assertEqual(weeks, [s for s, e in event.occurrences(self.monday, self.monday + dt.timedelta(days=60))])
+        self.assertEqual(weeks[1:2], [s for s, e in event.occurrences(weeks[1] + dt.timedelta(hours=1), weeks[2])])
+        event.recurrence = 'FREQ=DAILY'
+        event.repeat_until = weeks[0] + dt.timedelta(days=2)
+        self.assertEqual(3, len(list(event.occurrences(self.monday, weeks[2]))))
+
+        event.recurrence = 'FREQ=SOMETIMES'
+        with self.assertRaises(ValidationError):
+            event.full_clean()
+
+    def test_schedule_view(self):
+        url = f'/bandshare/groups/{self.group.pk}/schedule/'
+        with mock.patch('bandshare.scheduling.now', return_value=self.monday):
+            response = self.client.get(url, {'duration': 120, 'days': 14, 'latest': '21:00'})
+        self.assertEqual(['2030-01-08T19:00:00Z', '2030-01-15T19:00:00Z'],
+                         [slot['start'] for slot in response.json()['results']])
+        self.assertEqual(400, self.client.get(url, {'duration': 'long'}).status_code)
+        self.assertEqual(400, self.client.get(url, {'duration': 0}).status_code)
+        self.assertEqual(400, self.client.get(url, {'limit': 0}).status_code)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        group = Group.objects.create(name='Scrantonicity', created_by=jim)
+        cls.artist = Artist.objects.create(name='The Police')
+        cls.songs = [
+            Song.objects.create(title='Roxanne', artist=cls.artist, musical_key=MusicalKey.G_Minor, bpm=134,
+                                time_signature=TimeSignature.Four_Four, duration_seconds=dt.timedelta(seconds=192)),
+            Song.objects.create(title='Message (In a Bottle)', artist=cls.artist, musical_key=MusicalKey.Bb_Major,
+                                bpm=150, duration_seconds=dt.timedelta(seconds=290.6)),
+        ]
+        cls.setlist = Setlist.objects.create(title='Opening Night', owner_group=group)
+        cls.setlist.add_songs(cls.songs)
+        cls.encore = Setlist.objects.create(title='Encore', owner_group=group)
+        cls.encore.add_songs(cls.songs[:1])
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.enterContext(override_settings(BANDSHARE_EXPORT_CACHE_DIR=tmp.name))
+        self.cache_dir = tmp.name
+
+    def download(self, format, setlist=None, headers=None):
+        url = f'/bandshare/setlists/{(setlist or self.setlist).pk}/export/{format}/'
+        response = self.client.get(url, headers=headers)
+        return response, b''.join(response.streaming_content) if response.status_code == 200 else None
+
+    def test_song_length(self):
+        self.assertEqual('3:12', self.songs[0].length)
+        self.assertEqual('4:51', self.songs[1].length)
+        self.assertEqual('1:00:05', Song(duration_seconds=dt.timedelta(minutes=60, seconds=5)).length)
+
+    def test_formats(self):
+        response, content = self.download('csv')
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="Opening Night.csv"', response['Content-Disposition'])
+        lines = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(['setlist', 'position', 'title', 'artist', 'key', 'bpm', 'time_signature', 'length'],
+                         lines[0])
+        self.assertEqual(['Opening Night', '2', 'Message (In a Bottle)', 'The Police', 'B♭', '150', '', '4:51'],
+                         lines[2])
+
+        data = json.loads(self.download('json')[1])
+        self.assertEqual({'id': self.setlist.pk, 'title': 'Opening Night', 'group': 'Scrantonicity', 'song_count': 2,
+                          'length': '8:03'}, {k: v for k, v in data['setlists'][0].items() if k != 'songs'})
+        self.assertEqual(['Roxanne', 'Message (In a Bottle)'], [s['title'] for s in data['setlists'][0]['songs']])
+
+        chordpro = self.download('chordpro')[1].decode()
+        self.assertTrue(chordpro.startswith('{title: Roxanne}\n{artist: The Police}\n{key: Gm}\n{tempo: 134}\n'))
+        self.assertIn('{new_song}\n{title: Message (In a Bottle)}', chordpro)
+        self.assertNotIn('{time: }', chordpro)
+
+        pdf = self.download('pdf')[1]
+        self.assertTrue(pdf.startswith(b'%PDF-1.4'))
+        self.assertIn(b'(Message \\(In a Bottle\\)) Tj', pdf)
+        xref = int(pdf.rsplit(b'startxref\n', 1)[1].split()[0])
+        self.assertTrue(pdf[xref:].startswith(b'xref\n0 7\n'))
+        offsets = [int(line[:10]) for line in pdf[xref:].split(b'\n')[3:9]]
+        for number, offset in enumerate(offsets, 1):
+            self.assertTrue(pdf[offset:].startswith(b'%d 0 obj' % number))
+
+        self.assertEqual(404, self.client.get(f'/bandshare/setlists/{self.setlist.pk}/export/docx/').status_code)
+
+    def test_tour_export(self):
+        url = '/bandshare/setlists/export/csv/'
+        response = self.client.get(url, {'id': [self.encore.pk, self.setlist.pk]})
+        lines = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(['Encore', 'Opening Night', 'Opening Night'], [line[0] for line in lines[1:]])
+        self.assertEqual(404, self.client.get(url, {'id': [self.setlist.pk, 0]}).status_code)
+        self.assertEqual(400, self.client.get(url, {'id': 'x'}).status_code)
+        self.assertEqual(400, self.client.get(url).status_code)
+
+    def test_rendered_exports_are_cached_until_the_setlist_changes(self):
+        hits = exports.stats['hits']
+        response, first = self.download('pdf')
+        with self.assertNumQueries(1):
+            again, second = self.download('pdf')
+        self.assertEqual(first, second)
+        self.assertEqual(hits + 1, exports.stats['hits'])
+        self.assertEqual(304, self.download('pdf', headers={'If-None-Match': response['ETag']})[0].status_code)
+
+        self.setlist.remove_song(self.songs[1])
+        changed = self.download('pdf')[1]
+        self.assertNotIn(b'Bottle', changed)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+        self.assertIn(b',The Police,', self.download('csv')[1])
+        self.artist.name = 'Police'
+        self.artist.save()
+        self.assertIn(b',Police,', self.download('csv')[1])
+
+        group = self.setlist.owner_group
+        group.name = 'The Scrantones'
+        group.save()
+        self.assertEqual('The Scrantones', json.loads(self.download('json')[1])['setlists'][0]['group'])
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        cls.pam = User.objects.create(first_name='Pam', last_name='Beesly', display_name='pam', birth_date=some_date)
+        cls.group = Group.objects.create(name='Scrantonicity', created_by=cls.jim)
+        cls.funk = Genre.objects.create(name='Funk')
+        cls.jazz = Genre.objects.create(name='Jazz')
+        cls.police = Artist.objects.create(name='The Police')
+        cls.sting = Artist.objects.create(name='Sting')
+
+    def counts(self):
+        self.group.refresh_from_db()
+        self.police.refresh_from_db()
+        self.sting.refresh_from_db()
+        self.funk.refresh_from_db()
+        self.jazz.refresh_from_db()
+        return {'members': self.group.member_count, 'police': self.police.song_count,
+                'sting': self.sting.song_count, 'funk': (self.funk.group_count, self.funk.song_count),
+                'jazz': (self.jazz.group_count, self.jazz.song_count)}
+
+    def test_members(self):
+        membership = GroupMembership.objects.create(group=self.group, member=self.jim, role='Drums')
+        self.group.members.add(self.pam, through_defaults={'role': 'Vocals'})
+        self.assertEqual(2, self.counts()['members'])
+        membership.delete()
+        self.assertEqual(1, self.counts()['members'])
+
+        relations.set_members(self.group, {self.jim: 'Drums'})
+        self.assertEqual(1, self.counts()['members'])
+        relations.remove_members(self.group, [self.jim])
+        self.group.members.clear()
+        self.assertEqual(0, self.counts()['members'])
+
+    def test_songs(self):
+        song = Song.objects.create(title='Roxanne', artist=self.police)
+        Song.objects.create(title='Message (In a Bottle)', artist=self.police)
+        self.assertEqual((2, 0), (self.counts()['police'], self.counts()['sting']))
+        song.title = 'Roxanne (Live)'
+        song.save()
+        self.assertEqual(2, self.counts()['police'])
+        song.artist = self.sting
+        song.save()
+        self.assertEqual((1, 1), (self.counts()['police'], self.counts()['sting']))
+        song.delete()
+        self.assertEqual(0, self.counts()['sting'])
+
+    def test_genres(self):
+        song = Song.objects.create(title='Roxanne', artist=self.police)
+        song.genres.add(self.funk, self.jazz)
+        song.genres.add(self.funk)
+        self.group.genres.add(self.funk)
+        self.jazz.group_set.add(self.group)
+        self.assertEqual(((1, 1), (1, 1)), (self.counts()['funk'], self.counts()['jazz']))
+
+        song.genres.remove(self.jazz, self.jazz)
+        self.funk.song_set.remove(song)
+        self.assertEqual(((1, 0), (1, 0)), (self.counts()['funk'], self.counts()['jazz']))
+        self.group.genres.clear()
+        self.assertEqual(((0, 0), (0, 0)), (self.counts()['funk'], self.counts()['jazz']))
+
+        song.genres.add(self.jazz)
+        self.group.genres.add(self.jazz)
+        self.group.delete()
+        song.delete()
+        self.jazz.refresh_from_db()
+        self.assertEqual((0, 0), (self.jazz.group_count, self.jazz.song_count))
+
+    def test_relations(self):
+        songs = [Song.objects.create(title=f'Song {i}', artist=self.police) for i in range(3)]
+        relations.set_links(Song.genres, {song: [self.funk, self.jazz] for song in songs})
+        relations.remove_links(Song.genres, {songs[0]: [self.jazz]})
+        self.assertEqual(((0, 3), (0, 2)), (self.counts()['funk'], self.counts()['jazz']))
+
+    def test_counters_never_go_negative(self):
+        song = Song.objects.create(title='Roxanne', artist=self.police)
+        Artist.objects.filter(pk=self.police.pk).update(song_count=0)
+        song.delete()
+        self.assertEqual(0, self.counts()['police'])
+
+    def test_recount_fixes_drift(self):
+        GroupMembership.objects.bulk_create([GroupMembership(group=self.group, member=self.jim, role='Drums'),
+                                             GroupMembership(group=self.group, member=self.pam, role='Vocals')])
+        Song.objects.bulk_create([Song(title='Roxanne', artist=self.sting)])
+        Genre.objects.filter(pk=self.jazz.pk).update(song_count=7)
+        out = io.StringIO()
+        call_command('recount', stdout=out)
+        self.assertIn('group.member_count: fixed 1 rows.', out.getvalue())
+        self.assertIn('genre.song_count: fixed 1 rows.', out.getvalue())
+        self.assertEqual({'members': 2, 'police': 0, 'sting': 1, 'funk': (0, 0), 'jazz': (0, 0)}, self.counts())
+        self.assertEqual({'group.member_count': 0, 'artist.song_count': 0, 'genre.group_count': 0,
+                          'genre.song_count': 0}, counters.recount())
+
+    def test_lists_read_the_counters(self):
+        self.group.members.add(self.jim, through_defaults={'role': 'Drums'})
+        Song.objects.create(title='Roxanne', artist=self.police).genres.add(self.funk)
+        with CaptureQueriesContext(connection) as queries:
+            groups = self.client.get('/bandshare/groups/').json()['results']
+            artists = self.client.get('/bandshare/artists/', {'fields': 'name,song_count'}).json()['results']
+            genres = self.client.get('/bandshare/genres/').json()['results']
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql'].upper()])
+        self.assertEqual(1, groups[0]['member_count'])
+        self.assertEqual({'Sting': 0, 'The Police': 1}, {a['name']: a['song_count'] for a in artists})
+        self.assertEqual([('Funk', 0, 1), ('Jazz', 0, 0)],
+                         [(g['name'], g['group_count'], g['song_count']) for g in genres])
+
+
+class VenueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.monday = dt.date(2030, 1, 7)
+        cls.denver = Location.objects.create(address='1 Colfax Ave', city='Denver', state='CO', postal_code='80202',
+                                             latitude=39.7392, longitude=-104.9903)
+        boulder = Location.objects.create(address='1 Pearl St', city='Boulder', state='CO', postal_code='80302',
+                                          latitude=40.0150, longitude=-105.2705)
+        springs = Location.objects.create(address='1 Tejon St', city='Colorado Springs', state='CO',
+                                          postal_code='80903', latitude=38.8339, longitude=-104.8214)
+        cls.funk = Genre.objects.create(name='Funk')
+        cls.jazz = Genre.objects.create(name='Jazz')
+        cls.bluebird = Venue.objects.create(name='Bluebird', location=cls.denver, capacity=550)
+        cls.fox = Venue.objects.create(name='Fox Theatre', location=boulder, capacity=625)
+        cls.ogden = Venue.objects.create(name='Ogden', location=cls.denver, capacity=1600)
+        cls.black_sheep = Venue.objects.create(name='Black Sheep', location=springs, capacity=450)
+        for venue in (cls.bluebird, cls.fox, cls.black_sheep):
+            venue.genres.add(cls.funk)
+        cls.ogden.genres.add(cls.jazz)
+
+        jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        cls.group = Group.objects.create(name='Scrantonicity', created_by=jim, location=cls.denver)
+        cls.group.genres.add(cls.funk)
+        Gig.objects.create(venue=cls.bluebird, group=cls.group, date=cls.monday + dt.timedelta(days=1))
+        Gig.objects.create(venue=cls.fox, group=cls.group, date=cls.monday)
+
+    def open_dates(self, **kwargs):
+        options = {'start': self.monday, 'days': 7, 'genres': [self.funk.pk], **kwargs}
+        return [(o.venue.name, [d.day for d in o.dates])
+                for o in venues.open_dates(self.denver, options.pop('radius_km', 50), **options)]
+
+    def genre_bits(self, venue):
+        venue.refresh_from_db()
+        return venue.genre_bits
+
+    def test_genre_bits_follow_the_genres(self):
+        self.assertEqual(venues.bits_to_bytes(1 << self.funk.pk), self.genre_bits(self.bluebird))
+        self.bluebird.genres.add(self.jazz)
+        self.assertEqual(venues.bits_to_bytes(1 << self.funk.pk | 1 << self.jazz.pk), self.genre_bits(self.bluebird))
+        self.bluebird.genres.remove(self.funk)
+        self.assertEqual(venues.bits_to_bytes(1 << self.jazz.pk), self.genre_bits(self.bluebird))
+        self.funk.venues.add(self.ogden)
+        self.assertEqual(venues.bits_to_bytes(1 << self.funk.pk | 1 << self.jazz.pk), self.genre_bits(self.ogden))
+        self.jazz.venues.clear()
+        self.assertEqual(venues.bits_to_bytes(1 << self.funk.pk), self.genre_bits(self.ogden))
+        self.assertEqual(b'', self.genre_bits(self.bluebird))
+
+    def test_open_dates(self):
+        week = list(range(7, 14))
+        with self.assertNumQueries(3):  # venues in range, their gigs, the venues found
+            found = self.open_dates()
+        self.assertEqual([('Bluebird', [7, *week[2:]]), ('Fox Theatre', week[1:])], found)
+        self.assertEqual([('Ogden', week)], self.open_dates(genres=['Jazz']))
+        self.assertEqual([], self.open_dates(genres=['Polka']))
+        self.assertEqual([('Fox Theatre', week[1:])], self.open_dates(min_capacity=600))
+        self.assertEqual([('Bluebird', [11, 12]), ('Fox Theatre', [11, 12])], self.open_dates(weekdays={4, 5}))
+        self.assertEqual([('Fox Theatre', [8])], self.open_dates(start=self.monday + dt.timedelta(days=1), days=1))
+        self.assertEqual(['Bluebird', 'Fox Theatre', 'Black Sheep'],
+                         [name for name, _ in self.open_dates(radius_km=120)])
+
+    def test_open_dates_stops_at_the_limit(self):
+        with mock.patch.object(venues, 'GIG_QUERY_VENUES', 1), self.assertNumQueries(4):
+            # Bluebird is booked that night, so it takes a second batch, but not a third for Black Sheep.
+            found = self.open_dates(start=self.monday + dt.timedelta(days=1), days=1, limit=1, radius_km=120)
+        self.assertEqual([('Fox Theatre', [8])], found)
+
+    def test_view(self):
+        url = '/bandshare/venues/open-dates/'
+        results = self.client.get(url, {'group': self.group.pk, 'start': '2030-01-07', 'days': 2,
+                                         'max_capacity': 600}).json()['results']
+        self.assertEqual([{'id': self.bluebird.pk, 'name': 'Bluebird', 'capacity': 550, 'city': 'Denver',
+                           'distance_km': 0.0, 'dates': ['2030-01-07']}], results)
+        results = self.client.get(url, {'location': self.denver.pk, 'genre': 'Jazz'}).json()['results']
+        self.assertEqual(['Ogden'], [r['name'] for r in results])
+        self.assertEqual(400, self.client.get(url, {'location': self.denver.pk, 'start': 'soon'}).status_code)
+        self.assertEqual(400, self.client.get(url, {'location': self.denver.pk, 'limit': 0}).status_code)
+        self.assertEqual([], venues.open_dates(self.denver, 40, limit=-1))
+        self.assertEqual(400, self.client.get(url).status_code)
+        self.assertEqual(404, self.client.get(url, {'location': 0}).status_code)
+
+    def test_gig_setlist_must_be_the_groups(self):
+        other = Group.objects.create(name='Other', created_by=self.group.created_by)
+        gig = Gig(venue=self.fox, group=self.group, date=self.monday,
+                  setlist=Setlist.objects.create(title='Theirs', owner_group=other))
+        with self.assertRaises(ValidationError):
+            gig.full_clean()
+        gig.setlist = Setlist.objects.create(title='Ours', owner_group=self.group)
+        gig.full_clean()
+
+    def test_api(self):
+        gigs = self.client.get('/bandshare/gigs/', {'fields': 'venue,date'}).json()['results']
+        self.assertEqual([{'venue': self.fox.pk, 'date': '2030-01-07'}, {'venue': self.bluebird.pk, 'date': '2030-01-08'}],
+                         gigs)
+        self.assertEqual(4, len(self.client.get('/bandshare/venues/').json()['results']))
+
+
+class Socket:
+    "A WebSocket client driving bandshare.realtime directly, without a server."
+
+    def __init__(self, path):
+        path, _, query = path.partition('?')
+        self.app = ApplicationCommunicator(realtime.application,
+                                           {'type': 'websocket', 'path': path, 'query_string': query.encode()})
+
+    async def connect(self):
+        await self.app.send_input({'type': 'websocket.connect'})
+        return await self.app.receive_output(1)
+
+    async def send(self, message):
+        await self.app.send_input({'type': 'websocket.receive', 'text': json.dumps(message)})
+
+    async def receive(self):
+        return json.loads((await self.app.receive_output(1))['text'])
+
+    async def disconnect(self):
+        await self.app.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.app.wait(1)
+
+
+class CollabTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        jim = User.objects.create(first_name='Jim', last_name='Halpert', display_name='jim', birth_date=some_date)
+        group = Group.objects.create(name='Scrantonicity', created_by=jim)
+        artist = Artist.objects.create(name='The Police')
+        cls.a, cls.b, cls.c, cls.d, cls.e, cls.f = (
+            Song.objects.create(title=title, artist=artist, duration_seconds=dt.timedelta(minutes=4))
+            for title in ('Roxanne', 'Message in a Bottle', 'So Lonely', 'Next to You', 'Canary', 'Every Breath'))
+        cls.setlist = Setlist.objects.create(title='Opening Night', owner_group=group)
+        cls.setlist.add_songs([cls.a, cls.b, cls.c, cls.d])
+
+    def song_ids(self):
+        self.setlist.refresh_from_db()
+        self.assertEqual(self.setlist.song_ids, list(self.setlist.ordered_songs().values_list('id', flat=True)))
+        return self.setlist.song_ids
+
+    def test_concurrent_ops_are_transformed(self):
+        a, b, c, d, e, f = (song.pk for song in (self.a, self.b, self.c, self.d, self.e, self.f))
+        self.assertEqual((1, {'op': 'add', 'song': e, 'position': 1}),
+                         collab.apply(self.setlist.pk, {'op': 'add', 'song': e, 'position': 1}, base=0))
+        # Made without seeing the add: D after A lands after A and the song added there first.
+        self.assertEqual((2, {'op': 'move', 'song': d, 'from': 4, 'position': 2}),
+                         collab.apply(self.setlist.pk, {'op': 'move', 'song': d, 'position': 1}, base=0))
+        collab.apply(self.setlist.pk, {'op': 'remove', 'song': b}, base=0)
+        # F before C, as of seq 1.
+        self.assertEqual((4, {'op': 'add', 'song': f, 'position': 3}),
+                         collab.apply(self.setlist.pk, {'op': 'add', 'song': f, 'position': 3}, base=1))
+        self.assertEqual([a, e, d, f, c], self.song_ids())
+        self.assertEqual(4, self.setlist.revision)
+        self.assertEqual([1, 2, 3, 4], list(SetlistOp.objects.order_by('seq').values_list('seq', flat=True)))
+
+        for op in ({'op': 'add', 'song': a}, {'op': 'remove', 'song': b}, {'op': 'move', 'song': a, 'position': 0}):
+            self.assertEqual((4, None), collab.apply(self.setlist.pk, op))
+        for op, base in (({'op': 'shuffle', 'song': a}, None), ({'op': 'move', 'song': a}, None),
+                         ({'op': 'add', 'song': 0}, None), ({'op': 'add', 'song': 'a'}, None),
+                         ({'op': 'remove', 'song': a}, 5)):
+            with self.assertRaises(collab.Rejected):
+                collab.apply(self.setlist.pk, op, base)
+        self.assertEqual([a, e, d, f, c], self.song_ids())
+
+    @mock.patch.object(collab, 'COMPACT_EVERY', 2)
+    @mock.patch.object(collab, 'KEEP_OPS', 2)
+    def test_compaction_and_catch_up(self):
+        for song in (self.e, self.f):
+            collab.apply(self.setlist.pk, {'op': 'add', 'song': song.pk})
+            collab.apply(self.setlist.pk, {'op': 'remove', 'song': song.pk})
+        collab.apply(self.setlist.pk, {'op': 'move', 'song': self.a.pk, 'position': 3})
+        self.assertEqual([3, 4, 5], list(SetlistOp.objects.order_by('seq').values_list('seq', flat=True)))
+
+        self.assertEqual([{'type': 'op', 'setlist': self.setlist.pk, 'seq': 4, 'op': 'remove', 'song': self.f.pk,
+                           'from': 4},
+                          {'type': 'op', 'setlist': self.setlist.pk, 'seq': 5, 'op': 'move', 'song': self.a.pk,
+                           'from': 0, 'position': 3}], collab.catch_up(self.setlist.pk, since=3))
+        self.assertEqual([], collab.catch_up(self.setlist.pk, since=5))
+        snapshot, = collab.catch_up(self.setlist.pk, since=1)
+        self.assertEqual(('snapshot', 5), (snapshot['type'], snapshot['seq']))
+        self.assertEqual(['Message in a Bottle', 'So Lonely', 'Next to You', 'Roxanne'],
+                         [song['title'] for song in snapshot['songs']])
+        with self.assertRaises(collab.Rejected) as raised:
+            collab.apply(self.setlist.pk, {'op': 'remove', 'song': self.b.pk}, base=1)
+        self.assertEqual('stale', raised.exception.code)
+
+        message, = collab.messages(self.setlist.pk, [(6, {'op': 'add', 'song': self.e.pk, 'position': 0})])
+        self.assertEqual('Canary', message['row']['title'])
+
+    async def test_websocket_broadcasts_ops(self):
+        path = f'/ws/setlists/{self.setlist.pk}/'
+        alice, bob = Socket(path), Socket(path)
+        for socket in (alice, bob):
+            self.assertEqual('websocket.accept', (await socket.connect())['type'])
+            self.assertEqual([self.a.pk, self.b.pk, self.c.pk, self.d.pk],
+                             [song['id'] for song in (await socket.receive())['songs']])
+
+        await alice.send({'op': 'add', 'song': self.e.pk, 'position': 0, 'base': 0, 'id': 'a1'})
+        for socket in (alice, bob):
+            op = await socket.receive()
+            self.assertEqual(('op', 1, 'add', 'Canary'), (op['type'], op['seq'], op['op'], op['row']['title']))
+        self.assertEqual({'type': 'ack', 'id': 'a1', 'seq': 1, 'applied': True}, await alice.receive())
+
+        await bob.send({'op': 'add', 'song': self.e.pk, 'id': 'b1'})
+        self.assertEqual({'type': 'ack', 'id': 'b1', 'seq': 1, 'applied': False}, await bob.receive())
+        await bob.send({'op': 'move', 'song': self.e.pk, 'id': 'b2'})
+        self.assertEqual(('error', 'b2', 'invalid'), itemgetter('type', 'id', 'code')(await bob.receive()))
+        self.assertTrue(await alice.app.receive_nothing())
+
+        # Reconnecting with the last seq seen gets only what was missed.
+        await bob.disconnect()
+        await alice.send({'op': 'remove', 'song': self.b.pk, 'base': 1})
+        await alice.receive(), await alice.receive()
+        bob = Socket(f'{path}?since=1')
+        await bob.connect()
+        self.assertEqual({'type': 'op', 'setlist': self.setlist.pk, 'seq': 2, 'op': 'remove', 'song': self.b.pk,
+                          'from': 2}, await bob.receive())
+        await alice.disconnect()
+        await bob.disconnect()
+
+        for path in ('/ws/setlists/0/', '/ws/elsewhere/', f'{path}?since=x'):
+            self.assertEqual({'type': 'websocket.close', 'code': realtime.CLOSE_NOT_FOUND},
+                             await Socket(path).connect())
+
+    async def test_ops_published_out_of_order_arrive_in_order(self):
+        socket = Socket(f'/ws/setlists/{self.setlist.pk}/')
+        await socket.connect()
+        await socket.receive()
+        first = await sync_to_async(collab.apply)(self.setlist.pk, {'op': 'add', 'song': self.e.pk})
+        second = await sync_to_async(collab.apply)(self.setlist.pk, {'op': 'remove', 'song': self.a.pk})
+        broadcasts = await sync_to_async(collab.messages)(self.setlist.pk, [first, second])
+
+        # Another process's broadcast of seq 2 overtakes seq 1: the socket is sent 1 from the log first.
+        group = f'setlist.{self.setlist.pk}'
+        await realtime.channel_layer().group_send(group, broadcasts[1])
+        received = [await socket.receive() for _ in range(2)]
+        self.assertEqual([(1, 'add'), (2, 'remove')], [itemgetter('seq', 'op')(op) for op in received])
+        await realtime.channel_layer().group_send(group, broadcasts[0])
+        self.assertTrue(await socket.app.receive_nothing())
+        await socket.disconnect()
+
+    async def test_database_errors_are_answered(self):
+        socket = Socket(f'/ws/setlists/{self.setlist.pk}/')
+        await socket.connect()
+        await socket.receive()
+        with self.assertLogs('bandshare.realtime', 'ERROR'), \
+                mock.patch.object(collab, 'apply', side_effect=OperationalError("database is locked")):
+            await socket.send({'op': 'add', 'song': self.e.pk, 'id': 'x1'})
+            self.assertEqual(('error', 'x1', 'unavailable'), itemgetter('type', 'id', 'code')(await socket.receive()))
+        await socket.send({'op': 'add', 'song': self.e.pk, 'id': 'x2'})
+        self.assertEqual(('op', 1), itemgetter('type', 'seq')(await socket.receive()))
+        self.assertEqual({'type': 'ack', 'id': 'x2', 'seq': 1, 'applied': True}, await socket.receive())
+        await socket.disconnect()
+
+    async def test_slow_sockets_are_closed(self):
+        sent = []
+
+        async def send(event):
+            sent.append(event)
+
+        connection = realtime.Connection(send)
+        for i in range(realtime.SEND_QUEUE + 1):
+            connection.push(str(i))
+        await connection.run()
+        self.assertEqual([{'type': 'websocket.close', 'code': realtime.CLOSE_TOO_SLOW}], sent)
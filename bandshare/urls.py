@@ -1,7 +1,32 @@
 from django.urls import path
 
-from . import views
+from . import api, async_views, views
 
 urlpatterns = [
     path('', views.index, name='index'),
-]
\ No newline at end of file
+    path('songs/', api.list_view, {'resource_name': 'songs'}, name='song_list'),
+    path('artists/', api.list_view, {'resource_name': 'artists'}, name='artist_list'),
+    path('groups/', api.list_view, {'resource_name': 'groups'}, name='group_list'),
+    path('setlists/', api.list_view, {'resource_name': 'setlists'}, name='setlist_list'),
+    path('genres/', views.genre_list, name='genre_list'),
+    path('venues/', api.list_view, {'resource_name': 'venues'}, name='venue_list'),
+    path('gigs/', api.list_view, {'resource_name': 'gigs'}, name='gig_list'),
+    path('users/', api.list_view, {'resource_name': 'users'}, name='user_list'),
+    path('search/', views.search, name='search'),
+    path('venues/open-dates/', views.venue_open_dates, name='venue_open_dates'),
+    path('musicians/search/', views.musician_search, name='musician_search'),
+    path('groups/<int:group_id>/', views.group_detail, name='group_detail'),
+    path('groups/<int:group_id>/recommendations/', views.group_recommendations, name='group_recommendations'),
+    path('groups/<int:group_id>/schedule/', views.group_schedule, name='group_schedule'),
+    path('users/<int:user_id>/recommendations/', views.user_recommendations, name='user_recommendations'),
+    path('users/<int:user_id>/feed/', views.user_feed, name='user_feed'),
+    path('songs/<int:song_id>/next/', views.song_next, name='song_next'),
+    path('songs/search/', views.song_search, name='song_search'),
+    path('setlists/<int:setlist_id>/', views.setlist_detail, name='setlist_detail'),
+    path('setlists/<int:setlist_id>/export/<str:format>/', views.setlist_export, name='setlist_export'),
+    path('setlists/export/<str:format>/', views.setlists_export, name='setlists_export'),
+    path('stats/queries/', views.query_stats, name='query_stats'),
+    path('async/songs/search/', async_views.song_search, name='async_song_search'),
+    path('async/groups/<int:group_id>/', async_views.group_detail, name='async_group_detail'),
+    path('async/setlists/<int:setlist_id>/', async_views.setlist_detail, name='async_setlist_detail'),
+]
@@ -1,7 +1,378 @@
-from django.shortcuts import render
-from django.http import HttpResponse
+from datetime import date, time, timedelta
+
+from django.conf import settings
+from django.shortcuts import render, get_object_or_404
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header
+
+from . import exports, feed, reference_cache, response_cache, scheduling
+from .harmony import compatible_songs
+from .instrumentation import view_stats
+from .models import User, Group, Genre, Location, Setlist, Song
+from .recommendations import recommended_users, recommended_groups
+from .search import fulltext, open_dates, search_musicians
 
 # Create your views here.
 
 def index(request):
-    return HttpResponse("Welcome to Bandshare!")
\ No newline at end of file
+    return HttpResponse("Welcome to Bandshare!")
+
+
+def _int_or_name(value):
+    return int(value) if value.isdigit() else value
+
+
+def musician_search(request):
+    """
+    Finds musicians by genre, instrument and location.
+
+    e.g. /bandshare/musicians/search/?instrument=Bass&genre=Funk&location=3&radius_km=40
+    """
+    try:
+        limit = min(int(request.GET.get('limit', 20)), 100)
+        location = request.GET.get('location')
+        location = get_object_or_404(Location, pk=int(location)) if location else None
+        radius_km = request.GET.get('radius_km')
+        radius_km = float(radius_km) if radius_km else None
+    except ValueError:
+        return JsonResponse({'error': "limit, location and radius_km must be numbers"}, status=400)
+
+    genres = [_int_or_name(g) for g in request.GET.getlist('genre')]
+    instruments = [_int_or_name(i) for i in request.GET.getlist('instrument')]
+    if location is None and not (genres or instruments):
+        return JsonResponse({'error': "pass a location, genre or instrument"}, status=400)
+    results = search_musicians(
+        genres=genres,
+        instruments=instruments,
+        location=location,
+        radius_km=radius_km,
+        match_all=request.GET.get('match') == 'all',
+        limit=limit,
+    )
+    return JsonResponse({'results': [
+        {'id': user.id, 'display_name': user.display_name, 'full_name': user.full_name, 'score': score}
+        for user, score in results
+    ]})
+
+
+def venue_open_dates(request):
+    """
+    Dates venues nearby have free, for a `group` (near its location, booking
+    its genres) or any `location` and `genre`s.
+
+    e.g. /bandshare/venues/open-dates/?group=3&radius_km=40&start=2026-11-01&days=30&weekday=4&weekday=5
+    """
+    try:
+        group = request.GET.get('group')
+        group = get_object_or_404(Group, pk=int(group)) if group else None
+        location = request.GET.get('location') or (group and group.location_id)
+        if not location:
+            return JsonResponse({'error': "pass a location or a group with one"}, status=400)
+        location = get_object_or_404(Location, pk=int(location))
+        genres = [_int_or_name(g) for g in request.GET.getlist('genre')]
+        if not genres and group:
+            genres = list(group.genres.values_list('id', flat=True))
+        radius_km = float(request.GET.get('radius_km', 40))
+        start = request.GET.get('start')
+        start = date.fromisoformat(start) if start else None
+        days = min(int(request.GET.get('days', 30)), 366)
+        capacity = {name: int(request.GET[name]) if request.GET.get(name) else None
+                    for name in ('min_capacity', 'max_capacity')}
+        weekdays = {int(day) for day in request.GET.getlist('weekday')} or None
+        limit = min(int(request.GET.get('limit', 20)), 100)
+    except ValueError:
+        return JsonResponse({'error': "group, location, days, min_capacity, max_capacity, weekday and limit must "
+                                      "be integers, radius_km a number and start a date (YYYY-MM-DD)"}, status=400)
+    if limit < 1:
+        return JsonResponse({'error': "limit must be positive"}, status=400)
+
+    return JsonResponse({'results': [
+        {'id': opening.venue.id, 'name': opening.venue.name, 'capacity': opening.venue.capacity,
+         'city': opening.venue.location.city, 'distance_km': round(opening.distance_km, 1), 'dates': opening.dates}
+        for opening in open_dates(location, radius_km, start=start, days=days, genres=genres, weekdays=weekdays,
+                                  limit=limit, **capacity)
+    ]})
+
+
+def genre_list(request):
+    "Every genre with how many groups and songs it has, from the counter columns."
+    return JsonResponse({'results': list(Genre.objects.order_by('name').values('id', 'name', 'group_count',
+                                                                               'song_count'))})
+
+
+def group_recommendations(request, group_id):
+    "Suggested musicians for a Group, from the precomputed recommendations."
+    group = get_object_or_404(Group, pk=group_id)
+    return JsonResponse({'results': [
+        {'id': user.id, 'display_name': user.display_name, 'score': round(score, 4)}
+        for user, score in recommended_users(group)
+    ]})
+
+
+def group_schedule(request, group_id):
+    """
+    Suggested rehearsal times, when the group's members (and those of any
+    other `group`s to schedule with it) are free.
+
+    e.g. /bandshare/groups/3/schedule/?duration=120&days=90&earliest=18:00&latest=23:00&min_members=4
+    """
+    groups = [get_object_or_404(Group, pk=group_id).pk, *request.GET.getlist('group')]
+    try:
+        groups = [int(group) for group in groups]
+        duration = timedelta(minutes=int(request.GET.get('duration', 120)))
+        days = min(int(request.GET.get('days', 30)), 366)
+        limit = min(int(request.GET.get('limit', 5)), 50)
+        min_members = request.GET.get('min_members')
+        min_members = int(min_members) if min_members else None
+        earliest, latest = (request.GET.get(name) for name in ('earliest', 'latest'))
+        earliest = time.fromisoformat(earliest) if earliest else None
+        latest = time.fromisoformat(latest) if latest else None
+    except ValueError:
+        return JsonResponse({'error': "group, duration, days, limit and min_members must be integers "
+                                      "and earliest and latest times (HH:MM)"}, status=400)
+    if duration <= timedelta(0) or days <= 0 or limit < 1:
+        return JsonResponse({'error': "duration, days and limit must be positive"}, status=400)
+
+    return JsonResponse({'results': [
+        {'start': slot.start, 'end': slot.end, 'available': slot.available, 'missing': slot.missing}
+        for slot in scheduling.suggest(groups, duration, days=days, limit=limit, min_members=min_members,
+                                       earliest=earliest, latest=latest)
+    ]})
+
+
+def user_recommendations(request, user_id):
+    "Suggested Groups for a User, from the precomputed recommendations."
+    user = get_object_or_404(User, pk=user_id)
+    return JsonResponse({'results': [
+        {'id': group.id, 'name': group.name, 'score': round(score, 4)}
+        for group, score in recommended_groups(user)
+    ]})
+
+
+def song_next(request, song_id):
+    """
+    Songs that flow well after a song: compatible key, same meter, close BPM.
+
+    e.g. /bandshare/songs/12/next/?bpm_window=6&limit=10
+    """
+    song = get_object_or_404(Song, pk=song_id)
+    try:
+        bpm_window = int(request.GET.get('bpm_window', 8))
+        limit = min(int(request.GET.get('limit', 20)), 100)
+        if bpm_window < 0 or limit < 1:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': "bpm_window must be a non-negative integer and limit a positive one"},
+                            status=400)
+
+    return JsonResponse({'results': [
+        {'id': s.id, 'title': s.title, 'musical_key': s.musical_key, 'bpm': s.bpm,
+         'key_distance': distance, 'bpm_difference': bpm_difference}
+        for s, distance, bpm_difference in compatible_songs(song, bpm_window=bpm_window, limit=limit)
+    ]})
+
+
+def query_stats(request):
+    "Per-view query counts and latency percentiles recorded by QueryStatsMiddleware."
+    if not getattr(settings, 'BANDSHARE_QUERY_STATS_ENDPOINT', False):
+        raise Http404
+    return JsonResponse({'views': view_stats(), 'reference_caches': reference_cache.all_stats()})
+
+
+def group_data(group):
+    "Serializes a Group loaded with Group.objects.with_details() without further queries."
+    location = group.location
+    return {
+        'id': group.id,
+        'name': group.name,
+        'description': group.description,
+        'bio': group.bio,
+        'started_date': group.started_date,
+        'location': location and {'id': location.id, 'city': location.city, 'state': location.state,
+                                  'country': location.country},
+        'genres': [genre.name for genre in group.genres.all()],
+        'members': [{'id': mr['user'].id, 'display_name': mr['user'].display_name, 'role': mr['role']}
+                    for mr in group.member_roles],
+    }
+
+
+@response_cache.cached(lambda group_id: [f'group:{group_id}'])
+def group_detail(request, group_id):
+    group = get_object_or_404(Group.objects.with_details(), pk=group_id)
+    tags = [f"user:{mr['user'].id}" for mr in group.member_roles]
+    tags += [f'genre:{genre.pk}' for genre in group.genres.all()]
+    if group.location_id:
+        tags.append(f'location:{group.location_id}')
+    return response_cache.tagged(JsonResponse(group_data(group)), group.updated_at, tags)
+
+
+SONG_FIELDS = ('id', 'title', 'artist__name', 'musical_key', 'time_signature', 'bpm', 'duration_seconds')
+
+
+def song_row(values):
+    "Serializes a Song.values(*SONG_FIELDS) row."
+    return {
+        'id': values['id'],
+        'title': values['title'],
+        'artist': values['artist__name'],
+        'musical_key': values['musical_key'],
+        'time_signature': values['time_signature'],
+        'bpm': values['bpm'],
+        'duration': values['duration_seconds'].total_seconds(),
+    }
+
+
+def song_search_queryset(params):
+    """
+    Builds the song search from query parameters: q (full-text words in the
+    title or artist name, the last one a prefix), key,
+    time_signature, bpm_min, bpm_max and limit. Raises ValueError for bad numbers.
+    """
+    qs = Song.objects.all()
+    if params.get('q'):
+        qs = fulltext.matching(qs, params['q'])
+    if params.get('key'):
+        qs = qs.filter(musical_key=params['key'])
+    if params.get('time_signature'):
+        qs = qs.filter(time_signature=params['time_signature'])
+    if params.get('bpm_min'):
+        qs = qs.filter(bpm__gte=int(params['bpm_min']))
+    if params.get('bpm_max'):
+        qs = qs.filter(bpm__lte=int(params['bpm_max']))
+    limit = min(int(params.get('limit', 20)), 100)
+    return qs.order_by('-id').values(*SONG_FIELDS)[:limit]
+
+
+def song_search(request):
+    try:
+        qs = song_search_queryset(request.GET)
+    except ValueError:
+        return JsonResponse({'error': "bpm_min, bpm_max and limit must be integers"}, status=400)
+    return JsonResponse({'results': [song_row(row) for row in qs]})
+
+
+def setlist_data(setlist, songs):
+    "Serializes a Setlist's summary and its songs (rows from song_row())."
+    return {
+        'id': setlist.id,
+        'title': setlist.title,
+        'description': setlist.description,
+        'owner_group': setlist.owner_group_id,
+        'updated_at': setlist.updated_at,
+        'song_count': setlist.song_count,
+        'total_duration': setlist.total_duration.total_seconds(),
+        'bpm_curve': setlist.bpm_curve,
+        'key_changes': setlist.key_changes,
+        'time_signature_counts': setlist.time_signature_counts,
+        'songs': songs,
+    }
+
+
+@response_cache.cached(lambda setlist_id: [f'setlist:{setlist_id}'])
+def setlist_detail(request, setlist_id):
+    setlist = get_object_or_404(Setlist, pk=setlist_id)
+    rows = list(setlist.ordered_songs().values(*SONG_FIELDS, 'artist_id'))
+    tags = {f"song:{row['id']}" for row in rows} | {f"artist:{row['artist_id']}" for row in rows}
+    return response_cache.tagged(JsonResponse(setlist_data(setlist, [song_row(row) for row in rows])),
+                                 setlist.updated_at, tags)
+
+
+def _export_response(request, format, setlist_ids):
+    if format not in exports.FORMATS:
+        raise Http404
+    try:
+        export = exports.export(format, setlist_ids)
+    except Setlist.DoesNotExist:
+        raise Http404
+    not_modified = get_conditional_response(request, etag=export.etag)
+    if not_modified:
+        return not_modified
+    response = StreamingHttpResponse(export.chunks, content_type=export.content_type)
+    response['ETag'] = export.etag
+    response['Content-Disposition'] = content_disposition_header(True, export.filename)
+    return response
+
+
+def setlist_export(request, setlist_id, format):
+    """
+    Downloads a setlist as csv, json, chordpro or pdf.
+
+    e.g. /bandshare/setlists/12/export/pdf/
+    """
+    return _export_response(request, format, [setlist_id])
+
+
+def setlists_export(request, format):
+    """
+    Downloads several setlists, e.g. a tour's, as one file.
+
+    e.g. /bandshare/setlists/export/csv/?id=12&id=13&id=14
+    """
+    try:
+        setlist_ids = [int(pk) for pk in request.GET.getlist('id')]
+    except ValueError:
+        return JsonResponse({'error': "id must be an integer"}, status=400)
+    if not 0 < len(setlist_ids) <= 500:
+        return JsonResponse({'error': "pass between 1 and 500 ids"}, status=400)
+    return _export_response(request, format, setlist_ids)
+
+
+def search(request):
+    """
+    Ranked full-text search over songs, artists, groups and users.
+
+    e.g. /bandshare/search/?q=throwing+mus&kind=song&kind=artist&limit=10
+    """
+    kinds = request.GET.getlist('kind') or fulltext.KINDS
+    if not set(kinds) <= set(fulltext.KINDS):
+        return JsonResponse({'error': f"kind must be one of {', '.join(fulltext.KINDS)}"}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', 20)), 100)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': "limit must be a positive integer"}, status=400)
+
+    return JsonResponse({'results': [
+        {'kind': kind, 'id': obj.id, 'title': getattr(obj, fulltext.SOURCES[kind].title_fields[0]),
+         'score': round(score, 4)}
+        for kind, obj, score in fulltext.search_objects(request.GET.get('q', ''), kinds, limit)
+    ]})
+
+
+def activity_data(activity):
+    "Serializes an Activity loaded by feed.feed()."
+    group, user, setlist, song = activity.group, activity.user, activity.setlist, activity.song
+    return {
+        'id': activity.id,
+        'verb': activity.verb,
+        'created_at': activity.created_at,
+        'group': group and {'id': group.id, 'name': group.name},
+        'user': user and {'id': user.id, 'display_name': user.display_name},
+        'setlist': setlist and {'id': setlist.id, 'title': setlist.title},
+        'song': song and {'id': song.id, 'title': song.title},
+        'data': activity.data,
+    }
+
+
+def user_feed(request, user_id):
+    """
+    What a user's groups and the musicians they follow did, newest first.
+
+    e.g. /bandshare/users/3/feed/?limit=20&before=1234 (before: the previous page's `next`)
+    """
+    user = get_object_or_404(User, pk=user_id)
+    try:
+        limit = min(int(request.GET.get('limit', 20)), 100)
+        before = int(request.GET.get('before', 0)) or None
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': "limit must be a positive integer and before an integer"}, status=400)
+
+    activities = feed.feed(user, limit, before)
+    return JsonResponse({
+        'results': [activity_data(activity) for activity in activities],
+        'next': activities[-1].id if len(activities) == limit else None,
+    })
@@ -0,0 +1,195 @@
+"""
+Request latency with per-request, persistent and pooled database connections.
+
+Serves requests in-process through Django's WSGI handler from --threads
+threads (no HTTP server or network in the way, so the database connection
+is the main cost that changes) while --writers threads keep inserting
+rows. Each mode gets its own threads and therefore fresh connections:
+
+    SQLite (a temporary database file):
+      per request, rollback journal   Django's defaults before WAL
+      per request, WAL                settings.SQLITE_PRAGMAS, CONN_MAX_AGE = 0
+      persistent, WAL                 the SQLite fallback of config.production
+    PostgreSQL (run with DJANGO_SETTINGS_MODULE=config.production):
+      per request                     CONN_MAX_AGE = 0
+      persistent                      CONN_MAX_AGE with health checks
+      pooled                          psycopg pool, if psycopg-pool is installed
+
+Prints requests per second, latency percentiles and how many connections
+were opened.
+
+Run with:  python -m benchmarks.connections [--requests 4000] [--threads 8] [--writers 1]
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+
+from bandshare.models import Artist, Group, Setlist, Song, User  # noqa: E402
+from bandshare.seeding import Seeder  # noqa: E402
+
+
+def sqlite_modes():
+    """
+    [(name, settings overrides, SQL to run first)]. The journal mode is stored
+    in the file and can only change while nothing else is connected, so it is
+    set before each mode's threads start.
+    """
+    tuned = settings.DATABASES['default']['OPTIONS']
+    rollback = {'timeout': tuned.get('timeout', 20)}
+    return [
+        ('per request, rollback journal', {'CONN_MAX_AGE': 0, 'OPTIONS': rollback}, 'PRAGMA journal_mode=DELETE'),
+        ('per request, WAL', {'CONN_MAX_AGE': 0, 'OPTIONS': tuned}, 'PRAGMA journal_mode=WAL'),
+        ('persistent, WAL', {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True, 'OPTIONS': tuned},
+         'PRAGMA journal_mode=WAL'),
+    ]
+
+
+def postgres_modes():
+    options = {k: v for k, v in settings.DATABASES['default']['OPTIONS'].items() if k != 'pool'}
+    modes = [
+        ('per request', {'CONN_MAX_AGE': 0, 'OPTIONS': options}, None),
+        ('persistent', {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True, 'OPTIONS': options}, None),
+    ]
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        print("psycopg-pool is not installed; skipping the pooled mode.\n")
+    else:
+        pool = {'min_size': 2, 'max_size': 16}
+        modes.append(('pooled', {'CONN_MAX_AGE': 0, 'OPTIONS': {**options, 'pool': pool}}, None))
+    return modes
+
+
+def wsgi_environ(path):
+    path, _, query = path.partition('?')
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+    }
+
+
+def paths():
+    song = Song.objects.order_by('id').first()
+    group = Group.objects.order_by('id').first()
+    setlist = Setlist.objects.order_by('id').first()
+    user = User.objects.order_by('id').first()
+    return [
+        '/bandshare/songs/search/?bpm_min=100&bpm_max=110',
+        f'/bandshare/songs/{song.pk}/next/',
+        f'/bandshare/groups/{group.pk}/',
+        f'/bandshare/setlists/{setlist.pk}/',
+        f'/bandshare/users/{user.pk}/feed/',
+    ]
+
+
+def serve(handler, paths, count, latencies):
+    def start_response(status, headers):
+        if not status.startswith('200'):
+            raise RuntimeError(status)
+
+    try:
+        for i in range(count):
+            start = time.perf_counter()
+            response = handler(wsgi_environ(paths[i % len(paths)]), start_response)
+            b''.join(response)
+            response.close()  # Sends request_finished, which closes expired connections.
+            latencies.append(time.perf_counter() - start)
+    finally:
+        connections.close_all()
+
+
+def write(artist_id, stop):
+    try:
+        i = 0
+        while not stop.is_set():
+            Song.objects.create(title=f'Write {i}', artist_id=artist_id)
+            i += 1
+            time.sleep(0.001)
+    finally:
+        connections.close_all()
+
+
+def run_mode(overrides, setup_sql, handler, paths, args):
+    connections.settings['default'].update(overrides)
+    artist_id = Artist.objects.values_list('id', flat=True).first()
+    if setup_sql:
+        with connection.cursor() as cursor:
+            cursor.execute(setup_sql)
+    connection.close()
+    opened = []
+    counter = lambda sender, connection, **kwargs: opened.append(connection.alias)  # noqa: E731
+    connection_created.connect(counter)
+    latencies, stop = [], threading.Event()
+    per_thread = args.requests // args.threads
+    try:
+        with ThreadPoolExecutor(args.threads + args.writers) as executor:
+            writers = [executor.submit(write, artist_id, stop) for _ in range(args.writers)]
+            start = time.perf_counter()
+            readers = [executor.submit(serve, handler, paths, per_thread, latencies) for _ in range(args.threads)]
+            for future in readers:
+                future.result()
+            elapsed = time.perf_counter() - start
+            stop.set()
+            for future in writers:
+                future.result()
+    finally:
+        connection_created.disconnect(counter)
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {'rps': len(latencies) / elapsed, 'p50': quantiles[49] * 1000, 'p95': quantiles[94] * 1000,
+            'p99': quantiles[98] * 1000, 'connections': len(opened)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=1)
+    parser.add_argument('--users', type=int, default=2000, help="Size of the seeded dataset.")
+    args = parser.parse_args()
+
+    if 'localhost' not in settings.ALLOWED_HOSTS:
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'localhost']
+    original = dict(connections.settings['default'])
+    with tempfile.TemporaryDirectory() as tmp:
+        if connection.vendor == 'sqlite':
+            # A file, not the usual in-memory test database, so journal modes apply.
+            connection.settings_dict['TEST']['NAME'] = str(Path(tmp) / 'bench.sqlite3')
+        connection.creation.create_test_db(verbosity=0, serialize=False)
+        try:
+            Seeder(args.users).run()
+            handler = WSGIHandler()
+            urls = paths()
+            modes = sqlite_modes() if connection.vendor == 'sqlite' else postgres_modes()
+            print(f"{args.requests} requests from {args.threads} threads, {args.writers} writer(s), "
+                  f"on {connection.vendor}\n")
+            print(f"{'mode':32} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'connections':>12}")
+            for name, overrides, setup_sql in modes:
+                r = run_mode(overrides, setup_sql, handler, urls, args)
+                print(f"{name:32} {r['rps']:8.0f} {r['p50']:6.2f} ms {r['p95']:6.2f} ms {r['p99']:6.2f} ms "
+                      f"{r['connections']:12}")
+        finally:
+            connections.settings['default'].update({k: original[k] for k in ('CONN_MAX_AGE', 'OPTIONS')})
+            connection.creation.destroy_test_db(original['NAME'], verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
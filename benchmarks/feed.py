@@ -0,0 +1,149 @@
+"""
+Activity feed write and read costs at scale.
+
+Seeds a throwaway in-memory database with bandshare.seeding (100k users by
+default), adds follows with a Zipf-like popularity (so a few musicians
+have thousands of followers) and a few very large groups, then records
+--events activities with bandshare.feed.record() and reads feeds.
+
+Reports the write rate and timeline rows per event, then the median time
+of a feed page's ids (first and next page) for readers with the fewest and
+the most groups and follows, next to a plain query over all of the reader's
+groups and follows, and of the page loaded with feed.feed(). Feed pages
+should cost about the same for every reader.
+
+Run with:  python -m benchmarks.feed [--users 100000] [--events 20000] [--limit 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+from django.db.models import Count, Q  # noqa: E402
+from django.utils.timezone import now  # noqa: E402
+
+from bandshare import feed  # noqa: E402
+from bandshare.models import (Activity, Follow, Group, GroupMembership, PullSource, TimelineEntry,  # noqa: E402
+                              User)
+from bandshare.seeding import Popularity, Seeder, TableWriter  # noqa: E402
+
+
+def seed(users, follows, big_groups, big_group_size, rng):
+    Seeder(users, songs=users // 10, setlists=0).run(build_indexes=False)
+    user_ids = list(User.objects.values_list('id', flat=True))
+    popular = Popularity(rng, rng.sample(user_ids, len(user_ids)), s=1.0)
+    with transaction.atomic():
+        writer = TableWriter(Follow, ('created_at', 'follower', 'user'), 5000)
+        created_at = now()
+        for follower in user_ids:
+            for followed in popular.sample(rng.randint(0, follows)):
+                if followed != follower:
+                    writer.add(created_at, follower, followed)
+        writer.flush()
+
+        writer = TableWriter(GroupMembership, ('group', 'member', 'role'), 5000)
+        for i in range(big_groups):
+            group = Group.objects.create(name=f'Big Band {i}', created_by_id=user_ids[i])
+            for member in rng.sample(user_ids, big_group_size):
+                writer.add(group.pk, member, 'Horns')
+        writer.flush()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def record_events(events, rng):
+    groups = Popularity(rng, list(Group.objects.values_list('id', flat=True)), s=0.8)
+    users = list(User.objects.values_list('id', flat=True))
+    start = time.perf_counter()
+    for _ in range(events):
+        if rng.random() < 0.5:
+            feed.record(Activity.Verb.SETLIST_CREATED, group=groups.pick())
+        else:
+            feed.record(Activity.Verb.MEMBER_JOINED, group=groups.pick(), user=rng.choice(users))
+    return time.perf_counter() - start
+
+
+def naive_feed_ids(user, limit):
+    "Fan-out on read over everything the user belongs to or follows, for comparison."
+    return list(Activity.objects.filter(
+        Q(group__in=GroupMembership.objects.filter(member=user).values('group_id')) |
+        Q(user__in=Follow.objects.filter(follower=user).values('user_id'))
+    ).order_by('-id').values_list('id', flat=True)[:limit])
+
+
+def median_ms(fn, repeat=7):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def readers():
+    "Users with the fewest and the most groups plus follows, and a member of a big group."
+    users = User.objects.annotate(
+        n_groups=Count('groupmembership', distinct=True), n_follows=Count('following', distinct=True),
+    ).order_by('id')
+    by_reach = sorted(users.values_list('id', 'n_groups', 'n_follows'), key=lambda u: u[1] + u[2])
+    big_member = GroupMembership.objects.filter(group__in=PullSource.objects.values('group_id')) \
+        .values_list('member_id', flat=True).first()
+    picked = {'fewest': by_reach[0][0], 'median': by_reach[len(by_reach) // 2][0], 'most': by_reach[-1][0]}
+    if big_member:
+        picked['in a big group'] = big_member
+    reach = {pk: (groups, follows) for pk, groups, follows in by_reach}
+    return [(label, pk, *reach[pk]) for label, pk in picked.items()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--follows', type=int, default=30, help="Most musicians a user follows.")
+    parser.add_argument('--big-groups', type=int, default=5)
+    parser.add_argument('--big-group-size', type=int, default=5000)
+    parser.add_argument('--events', type=int, default=20_000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    database_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, serialize=False)
+    try:
+        start = time.perf_counter()
+        seed(args.users, args.follows, args.big_groups, args.big_group_size, rng)
+        print(f"Seeded {args.users} users, {Follow.objects.count()} follows and "
+              f"{GroupMembership.objects.count()} memberships in {time.perf_counter() - start:.1f}s\n")
+
+        seconds = record_events(args.events, rng)
+        entries = TimelineEntry.objects.count()
+        print(f"Recorded {args.events} activities in {seconds:.1f}s ({args.events / seconds:.0f}/s), "
+              f"{entries} timeline rows ({entries / args.events:.1f} per activity), "
+              f"{PullSource.objects.count()} pull sources (fan-out limit {feed.fanout_limit()})\n")
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        print(f"{'reader':16} {'groups':>6} {'follows':>7} {'page ids':>10} {'next page':>10} "
+              f"{'plain query':>12} {'loaded page':>12}")
+        for label, user_id, groups, follows in readers():
+            first = feed.feed_ids(user_id, args.limit)
+            before = first[-1] if len(first) == args.limit else None
+            ids = median_ms(lambda: feed.feed_ids(user_id, args.limit))
+            next_page = median_ms(lambda: feed.feed_ids(user_id, args.limit, before))
+            naive = median_ms(lambda: naive_feed_ids(user_id, args.limit))
+            loaded = median_ms(lambda: feed.feed(user_id, args.limit))
+            print(f"{label:16} {groups:6} {follows:7} {ids:7.2f} ms {next_page:7.2f} ms {naive:9.2f} ms "
+                  f"{loaded:9.2f} ms")
+    finally:
+        connection.creation.destroy_test_db(database_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
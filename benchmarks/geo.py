@@ -0,0 +1,93 @@
+"""
+Geohash index vs. naive haversine scan.
+
+Builds N random locations clustered around a few cities, then answers the
+same radius queries two ways:
+
+    index - prefix range scans over a sorted geohash column (what the
+            indexed Location.geohash column gives the database) plus an
+            exact distance check on the candidates
+    naive - haversine distance to every location
+
+Run with:  python -m benchmarks.geo [--locations 1000000] [--queries 200]
+"""
+import argparse
+import bisect
+import random
+import time
+
+from bandshare import geo
+
+CITIES = [(40.71, -74.00), (34.05, -118.24), (41.88, -87.63), (29.76, -95.37), (36.16, -86.78),
+          (47.61, -122.33), (39.74, -104.99), (25.76, -80.19), (42.36, -71.06), (45.52, -122.68)]
+
+
+def make_points(n, seed=1):
+    rng = random.Random(seed)
+    points = []
+    for _ in range(n):
+        if rng.random() < 0.8:
+            lat, lon = rng.choice(CITIES)
+            points.append((lat + rng.gauss(0, 0.5), lon + rng.gauss(0, 0.5)))
+        else:
+            points.append((rng.uniform(25, 49), rng.uniform(-124, -67)))
+    return points
+
+
+class SortedGeohashIndex:
+    def __init__(self, points):
+        rows = sorted((geo.encode(lat, lon), lat, lon) for lat, lon in points)
+        self.hashes = [h for h, _, _ in rows]
+        self.points = [(lat, lon) for _, lat, lon in rows]
+
+    def within(self, lat, lon, radius_km):
+        found = []
+        for prefix in geo.covering_cells(lat, lon, radius_km):
+            low, high = geo.prefix_range(prefix)
+            for i in range(bisect.bisect_left(self.hashes, low), bisect.bisect_left(self.hashes, high)):
+                plat, plon = self.points[i]
+                if geo.haversine_km(lat, lon, plat, plon) <= radius_km:
+                    found.append(i)
+        return found
+
+
+def naive_within(points, lat, lon, radius_km):
+    return [i for i, (plat, plon) in enumerate(points) if geo.haversine_km(lat, lon, plat, plon) <= radius_km]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--locations', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--naive-queries', type=int, default=5,
+                        help="The naive scan is slow; it is timed on fewer queries.")
+    parser.add_argument('--radius-km', type=float, default=40)
+    args = parser.parse_args()
+
+    points = make_points(args.locations)
+    start = time.perf_counter()
+    index = SortedGeohashIndex(points)
+    print(f"built index over {len(points):,} locations in {time.perf_counter() - start:.1f}s")
+
+    rng = random.Random(2)
+    queries = [(lat + rng.gauss(0, 0.3), lon + rng.gauss(0, 0.3)) for lat, lon in
+               (rng.choice(CITIES) for _ in range(args.queries))]
+
+    start = time.perf_counter()
+    hits = sum(len(index.within(lat, lon, args.radius_km)) for lat, lon in queries)
+    index_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    start = time.perf_counter()
+    naive_hits = [len(naive_within(points, lat, lon, args.radius_km)) for lat, lon in queries[:args.naive_queries]]
+    naive_ms = (time.perf_counter() - start) * 1000 / args.naive_queries
+
+    index_hits = [len(index.within(lat, lon, args.radius_km)) for lat, lon in queries[:args.naive_queries]]
+    assert naive_hits == index_hits, "index and naive scan disagree"
+
+    print(f"radius {args.radius_km:g} km, {hits / len(queries):,.0f} hits/query on average")
+    print(f"index: {index_ms:8.2f} ms/query")
+    print(f"naive: {naive_ms:8.2f} ms/query  ({naive_ms / index_ms:,.0f}x slower)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+HTTP load test comparing the WSGI and ASGI deployments.
+
+Opens many concurrent keep-alive connections (default 1000) and has each
+one send GET requests back to back for a fixed time, then reports requests
+per second, latency percentiles and errors for each server. The client is
+plain asyncio so that it isn't the bottleneck and needs no dependencies.
+
+Start both servers against the same database first, e.g.
+
+    pip install gunicorn uvicorn
+    gunicorn config.wsgi -b 127.0.0.1:8001 -w 4 -k gthread --threads 64
+    uvicorn config.asgi:application --port 8002 --workers 4 --no-access-log
+
+then run
+
+    ulimit -n 10000
+    py -m benchmarks.loadtest --wsgi-url http://127.0.0.1:8001 --asgi-url http://127.0.0.1:8002
+
+Each --path is requested on both servers; the sync paths go to WSGI and the
+same paths with an /async prefix go to ASGI unless --same-paths is given.
+"""
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = [
+    '/bandshare/songs/search/?bpm_min=90&bpm_max=130',
+    '/bandshare/groups/1/',
+    '/bandshare/setlists/1/',
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(pct / 100 * len(values)))]
+
+
+async def read_response(reader):
+    "Reads one HTTP/1.1 response; returns (status, keep_alive)."
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def worker(host, port, requests, deadline, latencies, errors):
+    reader = writer = None
+    i = 0
+    while time.perf_counter() < deadline:
+        request = requests[i % len(requests)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.05)
+            continue
+        if status >= 500:
+            errors[f'HTTP {status}'] = errors.get(f'HTTP {status}', 0) + 1
+        else:
+            latencies.append(time.perf_counter() - start)
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run(url, paths, connections, duration):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    requests = [f'GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nConnection: keep-alive\r\n\r\n'.encode()
+                for path in paths]
+    latencies, errors = [], {}
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(worker(host, port, requests, deadline, latencies, errors)
+                           for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'errors': errors,
+    }
+
+
+def report(name, result):
+    errors = ', '.join(f'{k}={v}' for k, v in result['errors'].items()) or 'none'
+    print(f"{name:5} {result['requests']:>8} req  {result['rps']:>9.1f} req/s  "
+          f"p50 {result['p50_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  errors: {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--wsgi-url')
+    parser.add_argument('--asgi-url')
+    parser.add_argument('--path', action='append', dest='paths', help="May be given more than once.")
+    parser.add_argument('--same-paths', action='store_true', help="Don't add the /async prefix for ASGI.")
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=15.0, help="Seconds per server.")
+    args = parser.parse_args()
+    if not args.wsgi_url and not args.asgi_url:
+        parser.error("give --wsgi-url, --asgi-url or both")
+
+    paths = args.paths or DEFAULT_PATHS
+    async_paths = paths if args.same_paths else [p.replace('/bandshare/', '/bandshare/async/', 1) for p in paths]
+
+    print(f"{args.connections} connections, {args.duration:g}s per server")
+    for name, url, server_paths in (('wsgi', args.wsgi_url, paths), ('asgi', args.asgi_url, async_paths)):
+        if url:
+            report(name, asyncio.run(run(url, server_paths, args.connections, args.duration)))
+
+
+if __name__ == '__main__':
+    main()
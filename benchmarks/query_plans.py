@@ -0,0 +1,207 @@
+"""
+Query plans and timings for the app's key queries.
+
+Creates a throwaway in-memory test database, seeds it with a large synthetic
+catalog (songs, artists, users, groups with members, setlists), runs ANALYZE
+and then, for every query in key_queries(), records the database's plan and the
+median time over a few runs.
+
+    --compare   also drops the indexes added for these queries (restoring
+                the plain foreign key indexes they replaced) and measures
+                again, to show what each index buys
+    --write     saves the plans to benchmarks/query_plans.json
+    (default)   compares the plans with query_plans.json and exits with
+                status 1 if any changed, so a lost index shows up as a diff
+
+Run with:  python -m benchmarks.query_plans [--songs 200000] [--compare] [--write]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from bandshare.models import (Artist, Group, GroupMembership, MusicalKey, Setlist, SetlistEntry,  # noqa: E402
+                              Song, TimeSignature, User)
+from bandshare.views import song_search_queryset  # noqa: E402
+
+BASELINE = Path(__file__).with_name('query_plans.json')
+
+# Indexes this benchmark justifies: (model, index or constraint name, foreign key column it replaced).
+INDEXES = [
+    (Song, 'song_title', None),
+    (Song, 'song_bpm', None),
+    (Song, 'song_release_date', None),
+    (Setlist, 'setlist_group_created', 'owner_group_id'),
+    (GroupMembership, 'groupmembership_unique_member', 'group_id'),
+]
+
+
+def seed(songs, seed=1):
+    rng = random.Random(seed)
+    n_artists, n_users, n_groups = max(1, songs // 100), max(1, songs // 10), max(1, songs // 40)
+    keys = [k for k in MusicalKey.values if k]
+    meters = [TimeSignature.Four_Four] * 8 + [TimeSignature.Three_Four, TimeSignature.Six_Eight]
+
+    Artist.objects.bulk_create([Artist(name=f'Artist {i}') for i in range(n_artists)], batch_size=5000)
+    artist_ids = list(Artist.objects.values_list('id', flat=True))
+    Song.objects.bulk_create([
+        Song(title=f'Song {i:07}', artist_id=rng.choice(artist_ids), musical_key=rng.choice(keys),
+             time_signature=rng.choice(meters), bpm=int(rng.triangular(60, 180, 118)),
+             release_date=date(1960, 1, 1) + timedelta(days=rng.randrange(65 * 365)) if rng.random() < 0.8 else None,
+             duration_seconds=timedelta(seconds=rng.randrange(120, 420)))
+        for i in range(songs)
+    ], batch_size=5000)
+    song_ids = list(Song.objects.values_list('id', flat=True))
+
+    User.objects.bulk_create([User(first_name=f'First{i}', last_name=f'Last{i}', display_name=f'user{i}',
+                                   birth_date=date(1990, 1, 1)) for i in range(n_users)], batch_size=5000)
+    user_ids = list(User.objects.values_list('id', flat=True))
+    Group.objects.bulk_create([Group(name=f'Group {i}', created_by_id=rng.choice(user_ids))
+                               for i in range(n_groups)], batch_size=5000)
+    group_ids = list(Group.objects.values_list('id', flat=True))
+    GroupMembership.objects.bulk_create([
+        GroupMembership(group_id=group_id, member_id=user_id, role='Guitar')
+        for group_id in group_ids for user_id in rng.sample(user_ids, min(len(user_ids), rng.randint(2, 6)))
+    ], batch_size=5000)
+
+    Setlist.objects.bulk_create([Setlist(title=f'Setlist {i}', owner_group_id=rng.choice(group_ids))
+                                 for i in range(n_groups * 4)], batch_size=5000)
+    SetlistEntry.objects.bulk_create([
+        SetlistEntry(setlist_id=setlist_id, song_id=song_id, position=position)
+        for setlist_id in Setlist.objects.values_list('id', flat=True)
+        for position, song_id in enumerate(rng.sample(song_ids, min(len(song_ids), 15)))
+    ], batch_size=5000)
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def key_queries():
+    "Returns [(name, queryset)] for the app's key queries, using seeded rows."
+    song = Song.objects.order_by('id')[Song.objects.count() // 2]
+    group = Group.objects.order_by('id')[Group.objects.count() // 2]
+    member = GroupMembership.objects.filter(group=group).first().member
+    setlist = Setlist.objects.order_by('id')[Setlist.objects.count() // 2]
+    # The two scans harmony.compatible_songs() makes per compatible key, outwards from the song's BPM.
+    compatible = Song.objects.filter(time_signature=song.time_signature, musical_key=song.musical_key) \
+        .exclude(pk=song.pk)
+    return [
+        ('song by title', Song.objects.filter(title=song.title)),
+        ('songs sorted by title', Song.objects.order_by('title')[:50]),
+        ('songs in a bpm range', Song.objects.filter(bpm__range=(118, 120)).order_by('bpm')[:50]),
+        ('song search by bpm', song_search_queryset({'bpm_min': 150, 'bpm_max': 152})),
+        ('songs released in a year', Song.objects.filter(release_date__year=1999).order_by('release_date')[:50]),
+        ('compatible songs', compatible.filter(bpm__gte=song.bpm, bpm__lte=song.bpm + 8).order_by('bpm', 'id')[:20]),
+        ('compatible songs below', compatible.filter(bpm__lt=song.bpm, bpm__gte=song.bpm - 8)
+         .order_by('-bpm', 'id')[:20]),
+        ("a group's setlists", Setlist.objects.filter(owner_group=group).order_by('-created_at')[:20]),
+        ("a group's members", GroupMembership.objects.filter(group=group).select_related('member')),
+        ('membership exists', GroupMembership.objects.filter(group=group, member=member)),
+        ("a user's groups", Group.objects.filter(members=member)),
+        ('setlist songs in order', setlist.ordered_songs()),
+    ]
+
+
+def plan(query):
+    "The plan as a list of steps, without the row ids SQLite prefixes them with."
+    return [re.sub(r'^\d+ \d+ \d+ ', '', line) for line in query.explain().splitlines()]
+
+
+def timing(query, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        list(query.all())
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def measure(repeat):
+    return {name: {'plan': plan(query), 'ms': timing(query, repeat)} for name, query in key_queries()}
+
+
+def drop_indexes():
+    "Drops the INDEXES and recreates the plain foreign key indexes they replaced."
+    with connection.schema_editor() as editor:
+        for model, name, fk_column in INDEXES:
+            meta = model._meta
+            for index in meta.indexes:
+                if index.name == name:
+                    editor.remove_index(model, index)
+            for constraint in meta.constraints:
+                if constraint.name == name:
+                    # SQLite drops a constraint by rebuilding the table from _meta,
+                    # so it has to be gone from there first. This process exits after.
+                    meta.constraints = [c for c in meta.constraints if c is not constraint]
+                    editor.remove_constraint(model, constraint)
+            if fk_column:
+                editor.execute(f'CREATE INDEX {name}_fk ON {meta.db_table} ({fk_column})')
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--songs', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--write', action='store_true')
+    args = parser.parse_args()
+
+    database_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, serialize=False)
+    try:
+        start = time.perf_counter()
+        seed(args.songs)
+        print(f"Seeded {args.songs} songs in {time.perf_counter() - start:.1f}s on {connection.vendor}\n")
+
+        results = measure(args.repeat)
+        without = None
+        if args.compare:
+            drop_indexes()
+            without = measure(args.repeat)
+
+        for name, result in results.items():
+            line = f"{name:26} {result['ms']:9.2f} ms"
+            if without:
+                line += f"   without indexes {without[name]['ms']:9.2f} ms"
+            print(line)
+            for step in result['plan']:
+                print(f"    {step}")
+            if without and without[name]['plan'] != result['plan']:
+                for step in without[name]['plan']:
+                    print(f"    without: {step}")
+    finally:
+        connection.creation.destroy_test_db(database_name, verbosity=0)
+
+    plans = {name: result['plan'] for name, result in results.items()}
+    baselines = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    if args.write:
+        baselines[connection.vendor] = plans
+        BASELINE.write_text(json.dumps(baselines, indent=2) + '\n')
+        print(f"\nWrote {BASELINE}")
+        return
+
+    baseline = baselines.get(connection.vendor, {})
+    changed = [name for name, steps in plans.items() if name in baseline and baseline[name] != steps]
+    for name in changed:
+        print(f"\nPlan changed for {name!r}:\n  was: {baseline[name]}\n  now: {plans[name]}")
+    if changed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Rehearsal scheduling: suggesting times for a large group.
+
+Creates a group of --members musicians, each with a weekly availability, a
+few days off and --side-groups other groups that rehearse weekly, then times
+scheduling.suggest() over a --days horizon, split into the database reads
+and the intersection itself.
+
+Run with:  python -m benchmarks.scheduling [--members 12] [--days 90] [--side-groups 2]
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import time as clock, timedelta
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.utils.timezone import now  # noqa: E402
+
+from bandshare import scheduling  # noqa: E402
+from bandshare.models import Availability, Event, Group, GroupMembership, TimeOff, User  # noqa: E402
+
+
+def make_group(members, side_groups, seed):
+    rng = random.Random(seed)
+    start = now().replace(hour=0, minute=0, second=0, microsecond=0)
+    users = User.objects.bulk_create([
+        User(first_name=f'M{i}', last_name='X', display_name=f'm{i}', birth_date=start.date())
+        for i in range(members)])
+    group = Group.objects.create(name='Big Band', created_by=users[0])
+    GroupMembership.objects.bulk_create([GroupMembership(group=group, member=u, role='Horn') for u in users])
+    for user in users:
+        evenings = [(day, clock(rng.choice([17, 18, 19])), clock(23)) for day in range(7) if rng.random() < 0.8]
+        weekend = [(day, clock(10), clock(16)) for day in (5, 6) if rng.random() < 0.5]
+        Availability.objects.create(user=user, weekly=scheduling.weekly_slots(evenings + weekend))
+        for _ in range(3):
+            off = start + timedelta(days=rng.randrange(90))
+            TimeOff.objects.create(user=user, start=off, end=off + timedelta(days=rng.randint(1, 4)))
+        for i in range(side_groups):
+            side = Group.objects.create(name=f'{user.display_name} side {i}', created_by=user)
+            GroupMembership.objects.create(group=side, member=user, role='Horn')
+            first = start + timedelta(days=rng.randrange(7), hours=rng.choice([18, 19, 20]))
+            Event.objects.create(group=side, start=first, end=first + timedelta(hours=2), recurrence='FREQ=WEEKLY')
+    return group
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=12)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--side-groups', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, serialize=False)
+    try:
+        group = make_group(args.members, args.side_groups, args.seed)
+        member_ids = list(group.members.values_list('id', flat=True))
+        timings = {'availability': [], 'suggest': []}
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            scheduling.availability(member_ids, now(), args.days)
+            timings['availability'].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            suggestions = scheduling.suggest(group, timedelta(hours=2), days=args.days, min_members=args.members - 2,
+                                             earliest=clock(18), latest=clock(23))
+            timings['suggest'].append(time.perf_counter() - start)
+
+        print(f"{args.members} members, {args.side_groups} side groups each, {args.days} days "
+              f"({args.days * scheduling.SLOTS_PER_DAY} slots)\n")
+        for name, values in timings.items():
+            print(f"{name:14} p50 {statistics.median(values) * 1000:6.2f} ms   max {max(values) * 1000:6.2f} ms")
+        print()
+        for slot in suggestions:
+            print(f"{slot.start:%a %Y-%m-%d %H:%M}  {slot.available}/{args.members} free")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Setlist generator: solution quality vs. runtime.
+
+Plans a 2-hour set from a pool of random songs with a range of time budgets
+and beam widths, and prints the cost of each plan (lower is smoother) next
+to how long it took.
+
+Run with:  python -m benchmarks.setlist_generator [--songs 300] [--seed 1]
+"""
+import argparse
+import os
+import random
+import time
+from datetime import timedelta
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from bandshare.models import Song, MusicalKey, TimeSignature  # noqa: E402
+from bandshare.setlist_generator import plan_setlist  # noqa: E402
+
+
+def make_songs(n, seed):
+    rng = random.Random(seed)
+    keys = [k for k in MusicalKey.values if k]
+    meters = [TimeSignature.Four_Four] * 8 + [TimeSignature.Three_Four, TimeSignature.Six_Eight]
+    return [Song(pk=i + 1, title=f"Song {i}", musical_key=rng.choice(keys), time_signature=rng.choice(meters),
+                 bpm=int(rng.triangular(60, 180, 118)),
+                 duration_seconds=timedelta(seconds=int(rng.triangular(150, 420, 220))))
+            for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--songs', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--target-minutes', type=int, default=120)
+    args = parser.parse_args()
+
+    songs = make_songs(args.songs, args.seed)
+    target = timedelta(minutes=args.target_minutes)
+    print(f"{len(songs)} songs, target {target}")
+    print(f"{'budget':>8} {'beam':>5} {'seconds':>8} {'cost':>8} {'length':>9} {'songs':>6} complete")
+    for budget in (0.05, 0.1, 0.25, 0.5, 1.0):
+        for beam_width in (16, 64, 256):
+            start = time.perf_counter()
+            plan = plan_setlist(songs, target, opener=songs[0], closer=songs[1], time_budget=budget,
+                                beam_width=beam_width)
+            elapsed = time.perf_counter() - start
+            print(f"{budget:>8.2f} {beam_width:>5} {elapsed:>8.3f} {plan.cost:>8.2f} {str(plan.duration):>9} "
+                  f"{len(plan.songs):>6} {plan.complete}")
+
+
+if __name__ == '__main__':
+    main()
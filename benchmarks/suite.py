@@ -0,0 +1,201 @@
+"""
+Benchmark suite for tracking performance per commit.
+
+In the style of asv: each class below is a benchmark group whose setup()
+builds what it needs and whose time_* methods are timed. Every method is
+called in a loop long enough to time reliably, the loop is repeated, and
+the best time per call is kept.
+
+Runs against a throwaway in-memory database seeded with bandshare.seeding
+(--users sets the scale). Results are saved to
+benchmarks/results/<commit>.json; --compare COMMIT prints the ratio to an
+earlier run, marking slowdowns beyond --threshold.
+
+Run with:  python -m benchmarks.suite [--users 2000] [-k member_roles] [--compare HEAD~1]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+
+from bandshare.models import Genre, Group, Setlist, Song, User  # noqa: E402
+from bandshare.seeding import Seeder  # noqa: E402
+
+RESULTS = Path(__file__).with_name('results')
+
+
+class ModelCreation:
+    def setup(self):
+        self.user = User.objects.order_by('id').first()
+        self.artist_id = Song.objects.values_list('artist_id', flat=True).first()
+
+    def time_create_user(self):
+        User.objects.create(first_name='Bench', last_name='Mark', display_name='bench', birth_date='1990-01-01')
+
+    def time_create_group(self):
+        Group.objects.create(name='Benchmarks', created_by=self.user)
+
+    def time_bulk_create_1000_songs(self):
+        Song.objects.bulk_create([Song(title=f'Bench {i}', artist_id=self.artist_id) for i in range(1000)])
+
+
+class ManyToManyFanOut:
+    def setup(self):
+        self.users = list(User.objects.order_by('id')[:50])
+        self.genres = list(Genre.objects.order_by('id')[:10])
+        self.songs = list(Song.objects.order_by('id')[:20])
+        self.group_id = Group.objects.values_list('id', flat=True).first()
+
+    def time_group_add_50_members(self):
+        group = Group.objects.create(name='Fan-out', created_by=self.users[0])
+        group.members.add(*self.users, through_defaults={'role': 'Guitar'})
+
+    def time_user_add_10_genres(self):
+        user = User.objects.create(first_name='Fan', last_name='Out', display_name='fan', birth_date='1990-01-01')
+        user.genres.add(*self.genres)
+
+    def time_setlist_add_20_songs(self):
+        setlist = Setlist.objects.create(title='Fan-out', owner_group_id=self.group_id)
+        setlist.add_songs(self.songs)
+
+
+class MemberRoles:
+    def setup(self):
+        self.group_ids = list(Group.objects.order_by('id').values_list('id', flat=True)[:100])
+
+    def time_one_group(self):
+        Group.objects.get(pk=self.group_ids[0]).member_roles
+
+    def time_100_groups_one_by_one(self):
+        for group in Group.objects.filter(pk__in=self.group_ids):
+            group.member_roles
+
+    def time_100_groups_with_details(self):
+        for group in Group.objects.with_details().filter(pk__in=self.group_ids):
+            group.member_roles
+
+
+class UserAge:
+    def setup(self):
+        self.users = list(User.objects.order_by('id')[:1000])
+
+    def time_age_1000_users(self):
+        for user in self.users:
+            user.age
+
+
+class Seeding:
+    def time_seed_500_users(self):
+        Seeder(500, seed=2).run(build_indexes=False)
+
+
+BENCHMARKS = [ModelCreation, ManyToManyFanOut, MemberRoles, UserAge, Seeding]
+
+
+def time_call(fn, repeat=5, min_seconds=0.2):
+    "Best seconds per call over repeat loops, each long enough to take min_seconds."
+    fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds or number >= 1000:
+            break
+        number *= 10 if elapsed < min_seconds / 10 else 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def run(selected):
+    results = {}
+    for cls in BENCHMARKS:
+        names = [n for n in dir(cls) if n.startswith('time_') and
+                 (not selected or any(s in f'{cls.__name__}.{n}' for s in selected))]
+        if not names:
+            continue
+        bench = cls()
+        if hasattr(bench, 'setup'):
+            bench.setup()
+        for name in names:
+            # Each benchmark's writes are rolled back so they don't skew the next one.
+            with transaction.atomic():
+                results[f'{cls.__name__}.{name}'] = time_call(getattr(bench, name))
+                transaction.set_rollback(True)
+    return results
+
+
+def commit_id(rev='HEAD'):
+    return subprocess.run(['git', 'rev-parse', '--short', rev], capture_output=True, text=True,
+                          check=True).stdout.strip()
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.2f} {unit}'
+    return f'{seconds / 1e-9:.0f} ns'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000, help="Size of the seeded dataset.")
+    parser.add_argument('-k', action='append', dest='selected', help="Only run benchmarks containing this.")
+    parser.add_argument('--compare', metavar='COMMIT', help="Compare with the saved results of COMMIT.")
+    parser.add_argument('--threshold', type=float, default=1.2, help="Ratio that counts as a slowdown.")
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    database_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, serialize=False)
+    try:
+        Seeder(args.users).run()
+        results = run(args.selected)
+    finally:
+        connection.creation.destroy_test_db(database_name, verbosity=0)
+
+    previous = {}
+    if args.compare:
+        path = RESULTS / f'{commit_id(args.compare)}.json'
+        previous = json.loads(path.read_text())['results'] if path.exists() else {}
+        if not previous:
+            print(f"No saved results for {args.compare} ({path.name}).")
+
+    slower = []
+    for name, seconds in results.items():
+        line = f'{name:48} {format_time(seconds):>12}'
+        if name in previous:
+            ratio = seconds / previous[name]
+            line += f'   {ratio:5.2f}x'
+            if ratio > args.threshold:
+                line += '  slower'
+                slower.append(name)
+        print(line)
+
+    if not args.no_save:
+        RESULTS.mkdir(exist_ok=True)
+        path = RESULTS / f'{commit_id()}.json'
+        path.write_text(json.dumps({'commit': commit_id(), 'users': args.users, 'results': results}, indent=2))
+        print(f"\nSaved {path}")
+    if slower:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
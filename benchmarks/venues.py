@@ -0,0 +1,124 @@
+"""
+Venue search: open dates at venues near a city that book a genre.
+
+Creates --venues venues spread over a region the size of a large US state,
+each booking a few of 20 genres, and --gigs gigs over the next year, most of
+them at the busiest venues, then times search.open_dates() for a month, for
+Fridays and Saturdays only and for one night, and prints the plan of the
+query it runs for booked dates. Seeding a million gigs takes a few minutes.
+
+Run with:  python -m benchmarks.venues [--venues 20000] [--gigs 1000000] [--radius 40]
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import timedelta
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.utils.timezone import localdate  # noqa: E402
+
+from bandshare import geo  # noqa: E402
+from bandshare.models import Genre, Gig, Group, Location, User, Venue  # noqa: E402
+from bandshare.search import venues  # noqa: E402
+
+CENTER = (39.74, -104.99)
+
+
+def seed(n_venues, n_gigs, seed):
+    rng = random.Random(seed)
+    genre_ids = [Genre.objects.create(name=f'Genre {i}').pk for i in range(20)]
+    user = User.objects.create(first_name='Bench', last_name='Mark', display_name='bench', birth_date=localdate())
+    group_ids = [group.pk for group in Group.objects.bulk_create([
+        Group(name=f'Group {i}', created_by=user) for i in range(1000)])]
+
+    locations = []
+    for i in range(n_venues):
+        # Half the venues in and around the city, the rest spread over the state.
+        spread = 0.3 if i % 2 else 3.0
+        lat, lon = CENTER[0] + rng.gauss(0, spread), CENTER[1] + rng.gauss(0, spread)
+        locations.append(Location(address=f'{i} Main St', city='Somewhere', state='CO', postal_code='80202',
+                                  latitude=lat, longitude=lon, geohash=geo.encode(lat, lon)))
+    Location.objects.bulk_create(locations, batch_size=5000)
+    location_ids = list(Location.objects.values_list('id', flat=True))
+    Venue.objects.bulk_create([Venue(name=f'Venue {i}', location_id=location_id,
+                                     capacity=int(rng.lognormvariate(5, 1)) + 20)
+                               for i, location_id in enumerate(location_ids)], batch_size=5000)
+    venue_ids = list(Venue.objects.values_list('id', flat=True))
+    Venue.genres.through.objects.bulk_create([
+        Venue.genres.through(venue_id=venue_id, genre_id=genre_id)
+        for venue_id in venue_ids for genre_id in rng.sample(genre_ids, rng.randint(1, 4))], batch_size=5000)
+    venues.index_venues(venue_ids)
+
+    start = localdate()
+    weights = [1 / (i + 1) ** 0.5 for i in range(len(venue_ids))]
+    popular = rng.sample(venue_ids, len(venue_ids))
+    seen = set()
+    batch = []
+    for venue_id in rng.choices(popular, weights, k=n_gigs):
+        date = start + timedelta(days=rng.randrange(365))
+        if (venue_id, date) in seen:
+            continue
+        seen.add((venue_id, date))
+        batch.append(Gig(venue_id=venue_id, date=date, group_id=rng.choice(group_ids)))
+        if len(batch) == 10000:
+            Gig.objects.bulk_create(batch)
+            batch = []
+    Gig.objects.bulk_create(batch)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return genre_ids, len(seen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--venues', type=int, default=20_000)
+    parser.add_argument('--gigs', type=int, default=1_000_000)
+    parser.add_argument('--radius', type=float, default=40)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, serialize=False)
+    try:
+        started = time.perf_counter()
+        genre_ids, gigs = seed(args.venues, args.gigs, args.seed)
+        print(f"Seeded {args.venues} venues and {gigs} gigs in {time.perf_counter() - started:.1f}s\n")
+
+        city = Location.objects.create(address='Downtown', city='Denver', state='CO', postal_code='80202',
+                                       latitude=CENTER[0], longitude=CENTER[1])
+        start = localdate() + timedelta(days=7)
+        searches = {
+            'next month': dict(days=30),
+            'weekends': dict(days=30, weekdays={4, 5}),
+            'one night': dict(days=1),
+        }
+        for name, options in searches.items():
+            times = []
+            for _ in range(args.repeat):
+                began = time.perf_counter()
+                found = venues.open_dates(city, args.radius, start=start, genres=[genre_ids[0]], **options)
+                times.append(time.perf_counter() - began)
+            print(f"{name:12} p50 {statistics.median(times) * 1000:7.2f} ms   max {max(times) * 1000:7.2f} ms   "
+                  f"{len(found)} venues, nearest {found[0].distance_km if found else 0:.1f} km, "
+                  f"{sum(len(o.dates) for o in found)} open dates")
+
+        batch = list(Venue.objects.values_list('id', flat=True)[:venues.GIG_QUERY_VENUES])
+        booked = Gig.objects.filter(date__range=(start, start + timedelta(days=29)), venue__in=batch) \
+            .values_list('venue_id', 'date')
+        print('\nBooked dates query:')
+        for line in booked.explain().splitlines():
+            print(f'    {line}')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
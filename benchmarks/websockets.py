@@ -0,0 +1,116 @@
+"""
+Setlist WebSockets: broadcasting edits to many sockets.
+
+Connects --sockets sockets to one setlist through bandshare.realtime's ASGI
+application (in process, with the in-memory channel layer, so it measures
+the server's work and not the network), then has one of them make --ops
+edits, one at a time, and times how long each takes to reach every socket:
+applying the op in the database and fanning it out.
+
+Run with:  python -m benchmarks.websockets [--sockets 500] [--ops 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from datetime import date, timedelta
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from bandshare import realtime  # noqa: E402
+from bandshare.models import Artist, Group, Setlist, Song, User  # noqa: E402
+
+
+class Socket:
+    "A client: the ASGI receive and send callables, counting the ops it gets."
+
+    def __init__(self, setlist_id, on_op):
+        self.scope = {'type': 'websocket', 'path': f'/ws/setlists/{setlist_id}/', 'query_string': b''}
+        self.incoming = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.on_op = on_op
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send(self, event):
+        if event['type'] == 'websocket.accept':
+            self.accepted.set()
+        elif event['type'] == 'websocket.send' and '"type": "op"' in event['text']:
+            self.on_op(self)
+
+    def start(self):
+        self.incoming.put_nowait({'type': 'websocket.connect'})
+        return asyncio.create_task(realtime.application(self.scope, self.receive, self.send))
+
+
+def seed(songs):
+    user = User.objects.create(first_name='Bench', last_name='Mark', display_name='bench', birth_date=date(1990, 1, 1))
+    group = Group.objects.create(name='Big Band', created_by=user)
+    artist = Artist.objects.create(name='Someone')
+    songs = Song.objects.bulk_create([Song(title=f'Song {i}', artist=artist, duration_seconds=timedelta(minutes=4))
+                                      for i in range(songs)])
+    setlist = Setlist.objects.create(title='Tour', owner_group=group)
+    setlist.add_songs(songs[:20])
+    return setlist, [song.pk for song in songs]
+
+
+async def run(setlist, song_ids, sockets, ops):
+    pending = {'count': 0, 'done': None}
+
+    def on_op(socket):
+        pending['count'] -= 1
+        if pending['count'] == 0:
+            pending['done'].set()
+
+    clients = [Socket(setlist.pk, on_op) for _ in range(sockets)]
+    tasks = [client.start() for client in clients]
+    await asyncio.gather(*(client.accepted.wait() for client in clients))
+
+    editor = clients[0]
+    timings = []
+    for i in range(ops):
+        song_id = song_ids[20 + i // 2]
+        op = {'op': 'add', 'song': song_id, 'position': 0} if i % 2 == 0 else {'op': 'remove', 'song': song_id}
+        pending['count'], pending['done'] = sockets, asyncio.Event()
+        start = time.perf_counter()
+        editor.incoming.put_nowait({'type': 'websocket.receive', 'text': json.dumps(op)})
+        await pending['done'].wait()
+        timings.append(time.perf_counter() - start)
+
+    for client in clients:
+        client.incoming.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+    await asyncio.gather(*tasks)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sockets', type=int, default=500)
+    parser.add_argument('--ops', type=int, default=200)
+    args = parser.parse_args()
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, serialize=False)
+    try:
+        setlist, song_ids = seed(20 + args.ops)
+        timings = asyncio.run(run(setlist, song_ids, args.sockets, args.ops))
+        timings.sort()
+        print(f"{args.sockets} sockets, {args.ops} ops\n")
+        print(f"op to every socket   p50 {statistics.median(timings) * 1000:6.2f} ms   "
+              f"p99 {timings[int(len(timings) * 0.99) - 1] * 1000:6.2f} ms   max {timings[-1] * 1000:6.2f} ms")
+        print(f"throughput           {len(timings) / sum(timings):6.0f} ops/s, "
+              f"{len(timings) * args.sockets / sum(timings):8.0f} messages/s")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
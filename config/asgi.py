@@ -2,6 +2,7 @@
 ASGI config for bandshare project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+WebSocket connections go to bandshare.realtime, everything else to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -13,4 +14,12 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from bandshare import realtime  # noqa: E402  (needs the app registry, set up above)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        return await realtime.application(scope, receive, send)
+    return await django_application(scope, receive, send)
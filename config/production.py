@@ -0,0 +1,87 @@
+"""
+Production settings: DJANGO_SETTINGS_MODULE=config.production
+
+Configured from the environment:
+
+    DJANGO_SECRET_KEY         required
+    DJANGO_ALLOWED_HOSTS      comma separated host names
+    POSTGRES_HOST             use PostgreSQL; without it the tuned SQLite
+                              database from settings.py is used
+    POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_PORT
+    POSTGRES_REPLICA_HOSTS    comma separated read replicas, used by
+                              bandshare.routers.ReplicaRouter
+    POSTGRES_POOL_SIZE        most pooled connections per process (default
+                              10); 0 keeps one persistent connection per
+                              thread instead of a pool
+    POSTGRES_PGBOUNCER        set to 1 behind PgBouncer in transaction mode,
+                              which does the pooling itself
+    REDIS_URL                 shared cache for every process (response
+                              cache, query stats) and WebSocket broadcasts
+                              between them; otherwise per process
+
+The pool needs psycopg 3 with psycopg-pool and the cache needs redis
+(requirements-production.txt).
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, MIDDLEWARE
+
+
+def env_list(name):
+    return [value.strip() for value in os.environ.get(name, '').split(',') if value.strip()]
+
+
+DEBUG = False
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS')
+BANDSHARE_QUERY_STATS_ENDPOINT = False
+# Search indexing and feed fan-out run in `manage.py run_workers`.
+BANDSHARE_JOBS_EAGER = False
+
+# Seconds a persistent connection is kept between requests. Checked
+# before reuse, so a connection dropped by the server is replaced rather
+# than failing the next request.
+DATABASE_CONN_MAX_AGE = 600
+
+
+def postgres(host):
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'HOST': host,
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'NAME': os.environ.get('POSTGRES_DB', 'bandshare'),
+        'USER': os.environ.get('POSTGRES_USER', 'bandshare'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    pool_size = int(os.environ.get('POSTGRES_POOL_SIZE', 10))
+    if os.environ.get('POSTGRES_PGBOUNCER'):
+        # Transaction pooling can't keep a server-side cursor open across statements.
+        database['DISABLE_SERVER_SIDE_CURSORS'] = True
+        database['CONN_MAX_AGE'] = DATABASE_CONN_MAX_AGE
+    elif pool_size:
+        # Django's psycopg pool hands a connection to each request and takes
+        # it back at the end; CONN_MAX_AGE must stay 0 with it.
+        database['OPTIONS']['pool'] = {'min_size': min(2, pool_size), 'max_size': pool_size, 'timeout': 10}
+    else:
+        database['CONN_MAX_AGE'] = DATABASE_CONN_MAX_AGE
+    return database
+
+
+if os.environ.get('POSTGRES_HOST'):
+    DATABASES = {'default': postgres(os.environ['POSTGRES_HOST'])}
+    for i, host in enumerate(env_list('POSTGRES_REPLICA_HOSTS'), 1):
+        DATABASES[f'replica{i}'] = {**postgres(host), 'TEST': {'MIRROR': 'default'}}
+else:
+    DATABASES = {'default': {**DATABASES['default'], 'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+                             'CONN_HEALTH_CHECKS': True}}
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                          'LOCATION': os.environ['REDIS_URL']}}
+    BANDSHARE_CHANNEL_LAYER = 'bandshare.realtime.RedisChannelLayer'
+
+DATABASE_ROUTERS = ['bandshare.routers.ReplicaRouter']
+MIDDLEWARE = ['bandshare.routers.PinPrimaryMiddleware', *MIDDLEWARE]
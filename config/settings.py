@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bandshare.instrumentation.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +52,35 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Fraction of requests (0.0 - 1.0) whose SQL queries and latency are recorded
+# by QueryStatsMiddleware. See `manage.py query_stats`.
+BANDSHARE_QUERY_STATS_SAMPLE_RATE = 0.0
+
+# Serve the collected stats as JSON at /bandshare/stats/queries/.
+BANDSHARE_QUERY_STATS_ENDPOINT = DEBUG
+
+# Threads for blocking work in the async views (bandshare.async_views).
+BANDSHARE_BLOCKING_WORKERS = 8
+
+# Groups and musicians with more members or followers than this have their
+# activity merged into feeds at read time instead of copied to each feed.
+BANDSHARE_FEED_FANOUT_LIMIT = 1000
+
+# Seconds a rendered group or setlist page is kept (bandshare.response_cache).
+# Edits invalidate pages right away; this only bounds unused entries.
+BANDSHARE_RESPONSE_CACHE_TIMEOUT = 60 * 60
+
+# Run background jobs (bandshare.jobs) as soon as they are queued, so
+# development needs no `manage.py run_workers`. Production queues them.
+BANDSHARE_JOBS_EAGER = True
+
+# Rendered setlist exports (bandshare.exports), kept until the setlist changes.
+BANDSHARE_EXPORT_CACHE_DIR = BASE_DIR / 'var' / 'exports'
+
+# Broadcasts setlist edits to the WebSockets (bandshare.realtime) of this
+# process only; config.production shares them through Redis.
+BANDSHARE_CHANNEL_LAYER = 'bandshare.realtime.InMemoryChannelLayer'
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -75,10 +105,29 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# SQLite tuned for a single node, also used by config.production when no
+# PostgreSQL server is configured. WAL lets readers run while a write is in
+# progress, and synchronous=NORMAL only syncs at checkpoints, which is safe
+# in WAL mode short of power loss. Writes take the lock when the transaction
+# starts (IMMEDIATE), so concurrent writers wait up to `timeout` seconds
+# instead of failing with "database is locked" halfway through.
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-32000',  # KiB
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+]
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': '; '.join(SQLITE_PRAGMAS),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 